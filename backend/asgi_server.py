@@ -0,0 +1,327 @@
+"""
+ASGI entry point with the same routes as local_server.py. Requests are
+served from one event loop; the synchronous repositories run on a thread
+pool, so a slow disk write or lookup holds only its own request.
+
+    uvicorn --factory asgi_server:create_app --port 5000
+    python asgi_server.py            # built-in HTTP/1.1 server, no extra packages
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from urllib.parse import parse_qs
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from storage import create_repository, slug_key
+from async_layer import ThreadPoolRepository, AsyncLinkBusinessService, AsyncAnalyticsService
+from logic_layer import GeoLocationService
+from ingestion import ClickIngestionPipeline
+from caching import CachingRepository
+from expiry import ExpirySweeper
+from dedup import create_click_deduplicator
+from instrumentation import InstrumentedRepository
+from metrics import REGISTRY
+from slug_allocator import create_slug_allocator
+from pagination import parse_limit
+from redirect_cache import redirect_response
+from response_encoding import encode_json
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS')
+]
+
+class Request:
+    def __init__(self, scope, body: bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+        self.headers = {name.decode().lower(): value.decode() for name, value in scope.get('headers', [])}
+        self.client_ip = (scope.get('client') or ('unknown', 0))[0]
+        self.body = body
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'null')
+        except ValueError:
+            return None
+
+class Response:
+    def __init__(self, body: bytes = b'', status: int = 200, content_type: str = 'application/json',
+                 headers=None, stream=None):
+        self.body = body
+        self.status = status
+        self.headers = [(b'content-type', content_type.encode())] + list(headers or [])
+        self.stream = stream
+
+def json_response(body, status: int = 200) -> Response:
+    return Response(encode_json(body), status)
+
+class LinkPulseApp:
+    def __init__(self, repository=None, click_pipeline=None, start_background=True, deduplicator=None):
+        self.sync_repository = repository if repository is not None else CachingRepository(
+            InstrumentedRepository(create_repository()))
+        self.repository = ThreadPoolRepository(self.sync_repository)
+        self.click_pipeline = click_pipeline
+        self.expiry_sweeper = None
+        if start_background:
+            # Same background workers as the Flask server
+            if self.click_pipeline is None:
+                self.click_pipeline = ClickIngestionPipeline(self.sync_repository, GeoLocationService())
+            self.expiry_sweeper = ExpirySweeper(
+                self.sync_repository,
+                interval_seconds=float(os.environ.get('LINKPULSE_SWEEP_INTERVAL', 60)),
+                policy=os.environ.get('LINKPULSE_EXPIRED_POLICY', 'delete'),
+                archive_path=os.environ.get('LINKPULSE_ARCHIVE_FILE', 'linkpulse_expired.jsonl')
+            )
+        self.deduplicator = deduplicator if deduplicator is not None else create_click_deduplicator()
+        self.link_service = AsyncLinkBusinessService(
+            self.repository, click_pipeline=self.click_pipeline,
+            slug_allocator=create_slug_allocator(self.sync_repository,
+                                                 key_source=slug_key if repository is None else None),
+            deduplicator=self.deduplicator)
+        self.analytics_service = AsyncAnalyticsService(self.repository)
+        self.routes = [
+            ('POST', re.compile(r'^/dev/shorten$'), '/dev/shorten', self.shorten_link),
+            ('POST', re.compile(r'^/dev/shorten/batch$'), '/dev/shorten/batch', self.shorten_links),
+            ('GET', re.compile(r'^/u/(?P<slug>[^/]+)$'), '/u/<slug>', self.redirect_link),
+            ('GET', re.compile(r'^/dev/analytics/(?P<slug>[^/]+)$'), '/dev/analytics/<slug>', self.get_analytics),
+            ('GET', re.compile(r'^/dev/analytics/(?P<slug>[^/]+)/clicks$'), '/dev/analytics/<slug>/clicks',
+             self.get_click_logs),
+            ('POST', re.compile(r'^/dev/stats/batch$'), '/dev/stats/batch', self.get_stats_batch),
+            ('GET', re.compile(r'^/dev/stats/(?P<slug>[^/]+)$'), '/dev/stats/<slug>', self.get_stats),
+            ('GET', re.compile(r'^/dev/metrics$'), '/dev/metrics', self.metrics),
+            ('GET', re.compile(r'^/dev/health$'), '/dev/health', self.health_check)
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        started = time.perf_counter()
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        request = Request(scope, body)
+        response, endpoint = await self._dispatch(request)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status,
+            'headers': response.headers + CORS_HEADERS
+        })
+        if response.stream is None:
+            await send({'type': 'http.response.body', 'body': response.body})
+        else:
+            async for chunk in response.stream:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        REGISTRY.observe('linkpulse_http_request_seconds', time.perf_counter() - started,
+                         endpoint=endpoint, method=request.method, status=str(response.status))
+
+    async def _dispatch(self, request: Request):
+        if request.method == 'OPTIONS':
+            return Response(status=200), 'preflight'
+        path_matched = False
+        for method, pattern, endpoint, handler in self.routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            path_matched = True
+            if method != request.method:
+                continue
+            try:
+                return await handler(request, **match.groupdict()), endpoint
+            except ValueError as e:
+                return json_response({'error': str(e)}, 400), endpoint
+            except Exception:
+                return json_response({'error': 'Internal server error'}, 500), endpoint
+        if path_matched:
+            return json_response({'error': 'Method not allowed'}, 405), 'unmatched'
+        return json_response({'error': 'Not found'}, 404), 'unmatched'
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def start(self) -> None:
+        if self.click_pipeline is not None:
+            self.click_pipeline.start()
+        if self.expiry_sweeper is not None:
+            self.expiry_sweeper.start()
+
+    def stop(self) -> None:
+        if self.expiry_sweeper is not None:
+            self.expiry_sweeper.stop()
+        if self.click_pipeline is not None:
+            self.click_pipeline.stop()
+        self.repository.shutdown()
+        if hasattr(self.sync_repository, 'close'):
+            self.sync_repository.close()
+
+    async def shorten_link(self, request: Request) -> Response:
+        data = request.json()
+        url = data.get('url') if isinstance(data, dict) else None
+        if not url:
+            return json_response({'error': 'URL is required'}, 400)
+        link_data = await self.link_service.create_short_link(url, data.get('ttl_hours', 24),
+                                                              data.get('redirect_cache'),
+                                                              data.get('click_sample_size'))
+        return json_response({
+            'slug': link_data.slug,
+            'short_url': f'http://localhost:5000/u/{link_data.slug}',
+            'original_url': link_data.original_url,
+            'expires_at': link_data.expires_at,
+            'redirect_cache': link_data.redirect_cache,
+            'click_sample_size': link_data.click_sample_size
+        })
+
+    async def shorten_links(self, request: Request) -> Response:
+        data = request.json()
+        links = data.get('links') if isinstance(data, dict) else None
+        if not isinstance(links, list) or not links:
+            return json_response({'error': 'links must be a non-empty array'}, 400)
+
+        default_ttl = data.get('ttl_hours', 24)
+        items = [
+            (link.get('url'), link.get('ttl_hours', default_ttl), link.get('redirect_cache'),
+             link.get('click_sample_size')) if isinstance(link, dict) else (None, None)
+            for link in links
+        ]
+        results = await self.link_service.create_short_links(items)
+        return json_response({
+            'created': sum(1 for result in results if result.link_data),
+            'failed': sum(1 for result in results if result.error),
+            'results': [shorten_result_to_dict(result) for result in results]
+        })
+
+    async def redirect_link(self, request: Request, slug: str) -> Response:
+        user_agent = request.headers.get('user-agent', 'Unknown')
+        link_data = await self.link_service.resolve_redirect(slug, request.client_ip, user_agent)
+        if not link_data:
+            return json_response({'error': 'Link not found or expired'}, 404)
+        status, headers = redirect_response(link_data, request.headers.get('if-none-match'),
+                                            request.headers.get('if-modified-since'))
+        return Response(status=status, content_type='text/html; charset=utf-8',
+                        headers=[(name.lower().encode(), value.encode()) for name, value in headers.items()])
+
+    async def get_analytics(self, request: Request, slug: str) -> Response:
+        summary = await self.analytics_service.get_link_summary(slug)
+        if not summary:
+            return json_response({'error': 'Link not found'}, 404)
+        summary['recent_clicks'] = [click_log_to_dict(log) for log in summary['recent_clicks']]
+        return json_response(summary)
+
+    async def get_click_logs(self, request: Request, slug: str) -> Response:
+        wants_ndjson = (request.query.get('format') == 'ndjson' or
+                        'application/x-ndjson' in request.headers.get('accept', ''))
+        if wants_ndjson:
+            export = await self.link_service.export_clicks(slug)
+            if export is None:
+                return json_response({'error': 'Link not found'}, 404)
+            click_logs, sampled = export
+
+            async def generate():
+                async for log in click_logs:
+                    yield encode_json(click_log_to_dict(log)) + b'\n'
+
+            # Lines are bare clicks, so whether they are only a sample goes in a header
+            return Response(content_type='application/x-ndjson', stream=generate(),
+                            headers=[(b'x-clicks-sampled', b'true' if sampled else b'false')])
+
+        limit = parse_limit(request.query.get('limit'))
+        page = await self.link_service.get_click_page(slug, limit, request.query.get('cursor'))
+        if not page:
+            return json_response({'error': 'Link not found'}, 404)
+        return json_response({
+            'click_logs': [click_log_to_dict(log) for log in page.click_logs],
+            'next_cursor': page.next_cursor,
+            'sampled': page.sampled
+        })
+
+    async def get_stats_batch(self, request: Request) -> Response:
+        data = request.json()
+        slugs = data.get('slugs') if isinstance(data, dict) else None
+        if not isinstance(slugs, list) or not all(isinstance(slug, str) for slug in slugs):
+            return json_response({'error': 'slugs must be an array of strings'}, 400)
+        stats = await self.analytics_service.get_many_stats(slugs)
+        return json_response({
+            'stats': stats,
+            'missing': [slug for slug in dict.fromkeys(slugs) if slug not in stats]
+        })
+
+    async def get_stats(self, request: Request, slug: str) -> Response:
+        stats = await self.analytics_service.get_link_stats(slug)
+        if not stats:
+            return json_response({'error': 'Link not found'}, 404)
+        return json_response(stats)
+
+    async def metrics(self, request: Request) -> Response:
+        return Response(REGISTRY.render_prometheus().encode(), content_type='text/plain; version=0.0.4')
+
+    async def health_check(self, request: Request) -> Response:
+        health = {'status': 'healthy', 'timestamp': int(time.time())}
+        if self.click_pipeline is not None:
+            health['ingestion'] = self.click_pipeline.get_stats()
+        if hasattr(self.sync_repository, 'get_stats'):
+            health['link_cache'] = self.sync_repository.get_stats()
+        if self.expiry_sweeper is not None:
+            health['expiry'] = self.expiry_sweeper.get_stats()
+        if self.deduplicator is not None:
+            health['click_dedup'] = self.deduplicator.get_stats()
+        return json_response(health)
+
+def shorten_result_to_dict(result) -> dict:
+    if result.error:
+        return {'original_url': result.original_url, 'error': result.error}
+    return {
+        'slug': result.link_data.slug,
+        'short_url': f'http://localhost:5000/u/{result.link_data.slug}',
+        'original_url': result.link_data.original_url,
+        'expires_at': result.link_data.expires_at,
+        'redirect_cache': result.link_data.redirect_cache,
+        'click_sample_size': result.link_data.click_sample_size
+    }
+
+def click_log_to_dict(log) -> dict:
+    return {
+        'timestamp': log.timestamp,
+        'ip': log.ip,
+        'user_agent': log.user_agent,
+        'country': log.country
+    }
+
+def create_app() -> LinkPulseApp:
+    return LinkPulseApp()
+
+if __name__ == '__main__':
+    from asgi_http import serve
+
+    port = int(os.environ.get('PORT', 5000))
+    print("LinkPulse ASGI Server Starting...")
+    print(f"API Base: http://0.0.0.0:{port}/dev")
+    try:
+        import uvicorn
+    except ImportError:
+        asyncio.run(serve(create_app(), '0.0.0.0', port))
+    else:
+        uvicorn.run(create_app(), host='0.0.0.0', port=port)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Concurrent redirect throughput of the Flask app (one sync worker, or
+gunicorn with --workers 2 when it is installed) against the ASGI app. Each
+server runs on SQLite with an artificial delay added to every get_link,
+standing in for a slow disk or network store. Redirects pick from a large
+set of slugs so most of them miss the link cache and pay that delay.
+
+    python benchmarks/bench_async_server.py --concurrency 64 --duration 10 --delay-ms 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(BACKEND_DIR, 'src'))
+sys.path.append(BACKEND_DIR)
+
+TARGETS = ('flask', 'gunicorn', 'asgi')
+
+class SlowRepository:
+    def __init__(self, repository, delay: float):
+        self.repository = repository
+        self.delay = delay
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    def get_link(self, slug):
+        time.sleep(self.delay)
+        return self.repository.get_link(slug)
+
+def _install_slow_storage():
+    # Must run before the server module is imported, since both build their repository at import
+    import storage
+    create_repository = storage.create_repository
+    delay = float(os.environ.get('BENCH_DELAY_MS', '0')) / 1000
+    storage.create_repository = lambda: SlowRepository(create_repository(), delay)
+
+def flask_app():
+    _install_slow_storage()
+    import local_server
+    return local_server.app
+
+def asgi_app():
+    _install_slow_storage()
+    import asgi_server
+    return asgi_server.create_app()
+
+def serve(target: str, port: int):
+    if target == 'flask':
+        # Werkzeug without threads handles one request at a time, like one gunicorn sync worker
+        flask_app().run(host='127.0.0.1', port=port, threaded=False)
+        return
+    try:
+        import uvicorn
+    except ImportError:
+        from asgi_http import serve as serve_asgi
+        asyncio.run(serve_asgi(asgi_app(), '127.0.0.1', port))
+    else:
+        uvicorn.run(asgi_app(), host='127.0.0.1', port=port, log_level='warning')
+
+def seed(db_path: str, count: int) -> list:
+    from sqlite_repository import SqliteRepository
+    from models import LinkData
+    slugs = [f'bench{i:06d}' for i in range(count)]
+    repository = SqliteRepository(db_path)
+    repository.save_links([LinkData(slug=slug, original_url='https://drive.google.com/file/d/x/view',
+                                    created_at=int(time.time()), expires_at=None) for slug in slugs])
+    repository.close()
+    return slugs
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(target: str, port: int, env: dict):
+    if target == 'gunicorn':
+        command = ['gunicorn', '--workers', '2', '--bind', f'127.0.0.1:{port}', '--chdir', os.path.dirname(
+            os.path.abspath(__file__)), '--log-level', 'warning', 'bench_async_server:flask_app()']
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', target, '--port', str(port)]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{target} did not start")
+
+async def fetch(port: int, path: str) -> int:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        request = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nUser-Agent: bench\r\nConnection: close\r\n\r\n'
+        writer.write(request.encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+async def load(port: int, slugs: list, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(seed_value: int):
+        nonlocal errors
+        rng = random.Random(seed_value)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status = await fetch(port, f'/u/{rng.choice(slugs)}')
+            except OSError:
+                status = None
+            if status == 302:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'redirects_per_sec': len(latencies) / elapsed,
+        'median_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        'errors': errors
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', default=','.join(TARGETS))
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--delay-ms', type=float, default=20)
+    parser.add_argument('--slugs', type=int, default=50000)
+    parser.add_argument('--serve', choices=('flask', 'asgi'), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    print(f"{args.concurrency} concurrent clients, {args.delay_ms:g} ms store delay, "
+          f"{args.duration:g} s per target")
+    for target in args.targets.split(','):
+        if target == 'gunicorn' and shutil.which('gunicorn') is None:
+            print(f"{target:<10} skipped (not installed)")
+            continue
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'links.db')
+            slugs = seed(db_path, args.slugs)
+            env = dict(os.environ, LINKPULSE_STORAGE='sqlite', LINKPULSE_DB_PATH=db_path,
+                       LINKPULSE_ARCHIVE_FILE=os.path.join(directory, 'expired.jsonl'),
+                       BENCH_DELAY_MS=str(args.delay_ms), PYTHONPATH=BACKEND_DIR)
+            port = free_port()
+            process = start_server(target, port, env)
+            try:
+                result = asyncio.run(load(port, slugs, args.concurrency, args.duration))
+            finally:
+                process.terminate()
+                process.wait()
+        print(f"{target:<10} {result['redirects_per_sec']:>9,.0f} redirects/s   "
+              f"median {result['median_ms']:8.2f} ms   p99 {result['p99_ms']:8.2f} ms   errors {result['errors']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Resident memory per click: the previous list-of-dicts layout versus the
+columnar ClickColumns store, measured with tracemalloc.
+
+    python benchmarks/bench_click_memory.py --sizes 1000000,10000000
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from click_store import ClickColumns, ClickDictionaries
+from models import ClickLog
+
+USER_AGENTS = [f'Mozilla/5.0 (Platform {i}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{100 + i}.0'
+               for i in range(200)]
+COUNTRIES = ['US', 'GB', 'DE', 'FR', 'IN', 'BR', 'JP', 'CA', 'AU', 'NL', 'Unknown', 'Local']
+
+def generate_clicks(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    start = 1700000000
+    for i in range(count):
+        # IPs are a fresh string per click, as they are when they come from request headers;
+        # user agents are shared objects, which flatters the dict layout
+        yield ClickLog(
+            timestamp=start + i // 10,
+            ip=f'{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+            user_agent=rng.choice(USER_AGENTS),
+            country=rng.choice(COUNTRIES)
+        )
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    gc.collect()
+    return after - before
+
+def build_dicts(count: int):
+    clicks = []
+    for log in generate_clicks(count):
+        clicks.append({
+            'timestamp': log.timestamp,
+            'ip': log.ip,
+            'user_agent': log.user_agent,
+            'country': log.country
+        })
+    return clicks
+
+def build_columns(count: int):
+    columns = ClickColumns(ClickDictionaries())
+    columns.extend(generate_clicks(count))
+    return columns
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000000,10000000')
+    parser.add_argument('--baseline-max', type=int, default=1000000,
+                        help='largest size to measure the dict layout at (it needs several GB at 10M)')
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        columns_bytes = measure(lambda: build_columns(size))
+        line = f"{size:>11,} clicks  columns {columns_bytes / size:7.1f} B/click"
+        if size <= args.baseline_max:
+            dict_bytes = measure(lambda: build_dicts(size))
+            line += f"  dicts {dict_bytes / size:7.1f} B/click  ({dict_bytes / columns_bytes:.1f}x smaller)"
+        else:
+            line += "  dicts skipped (raise --baseline-max to measure)"
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare offline range-table lookups with the per-click ipinfo.io HTTP lookup.
+
+    python benchmarks/bench_geo_resolver.py --ranges 300000 --lookups 200000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from geo_resolver import IpRangeTable, OfflineGeoResolver, HttpGeoResolver
+
+COUNTRIES = ['US', 'GB', 'DE', 'FR', 'IN', 'BR', 'JP', 'CA', 'AU', 'NL']
+
+def build_table(range_count: int) -> IpRangeTable:
+    # Evenly sized, disjoint ranges covering the IPv4 space
+    step = (2 ** 32) // range_count
+    return IpRangeTable.from_ranges(
+        (str(i * step), str(i * step + step - 1), COUNTRIES[i % len(COUNTRIES)])
+        for i in range(range_count)
+    )
+
+def random_ips(count: int, rng: random.Random):
+    return [f'{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+            for _ in range(count)]
+
+def measure(resolver, ips) -> float:
+    start = time.perf_counter()
+    for ip in ips:
+        resolver.get_country(ip)
+    elapsed = time.perf_counter() - start
+    return len(ips) / elapsed if elapsed else float('inf')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ranges', type=int, default=300000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    parser.add_argument('--hot-ips', type=int, default=1000)
+    parser.add_argument('--http-samples', type=int, default=5,
+                        help='real ipinfo.io requests to time (0 to skip)')
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    start = time.perf_counter()
+    table = build_table(args.ranges)
+    print(f"Built table with {len(table)} ranges in {time.perf_counter() - start:.2f}s")
+
+    cold_ips = random_ips(args.lookups, rng)
+    hot_pool = random_ips(args.hot_ips, rng)
+    hot_ips = [rng.choice(hot_pool) for _ in range(args.lookups)]
+
+    uncached = OfflineGeoResolver(table, cache_size=0)
+    print(f"offline, uncached:   {measure(uncached, cold_ips):>12,.0f} lookups/s")
+
+    cached = OfflineGeoResolver(table)
+    print(f"offline, hot IPs:    {measure(cached, hot_ips):>12,.0f} lookups/s "
+          f"(hit rate {cached.cache_info().hits / args.lookups:.1%})")
+
+    if args.http_samples:
+        http = HttpGeoResolver()
+        rate = measure(http, cold_ips[:args.http_samples])
+        print(f"ipinfo.io HTTP:      {rate:>12,.2f} lookups/s ({args.http_samples} samples)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Service hot paths (create_short_link, get_redirect_url, get_link_analytics,
+get_link_stats, get_click_trends) against every repository backend, seeded
+with N links and N clicks for each size. Geo lookups are stubbed and
+DynamoDB runs on moto. Results are written as JSON; pass an earlier run to
+--compare to flag operations that got slower.
+
+    python benchmarks/bench_hot_paths.py --sizes 1,1000,100000 --output before.json
+    python benchmarks/bench_hot_paths.py --sizes 1,1000,100000 --output after.json --compare before.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+from data_layer import FileRepository, InMemoryRepository
+from sqlite_repository import SqliteRepository
+from sharded_repository import ShardedFileRepository
+from logic_layer import LinkBusinessService, AnalyticsService, GeoLocationService
+from slug_allocator import create_slug_allocator
+from models import LinkData, ClickLog
+
+BACKENDS = ('memory', 'file', 'sharded', 'sqlite', 'dynamo')
+OPERATIONS = ('create_short_link', 'get_redirect_url', 'get_link_analytics', 'get_link_stats',
+              'get_click_trends')
+# Clicks land on a fixed set of hot links, so clicks per link grow with the size
+HOT_LINKS = 100
+USER_AGENTS = [f'Mozilla/5.0 (Platform {i}) Chrome/{100 + i}.0' for i in range(50)]
+COUNTRIES = ['US', 'GB', 'DE', 'FR', 'IN', 'BR', 'JP', 'CA']
+URL = 'https://drive.google.com/file/d/bench/view'
+
+class StubResolver:
+    def get_country(self, ip: str) -> str:
+        return 'US'
+
+def seed(repository, size: int, rng: random.Random):
+    created_at = int(time.time()) - 86400
+    slugs = [f'seed{i:07d}' for i in range(size)]
+    for start in range(0, size, 10000):
+        repository.save_links([
+            LinkData(slug=slug, original_url=URL, created_at=created_at, expires_at=None)
+            for slug in slugs[start:start + 10000]
+        ])
+    hot = slugs[:HOT_LINKS]
+    per_link = [size // len(hot) + (1 if i < size % len(hot) else 0) for i in range(len(hot))]
+    for slug, count in zip(hot, per_link):
+        for start in range(0, count, 1000):
+            repository.log_clicks(slug, [
+                ClickLog(
+                    timestamp=created_at + rng.randrange(86400),
+                    ip=f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+                    user_agent=rng.choice(USER_AGENTS),
+                    country=rng.choice(COUNTRIES)
+                ) for _ in range(min(1000, count - start))
+            ])
+    return slugs, hot
+
+@contextlib.contextmanager
+def open_backend(backend: str, directory: str):
+    # Yields (repository, reopen); reopen returns the repository the benchmark runs against
+    if backend == 'memory':
+        repository = InMemoryRepository()
+        yield repository, lambda: repository
+    elif backend == 'file':
+        path = os.path.join(directory, 'links.json')
+        # Seeding compacts once at the end instead of every compact_every records
+        repository = FileRepository(path, journaled=True, compact_every=sys.maxsize)
+
+        def reopen():
+            repository.close()
+            return FileRepository(path, journaled=True)
+        yield repository, reopen
+    elif backend == 'sharded':
+        path = os.path.join(directory, 'shards')
+        repository = ShardedFileRepository(path)
+
+        def reopen():
+            repository.close()
+            return ShardedFileRepository(path)
+        yield repository, reopen
+    elif backend == 'sqlite':
+        repository = SqliteRepository(os.path.join(directory, 'links.db'))
+        yield repository, lambda: repository
+    elif backend == 'dynamo':
+        import boto3
+        from moto import mock_aws
+        from repository import DynamoRepository, create_tables
+        with mock_aws():
+            dynamodb = boto3.resource('dynamodb')
+            create_tables(dynamodb, 'bench_links', 'bench_link_clicks')
+            repository = DynamoRepository('bench_links', 'bench_link_clicks', dynamodb=dynamodb)
+            yield repository, lambda: repository
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+def time_operation(call, iterations: int) -> dict:
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        call(i)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'mean_us': round(statistics.mean(samples), 3),
+        'median_us': round(statistics.median(samples), 3),
+        'p95_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'p99_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        'ops_per_sec': round(1e6 / statistics.mean(samples), 1)
+    }
+
+def run_backend(backend: str, size: int, iterations: int, seed_value: int) -> list:
+    rng = random.Random(seed_value)
+    with tempfile.TemporaryDirectory() as directory, open_backend(backend, directory) as (repository, reopen):
+        started = time.perf_counter()
+        slugs, hot = seed(repository, size, rng)
+        seed_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        repository = reopen()
+        open_seconds = time.perf_counter() - started
+
+        allocator = create_slug_allocator(repository, 'block', lambda: b'bench')
+        link_service = LinkBusinessService(repository, geo_service=GeoLocationService(StubResolver()),
+                                           slug_allocator=allocator)
+        analytics_service = AnalyticsService(repository)
+        targets = [rng.choice(slugs) for _ in range(iterations)]
+        hot_targets = [hot[i % len(hot)] for i in range(iterations)]
+        calls = {
+            'create_short_link': lambda i: link_service.create_short_link(URL, 24),
+            'get_redirect_url': lambda i: link_service.get_redirect_url(targets[i], '10.0.0.1', 'bench'),
+            'get_link_analytics': lambda i: link_service.get_link_analytics(hot_targets[i]),
+            'get_link_stats': lambda i: analytics_service.get_link_stats(hot_targets[i]),
+            'get_click_trends': lambda i: analytics_service.get_click_trends(hot_targets[i])
+        }
+        results = []
+        for operation in OPERATIONS:
+            result = {'backend': backend, 'size': size, 'operation': operation,
+                      'seed_seconds': round(seed_seconds, 3), 'open_seconds': round(open_seconds, 3)}
+            result.update(time_operation(calls[operation], iterations))
+            results.append(result)
+        if hasattr(repository, 'close'):
+            repository.close()
+        return results
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(previous: dict, current: dict, threshold: float) -> list:
+    # Median latency ratios; anything slower than threshold counts as a regression
+    baseline = {(r['backend'], r['size'], r['operation']): r for r in previous['results']}
+    regressions = []
+    for result in current['results']:
+        before = baseline.get((result['backend'], result['size'], result['operation']))
+        if before is None or not before['median_us']:
+            continue
+        ratio = result['median_us'] / before['median_us']
+        line = (f"{result['backend']:<8} {result['size']:>9,} {result['operation']:<20} "
+                f"{before['median_us']:>12,.1f} -> {result['median_us']:>12,.1f} us  x{ratio:.2f}")
+        print(line, file=sys.stderr)
+        if ratio > threshold:
+            regressions.append(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--sizes', default='1,100,10000', help='comma-separated, up to 1000000')
+    parser.add_argument('--iterations', type=int, default=200)
+    # moto keeps every item in Python dicts behind an HTTP-shaped stub, so large sizes take a long time
+    parser.add_argument('--dynamo-max-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON result to compare medians against')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    args = parser.parse_args()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'results': []
+    }
+    for backend in args.backends.split(','):
+        for size in [int(size) for size in args.sizes.split(',')]:
+            if backend == 'dynamo' and size > args.dynamo_max_size:
+                print(f"skipping dynamo at {size:,} (--dynamo-max-size)", file=sys.stderr)
+                continue
+            print(f"{backend} {size:,}", file=sys.stderr)
+            # The repositories and services still print debug lines; keep them out of the JSON
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                report['results'].extend(run_backend(backend, size, args.iterations, args.seed))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} operations slower than x{args.threshold}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
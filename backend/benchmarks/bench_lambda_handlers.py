@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Measure handler import time and per-invocation overhead against a stubbed
+DynamoDB (moto), comparing warm container reuse with per-invocation setup.
+
+    python benchmarks/bench_lambda_handlers.py --invocations 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.append(SRC_DIR)
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('TABLE_NAME', 'bench_links')
+os.environ.setdefault('CLICKS_TABLE_NAME', 'bench_link_clicks')
+os.environ.setdefault('GEO_HTTP_FALLBACK', '0')
+# Block slugs, as deployed; the key only has to be secret in production
+os.environ.setdefault('SLUG_KEY', 'bench-slug-key')
+
+def measure_import(module: str, runs: int) -> float:
+    # Fresh interpreter per run so nothing is cached in sys.modules
+    code = (
+        'import sys, time; sys.path.insert(0, %r); '
+        't = time.perf_counter(); import %s; print((time.perf_counter() - t) * 1000)'
+    ) % (SRC_DIR, module)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code], env=os.environ)
+        samples.append(float(output.decode().strip()))
+    return statistics.median(samples)
+
+def redirect_event(slug: str) -> dict:
+    return {
+        'pathParameters': {'slug': slug},
+        'requestContext': {'identity': {'sourceIp': '127.0.0.1'}},
+        'headers': {'User-Agent': 'bench'}
+    }
+
+def time_invocations(handler, event, count: int, reset=None) -> list:
+    samples = []
+    for _ in range(count):
+        if reset:
+            reset()
+        started = time.perf_counter()
+        handler(event, None)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def summarize(label: str, samples: list):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<32} median {statistics.median(samples):8.3f} ms   p99 {p99:8.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--invocations', type=int, default=200)
+    parser.add_argument('--import-runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"import handlers:   {measure_import('handlers', args.import_runs):8.2f} ms (median)")
+    print(f"import boto3:      {measure_import('boto3', args.import_runs):8.2f} ms (median)")
+
+    import logging
+    import boto3
+    from moto import mock_aws
+    import handlers
+    from repository import create_tables
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with mock_aws():
+        create_tables(boto3.resource('dynamodb'), os.environ['TABLE_NAME'], os.environ['CLICKS_TABLE_NAME'])
+        response = handlers.shorten_handler({'body': json.dumps({
+            'url': 'https://drive.google.com/file/d/bench/view'
+        })}, None)
+        slug = json.loads(response['body'])['slug']
+        event = redirect_event(slug)
+
+        def reset():
+            handlers._service = None
+
+        summarize('redirect, new client per call', time_invocations(
+            handlers.redirect_handler, event, args.invocations, reset))
+        summarize('redirect, warm container', time_invocations(
+            handlers.redirect_handler, event, args.invocations))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Response size and serialization/compression time for click-log payloads of
+each size, for every available JSON encoder and content coding (identity,
+gzip, and zstd when zstandard is installed). Clicks reuse a small set of
+user agents and countries, as real traffic does. Levels come from
+LINKPULSE_GZIP_LEVEL and LINKPULSE_ZSTD_LEVEL, as in the servers.
+
+    python benchmarks/bench_response_encoding.py --sizes 10000,100000
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from response_encoding import JSON_ENCODERS, COMPRESSORS
+
+USER_AGENTS = [f'Mozilla/5.0 (Platform {i}) AppleWebKit/537.36 Chrome/{100 + i}.0 Safari/537.36'
+               for i in range(50)]
+COUNTRIES = ['US', 'GB', 'DE', 'FR', 'IN', 'BR', 'JP', 'CA']
+
+def click_payload(size: int, rng: random.Random) -> dict:
+    # Shaped like a /clicks page (or the clicks of a Lambda analytics response)
+    started = 1700000000
+    return {
+        'click_logs': [
+            {
+                'timestamp': started + i * 3,
+                'ip': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+                'user_agent': rng.choice(USER_AGENTS),
+                'country': rng.choice(COUNTRIES)
+            } for i in range(size)
+        ],
+        'next_cursor': None,
+        'sampled': False
+    }
+
+def median_ms(function, runs: int):
+    samples, result = [], None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON to this path')
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(',')):
+        payload = click_payload(size, random.Random(size))
+        baseline = None
+        for encoder, dumps in JSON_ENCODERS.items():
+            encode_ms, body = median_ms(lambda: dumps(payload), args.runs)
+            # Every encoder must produce the same document
+            decoded = json.loads(body)
+            if baseline is None:
+                baseline = decoded
+            assert decoded == baseline, f'{encoder} output differs'
+            codings = [('identity', lambda data: data)] + list(COMPRESSORS.items())
+            for coding, compress in codings:
+                compress_ms, compressed = median_ms(lambda: compress(body), args.runs)
+                if coding == 'gzip':
+                    assert gzip.decompress(compressed) == body
+                results.append({
+                    'clicks': size,
+                    'encoder': encoder,
+                    'coding': coding,
+                    'bytes': len(compressed),
+                    'encode_ms': round(encode_ms, 3),
+                    'compress_ms': round(compress_ms, 3)
+                })
+
+    print(f"{'clicks':>8} {'encoder':<8} {'coding':<9} {'bytes':>12} {'ratio':>7} {'encode ms':>10} "
+          f"{'compress ms':>12} {'total ms':>9}")
+    for result in results:
+        identity = next(r['bytes'] for r in results
+                        if r['clicks'] == result['clicks'] and r['encoder'] == result['encoder']
+                        and r['coding'] == 'identity')
+        print(f"{result['clicks']:>8} {result['encoder']:<8} {result['coding']:<9} {result['bytes']:>12} "
+              f"{identity / result['bytes']:>6.1f}x {result['encode_ms']:>10.3f} {result['compress_ms']:>12.3f} "
+              f"{result['encode_ms'] + result['compress_ms']:>9.3f}")
+    if 'zstd' not in COMPRESSORS:
+        print('zstandard is not installed; zstd was skipped')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+FileRepository startup cost for the JSON snapshot versus the binary one:
+time to open, to serve the first redirect lookup, and to answer the first
+analytics query, plus the snapshot sizes. Each open runs in a fresh
+process so nothing is shared through the interpreter.
+
+    python benchmarks/bench_snapshot_startup.py --links 100000 --clicks 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.append(SRC_DIR)
+
+from data_layer import FileRepository
+from models import LinkData, ClickLog
+
+PROBE = """
+import json, sys, time
+sys.path.append({src!r})
+started = time.perf_counter()
+from data_layer import FileRepository
+repository = FileRepository({path!r})
+opened = time.perf_counter()
+repository.get_link({slug!r})
+redirected = time.perf_counter()
+repository.get_analytics({slug!r}).click_logs[-1]
+analysed = time.perf_counter()
+print(json.dumps({{'open_ms': (opened - started) * 1000, 'first_redirect_ms': (redirected - opened) * 1000,
+                  'first_analytics_ms': (analysed - redirected) * 1000}}))
+"""
+
+def seed(path: str, links: int, clicks: int) -> list:
+    rng = random.Random(7)
+    # Journaled and never compacted along the way, so the snapshot is written once at the end
+    repository = FileRepository(path, journaled=True, compact_every=clicks + 2, fsync_every=clicks + 2)
+    slugs = [f'bench{i:07d}' for i in range(links)]
+    repository.save_links([LinkData(slug=slug, original_url='https://drive.google.com/file/d/x/view',
+                                    created_at=1700000000, expires_at=None) for slug in slugs])
+    for i in range(clicks):
+        repository.log_click(slugs[rng.randrange(min(links, 1000))], ClickLog(
+            timestamp=1700000000 + i,
+            ip=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+            user_agent=f'Agent {rng.randint(0, 50)}',
+            country=rng.choice(['US', 'GB', 'DE', 'FR', 'IN'])
+        ))
+    repository.close()
+    return slugs
+
+def probe(path: str, slug: str, runs: int) -> dict:
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(src=SRC_DIR, path=path, slug=slug)],
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: min(result[key] for result in results) for key in results[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--links', type=int, default=100000)
+    parser.add_argument('--clicks', type=int, default=200000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, 'links.json')
+        binary_path = os.path.join(directory, 'links.bin')
+        started = time.perf_counter()
+        slugs = seed(json_path, args.links, args.clicks)
+        FileRepository(json_path).export_snapshot(binary_path, 'binary')
+        print(f"{args.links:,} links, {args.clicks:,} clicks (seeded in {time.perf_counter() - started:.1f} s)")
+
+        # The busiest link, so the analytics column is the largest one to decode
+        slug = slugs[0]
+        for name, path in (('json', json_path), ('binary', binary_path)):
+            result = probe(path, slug, args.runs)
+            print(f"{name:<7} {os.path.getsize(path) / 1e6:8.1f} MB   open {result['open_ms']:9.1f} ms   "
+                  f"first redirect {result['first_redirect_ms']:7.3f} ms   "
+                  f"first analytics {result['first_analytics_ms']:7.3f} ms")
+
+if __name__ == '__main__':
+    main()
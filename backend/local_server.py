@@ -1,21 +1,64 @@
-from flask import Flask, request, jsonify, redirect
+from flask import Flask, Response, g, request, jsonify, redirect, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import sys
 import os
 import time
+import atexit
 
 # Add src directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from data_layer import FileRepository, InMemoryRepository
-from logic_layer import LinkBusinessService, AnalyticsService
+from storage import create_repository, slug_key
+from logic_layer import LinkBusinessService, AnalyticsService, GeoLocationService
+from ingestion import ClickIngestionPipeline
+from caching import CachingRepository
+from expiry import ExpirySweeper
+from dedup import create_click_deduplicator
+from instrumentation import InstrumentedRepository
+from metrics import REGISTRY
+from slug_allocator import create_slug_allocator
+from pagination import parse_limit
+from redirect_cache import redirect_response
+from response_encoding import encode_json, compress_body
+
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify goes through the configured encoder (orjson when installed) straight to bytes
+    def dumps(self, obj, **kwargs):
+        return encode_json(obj).decode()
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(encode_json(self._prepare_response_obj(args, kwargs)),
+                                         mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Initialize services with dependency injection
-repository = FileRepository('linkpulse_data.json')  # Use InMemoryRepository() for testing
-link_service = LinkBusinessService(repository)
+repository = CachingRepository(InstrumentedRepository(create_repository()))
+
+# Clicks are enriched and persisted off the redirect path
+click_pipeline = ClickIngestionPipeline(repository, GeoLocationService())
+click_pipeline.start()
+atexit.register(click_pipeline.stop)
+
+# Expired links are removed (or archived, then removed) like DynamoDB TTL does in AWS
+expiry_sweeper = ExpirySweeper(
+    repository,
+    interval_seconds=float(os.environ.get('LINKPULSE_SWEEP_INTERVAL', 60)),
+    policy=os.environ.get('LINKPULSE_EXPIRED_POLICY', 'delete'),
+    archive_path=os.environ.get('LINKPULSE_ARCHIVE_FILE', 'linkpulse_expired.jsonl')
+)
+expiry_sweeper.start()
+atexit.register(expiry_sweeper.stop)
+
+# Optional window in which repeat clicks (same slug, ip and user agent) are counted but not stored
+deduplicator = create_click_deduplicator()
+
+link_service = LinkBusinessService(repository, click_pipeline=click_pipeline,
+                                   slug_allocator=create_slug_allocator(repository, key_source=slug_key),
+                                   deduplicator=deduplicator)
 analytics_service = AnalyticsService(repository)
 
 @app.route('/dev/shorten', methods=['POST'])
@@ -29,13 +72,16 @@ def shorten_link():
             return jsonify({'error': 'URL is required'}), 400
         
         # Use business service
-        link_data = link_service.create_short_link(url, ttl_hours)
+        link_data = link_service.create_short_link(url, ttl_hours, data.get('redirect_cache'),
+                                                   data.get('click_sample_size'))
         
         return jsonify({
             'slug': link_data.slug,
             'short_url': f'http://localhost:5000/u/{link_data.slug}',
             'original_url': link_data.original_url,
-            'expires_at': link_data.expires_at
+            'expires_at': link_data.expires_at,
+            'redirect_cache': link_data.redirect_cache,
+            'click_sample_size': link_data.click_sample_size
         })
         
     except ValueError as e:
@@ -43,6 +89,45 @@ def shorten_link():
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/dev/shorten/batch', methods=['POST'])
+def shorten_links():
+    try:
+        data = request.get_json()
+        links = data.get('links') if isinstance(data, dict) else None
+        if not isinstance(links, list) or not links:
+            return jsonify({'error': 'links must be a non-empty array'}), 400
+        
+        default_ttl = data.get('ttl_hours', 24)
+        items = [
+            (link.get('url'), link.get('ttl_hours', default_ttl), link.get('redirect_cache'),
+             link.get('click_sample_size')) if isinstance(link, dict) else (None, None)
+            for link in links
+        ]
+        results = link_service.create_short_links(items)
+        
+        return jsonify({
+            'created': sum(1 for result in results if result.link_data),
+            'failed': sum(1 for result in results if result.error),
+            'results': [shorten_result_to_dict(result) for result in results]
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+def shorten_result_to_dict(result):
+    if result.error:
+        return {'original_url': result.original_url, 'error': result.error}
+    return {
+        'slug': result.link_data.slug,
+        'short_url': f'http://localhost:5000/u/{result.link_data.slug}',
+        'original_url': result.link_data.original_url,
+        'expires_at': result.link_data.expires_at,
+        'redirect_cache': result.link_data.redirect_cache,
+        'click_sample_size': result.link_data.click_sample_size
+    }
+
 @app.route('/u/<slug>')
 def redirect_link(slug):
     try:
@@ -50,39 +135,98 @@ def redirect_link(slug):
         user_agent = request.headers.get('User-Agent', 'Unknown')
         
         # Use business service
-        redirect_url = link_service.get_redirect_url(slug, ip, user_agent)
+        link_data = link_service.resolve_redirect(slug, ip, user_agent)
         
-        if not redirect_url:
+        if not link_data:
             return jsonify({'error': 'Link not found or expired'}), 404
         
-        return redirect(redirect_url)
+        # Links that opt in get a cacheable redirect, and 304 when a cached one is revalidated
+        status, headers = redirect_response(link_data, request.headers.get('If-None-Match'),
+                                            request.headers.get('If-Modified-Since'))
+        if status == 304:
+            return Response(status=304, headers=headers)
+        response = redirect(link_data.original_url, code=status)
+        response.headers.update(headers)
+        return response
         
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
+def click_log_to_dict(log):
+    return {
+        'timestamp': log.timestamp,
+        'ip': log.ip,
+        'user_agent': log.user_agent,
+        'country': log.country
+    }
+
 @app.route('/dev/analytics/<slug>')
 def get_analytics(slug):
     try:
-        # Use business service
-        analytics = link_service.get_link_analytics(slug)
+        # Summary numbers only; the click history is paged via /clicks
+        summary = analytics_service.get_link_summary(slug)
+        
+        if not summary:
+            return jsonify({'error': 'Link not found'}), 404
         
-        if not analytics:
+        summary['recent_clicks'] = [click_log_to_dict(log) for log in summary['recent_clicks']]
+        return jsonify(summary)
+        
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/dev/analytics/<slug>/clicks')
+def get_click_logs(slug):
+    try:
+        wants_ndjson = (request.args.get('format') == 'ndjson' or
+                        'application/x-ndjson' in request.headers.get('Accept', ''))
+        if wants_ndjson:
+            export = link_service.export_clicks(slug)
+            if export is None:
+                return jsonify({'error': 'Link not found'}), 404
+            click_logs, sampled = export
+            
+            def generate():
+                for log in click_logs:
+                    yield encode_json(click_log_to_dict(log)) + b'\n'
+            
+            # Lines are bare clicks, so whether they are only a sample goes in a header
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                            headers={'X-Clicks-Sampled': 'true' if sampled else 'false'})
+        
+        limit = parse_limit(request.args.get('limit'))
+        page = link_service.get_click_page(slug, limit, request.args.get('cursor'))
+        
+        if not page:
             return jsonify({'error': 'Link not found'}), 404
         
         return jsonify({
-            'total_clicks': analytics.total_clicks,
-            'first_click': analytics.first_click,
-            'last_click': analytics.last_click,
-            'click_logs': [
-                {
-                    'timestamp': log.timestamp,
-                    'ip': log.ip,
-                    'user_agent': log.user_agent,
-                    'country': log.country
-                } for log in analytics.click_logs
-            ]
+            'click_logs': [click_log_to_dict(log) for log in page.click_logs],
+            'next_cursor': page.next_cursor,
+            # The link keeps a bounded sample of its clicks and has outgrown it
+            'sampled': page.sampled
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/dev/stats/batch', methods=['POST'])
+def get_stats_batch():
+    try:
+        data = request.get_json()
+        slugs = data.get('slugs') if isinstance(data, dict) else None
+        if not isinstance(slugs, list) or not all(isinstance(slug, str) for slug in slugs):
+            return jsonify({'error': 'slugs must be an array of strings'}), 400
+        
+        stats = analytics_service.get_many_stats(slugs)
+        return jsonify({
+            'stats': stats,
+            'missing': [slug for slug in dict.fromkeys(slugs) if slug not in stats]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -96,9 +240,48 @@ def get_stats(slug):
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The route pattern, not the path, so slugs don't become label values
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REGISTRY.observe('linkpulse_http_request_seconds', time.perf_counter() - started,
+                         endpoint=endpoint, method=request.method, status=str(response.status_code))
+    return response
+
+# Registered after the latency hook so it runs first and its time is included in the recorded latency
+@app.after_request
+def compress_response(response):
+    if response.mimetype != 'application/json' or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    body, coding = compress_body(response.get_data(), request.headers.get('Accept-Encoding'))
+    if coding is not None:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = coding
+    return response
+
+@app.route('/dev/metrics')
+def metrics():
+    return Response(REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/dev/health')
 def health_check():
-    return jsonify({'status': 'healthy', 'timestamp': int(time.time())})
+    health = {
+        'status': 'healthy',
+        'timestamp': int(time.time()),
+        'ingestion': click_pipeline.get_stats(),
+        'link_cache': repository.get_stats(),
+        'expiry': expiry_sweeper.get_stats()
+    }
+    if deduplicator is not None:
+        health['click_dedup'] = deduplicator.get_stats()
+    return jsonify(health)
 
 if __name__ == '__main__':
     print("LinkPulse Backend Server Starting...")
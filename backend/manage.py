@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+LinkPulse maintenance commands
+Run `python manage.py --help` for the list of commands
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+def migrate_dynamo_clicks(args):
+    """Move click_logs embedded in link items into the clicks table"""
+    from repository import DynamoRepository
+    repository = DynamoRepository(args.table, args.clicks_table)
+    migrated = repository.migrate_click_logs()
+    print(f"Migrated {migrated} click events")
+
+def rebuild_rollups(args):
+    """Regenerate per-link click rollups from the raw click data"""
+    if args.backend == 'dynamo':
+        from repository import DynamoRepository
+        repository = DynamoRepository(args.table, args.clicks_table)
+        rebuilt = repository.rebuild_rollups()
+    else:
+        from data_layer import FileRepository
+        repository = FileRepository(args.data_file, journaled=True)
+        rebuilt = repository.rebuild_rollups()
+        repository.close()
+    print(f"Rebuilt rollups for {rebuilt} links")
+
+def convert_snapshot(args):
+    """Rewrite a file backend snapshot (plus its journal) as JSON or binary"""
+    from data_layer import FileRepository
+    repository = FileRepository(args.data_file, journaled=True)
+    repository.export_snapshot(args.output, args.format)
+    links = len(repository.links)
+    repository.close()
+    print(f"Wrote {links} links to {args.output} ({args.format})")
+
+def add_dynamo_arguments(parser):
+    parser.add_argument('--table', default=os.environ.get('TABLE_NAME', 'drive_links'))
+    parser.add_argument('--clicks-table', default=os.environ.get('CLICKS_TABLE_NAME', 'drive_link_clicks'))
+
+def main():
+    parser = argparse.ArgumentParser(description='LinkPulse maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate = commands.add_parser('migrate-dynamo-clicks', help=migrate_dynamo_clicks.__doc__)
+    add_dynamo_arguments(migrate)
+    migrate.set_defaults(handler=migrate_dynamo_clicks)
+
+    rebuild = commands.add_parser('rebuild-rollups', help=rebuild_rollups.__doc__)
+    rebuild.add_argument('--backend', choices=['file', 'dynamo'], default='file')
+    rebuild.add_argument('--data-file', default='linkpulse_data.json')
+    add_dynamo_arguments(rebuild)
+    rebuild.set_defaults(handler=rebuild_rollups)
+
+    convert = commands.add_parser('convert-snapshot', help=convert_snapshot.__doc__)
+    convert.add_argument('--data-file', default='linkpulse_data.json')
+    convert.add_argument('--output', required=True)
+    convert.add_argument('--format', choices=['binary', 'json'], default='binary')
+    convert.set_defaults(handler=convert_snapshot)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import asyncio
+from http import HTTPStatus
+from urllib.parse import unquote
+
+MAX_HEADER_BYTES = 65536
+
+async def serve(app, host: str = '127.0.0.1', port: int = 5000, ready=None) -> None:
+    # Minimal HTTP/1.1 front end for an ASGI app: keep-alive, Content-Length
+    # request bodies, chunked streaming responses. Enough for local runs and
+    # benchmarks where uvicorn isn't installed.
+    lifespan = _Lifespan(app)
+    await lifespan.startup()
+    server = await asyncio.start_server(lambda r, w: _handle_connection(app, r, w), host, port,
+                                        limit=MAX_HEADER_BYTES, backlog=1024)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await lifespan.shutdown()
+
+class _Lifespan:
+    def __init__(self, app):
+        self.app = app
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.task = None
+
+    async def startup(self):
+        self.task = asyncio.create_task(self.app({'type': 'lifespan'}, self.inbox.get, self.outbox.put))
+        await self.inbox.put({'type': 'lifespan.startup'})
+        await self.outbox.get()
+
+    async def shutdown(self):
+        await self.inbox.put({'type': 'lifespan.shutdown'})
+        await self.outbox.get()
+        await self.task
+
+async def _handle_connection(app, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    client = writer.get_extra_info('peername') or ('unknown', 0)
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                return
+            request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+            method, target, version = request_line.split(' ', 2)
+            headers = []
+            for line in header_lines:
+                name, _, value = line.partition(':')
+                headers.append((name.strip().lower().encode('latin-1'), value.strip().encode('latin-1')))
+            header_map = dict(headers)
+            length = int(header_map.get(b'content-length', b'0'))
+            body = await reader.readexactly(length) if length else b''
+            keep_alive = version == 'HTTP/1.1' and header_map.get(b'connection', b'').lower() != b'close'
+
+            path, _, query = target.partition('?')
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': version[5:],
+                'method': method,
+                'path': unquote(path),
+                'raw_path': path.encode('latin-1'),
+                'query_string': query.encode('latin-1'),
+                'headers': headers,
+                'client': client[:2],
+                'server': writer.get_extra_info('sockname')[:2]
+            }
+            await app(scope, _receiver(body), _Sender(writer, keep_alive).send)
+            if not keep_alive:
+                return
+    finally:
+        writer.close()
+
+def _receiver(body: bytes):
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {'type': 'http.disconnect'}
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return receive
+
+class _Sender:
+    def __init__(self, writer: asyncio.StreamWriter, keep_alive: bool):
+        self.writer = writer
+        self.keep_alive = keep_alive
+        self.start = None
+        self.chunked = False
+
+    async def send(self, message: dict) -> None:
+        if message['type'] == 'http.response.start':
+            self.start = message
+            return
+        body = message.get('body', b'')
+        more = message.get('more_body', False)
+        if self.start is not None:
+            # Single-message bodies get a Content-Length, streamed ones are chunked
+            self.chunked = more
+            self.writer.write(self._head(None if more else len(body)))
+            self.start = None
+        if self.chunked:
+            if body:
+                self.writer.write(b'%x\r\n%s\r\n' % (len(body), body))
+            if not more:
+                self.writer.write(b'0\r\n\r\n')
+        else:
+            self.writer.write(body)
+        await self.writer.drain()
+
+    def _head(self, length) -> bytes:
+        status = self.start['status']
+        lines = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}'.encode()]
+        lines += [name + b': ' + value for name, value in self.start.get('headers', [])]
+        if length is None:
+            lines.append(b'transfer-encoding: chunked')
+        elif status not in (204, 304):
+            # Those two never carry a body, and a length on a 304 would describe the cached one
+            lines.append(b'content-length: %d' % length)
+        lines.append(b'connection: keep-alive' if self.keep_alive else b'connection: close')
+        return b'\r\n'.join(lines) + b'\r\n\r\n'
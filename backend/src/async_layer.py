@@ -0,0 +1,244 @@
+import asyncio
+import functools
+import json
+import ssl
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from models import LinkData, ClickLog, Analytics, ClickPage, LinkSummary, ShortenResult
+from rollups import LinkRollup
+from logic_layer import UrlValidationService, LinkExpirationService, AnalyticsService, GeoLocationService
+from link_rules import BatchItem, ShortLinkRules
+from geo_resolver import LOCAL_ADDRESSES
+from slug_allocator import RandomSlugAllocator
+from pagination import DEFAULT_PAGE_SIZE
+from metrics import REGISTRY
+
+class AsyncLinkRepository(ABC):
+    # Awaitable counterpart of LinkRepository for the ASGI server
+    @abstractmethod
+    async def save_link(self, link_data: LinkData, overwrite: bool = True) -> None:
+        pass
+
+    @abstractmethod
+    async def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        pass
+
+    @abstractmethod
+    async def get_link(self, slug: str) -> Optional[LinkData]:
+        pass
+
+    @abstractmethod
+    async def log_clicks(self, slug: str, click_logs: List[ClickLog]) -> None:
+        pass
+
+    async def log_click(self, slug: str, click_log: ClickLog) -> None:
+        await self.log_clicks(slug, [click_log])
+
+    @abstractmethod
+    async def get_analytics(self, slug: str) -> Optional[Analytics]:
+        pass
+
+    @abstractmethod
+    async def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        pass
+
+    @abstractmethod
+    async def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        pass
+
+    @abstractmethod
+    async def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                             cursor: Optional[str] = None) -> Optional[ClickPage]:
+        pass
+
+    @abstractmethod
+    def iter_clicks(self, slug: str) -> AsyncIterator[ClickLog]:
+        pass
+
+class ThreadPoolRepository(AsyncLinkRepository):
+    # Runs a synchronous repository (file, SQLite, DynamoDB) on a thread pool so
+    # slow disk or network calls never block the event loop. SqliteRepository
+    # keeps one connection per pool thread.
+    def __init__(self, repository, executor: Optional[ThreadPoolExecutor] = None, max_workers: int = 32,
+                 chunk_size: int = 500):
+        self.repository = repository
+        self.executor = executor if executor is not None else ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='repository')
+        self.chunk_size = chunk_size
+
+    async def run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def save_link(self, link_data: LinkData, overwrite: bool = True) -> None:
+        await self.run(self.repository.save_link, link_data, overwrite=overwrite)
+
+    async def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        return await self.run(self.repository.save_links, link_datas, overwrite)
+
+    async def get_link(self, slug: str) -> Optional[LinkData]:
+        return await self.run(self.repository.get_link, slug)
+
+    async def log_clicks(self, slug: str, click_logs: List[ClickLog]) -> None:
+        await self.run(self.repository.log_clicks, slug, click_logs)
+
+    async def get_analytics(self, slug: str) -> Optional[Analytics]:
+        return await self.run(self.repository.get_analytics, slug)
+
+    async def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        return await self.run(self.repository.get_rollup, slug)
+
+    async def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        return await self.run(self.repository.get_many, slugs)
+
+    async def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                             cursor: Optional[str] = None) -> Optional[ClickPage]:
+        return await self.run(self.repository.get_click_page, slug, limit, cursor)
+
+    async def iter_clicks(self, slug: str) -> AsyncIterator[ClickLog]:
+        # The sync iterator is advanced a chunk at a time on the pool
+        iterator = iter(await self.run(self.repository.iter_clicks, slug))
+        while True:
+            chunk = await self.run(_take, iterator, self.chunk_size)
+            for click_log in chunk:
+                yield click_log
+            if len(chunk) < self.chunk_size:
+                return
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+class AsyncHttpGeoResolver:
+    # ipinfo.io over asyncio streams, so a slow lookup only holds its own request
+    def __init__(self, host: str = 'ipinfo.io', timeout: float = 2, cache_size: int = 65536):
+        self.host = host
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._ssl = ssl.create_default_context()
+
+    async def get_country(self, ip: str) -> str:
+        if ip in self._cache:
+            self._cache.move_to_end(ip)
+            return self._cache[ip]
+        try:
+            country = await asyncio.wait_for(self._fetch(ip), self.timeout)
+        except Exception:
+            return 'Unknown'
+        self._cache[ip] = country
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return country
+
+    async def _fetch(self, ip: str) -> str:
+        reader, writer = await asyncio.open_connection(self.host, 443, ssl=self._ssl)
+        try:
+            # HTTP/1.0 keeps the response unchunked and closes when done
+            request = f'GET /{ip}/json HTTP/1.0\r\nHost: {self.host}\r\nAccept: application/json\r\n\r\n'
+            writer.write(request.encode())
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        if head.split(b' ', 2)[1:2] != [b'200']:
+            return 'Unknown'
+        return json.loads(body).get('country', 'Unknown')
+
+class AsyncGeoLocationService:
+    # The offline table is an in-memory lookup and stays synchronous; only
+    # addresses it doesn't know go out over the network, asynchronously
+    def __init__(self, geo_service: Optional[GeoLocationService] = None, http_fallback=None):
+        self.geo_service = geo_service if geo_service is not None else GeoLocationService()
+        table = getattr(self.geo_service.resolver, 'table', None)
+        has_fallback = getattr(self.geo_service.resolver, 'fallback', None) is not None
+        if http_fallback is None and has_fallback and table is not None:
+            http_fallback = AsyncHttpGeoResolver()
+        self.table = table if http_fallback is not None else None
+        self.http_fallback = http_fallback
+
+    async def get_country(self, ip: str) -> str:
+        if self.table is None:
+            return self.geo_service.get_country(ip)
+        if ip in LOCAL_ADDRESSES:
+            return 'Local'
+        try:
+            country = self.table.lookup(ip)
+        except ValueError:
+            return 'Unknown'
+        return country or await self.http_fallback.get_country(ip)
+
+class AsyncLinkBusinessService(ShortLinkRules):
+    def __init__(self, repository: AsyncLinkRepository, click_pipeline=None, geo_service=None,
+                 slug_allocator=None, metrics=None, deduplicator=None):
+        self.repository = repository
+        self.click_pipeline = click_pipeline
+        self.deduplicator = deduplicator
+        self.slug_allocator = slug_allocator if slug_allocator is not None else RandomSlugAllocator()
+        self.geo_service = geo_service if geo_service is not None else AsyncGeoLocationService()
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.url_validator = UrlValidationService()
+        self.expiration_service = LinkExpirationService()
+
+    async def create_short_link(self, original_url: str, ttl_hours: int = 24,
+                                redirect_cache: Optional[str] = None,
+                                click_sample_size: Optional[int] = None) -> LinkData:
+        return await self._run_async(self._create_link_flow(original_url, ttl_hours, redirect_cache,
+                                                            click_sample_size))
+
+    async def create_short_links(self, items: List[BatchItem]) -> List[ShortenResult]:
+        return await self._run_async(self._create_links_flow(items))
+
+    async def get_redirect_url(self, slug: str, ip: str, user_agent: str) -> Optional[str]:
+        link_data = await self.resolve_redirect(slug, ip, user_agent)
+        return link_data.original_url if link_data else None
+
+    async def resolve_redirect(self, slug: str, ip: str, user_agent: str) -> Optional[LinkData]:
+        return await self._run_async(self._redirect_flow(slug, ip, user_agent))
+
+    async def get_link_analytics(self, slug: str) -> Optional[Analytics]:
+        return await self.repository.get_analytics(slug)
+
+    async def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                             cursor: Optional[str] = None) -> Optional[ClickPage]:
+        return await self.repository.get_click_page(slug, limit, cursor)
+
+    async def export_clicks(self, slug: str) -> Optional[Tuple[AsyncIterator[ClickLog], bool]]:
+        page = await self.repository.get_click_page(slug, 1)
+        if page is None:
+            return None
+        return self.repository.iter_clicks(slug), page.sampled
+
+    async def _next_slugs(self, count: int) -> List[str]:
+        # Refilling a reserved id block is a repository write, so it goes to the pool too
+        if self.slug_allocator.unique and isinstance(self.repository, ThreadPoolRepository):
+            return await self.repository.run(lambda: [self.slug_allocator.next_slug() for _ in range(count)])
+        return [self.slug_allocator.next_slug() for _ in range(count)]
+
+class AsyncAnalyticsService:
+    # Stats are a rollup read plus some arithmetic; the sync service does both on the pool
+    def __init__(self, repository: ThreadPoolRepository):
+        self.repository = repository
+        self.analytics_service = AnalyticsService(repository.repository)
+
+    async def get_link_summary(self, slug: str) -> Optional[dict]:
+        return await self.repository.run(self.analytics_service.get_link_summary, slug)
+
+    async def get_link_stats(self, slug: str) -> Optional[dict]:
+        return await self.repository.run(self.analytics_service.get_link_stats, slug)
+
+    async def get_many_stats(self, slugs: List[str]) -> Dict[str, dict]:
+        return await self.repository.run(self.analytics_service.get_many_stats, slugs)
+
+    async def get_click_trends(self, slug: str) -> Optional[dict]:
+        return await self.repository.run(self.analytics_service.get_click_trends, slug)
+
+def _take(iterator, count: int) -> list:
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) >= count:
+            break
+    return chunk
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+from models import LinkData, ClickLog, Analytics, ClickPage, LinkSummary
+from data_layer import LinkRepository
+from rollups import LinkRollup
+from pagination import DEFAULT_PAGE_SIZE
+
+class CachingRepository(LinkRepository):
+    # Read-through LRU cache for get_link in front of any repository. Entries
+    # never outlive the link's expires_at, and misses are cached briefly so
+    # scans of random slugs don't reach the backend.
+    def __init__(self, repository, max_entries: int = 10000, ttl_seconds: float = 60,
+                 negative_ttl_seconds: float = 5, clock=time.time):
+        self.repository = repository
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._clock = clock
+        self._entries: 'OrderedDict[str, Tuple[Optional[LinkData], float]]' = OrderedDict()
+        # slug -> [generation, fetches] for slugs being read from the backend; invalidate bumps
+        # the generation so a fetch that started before it doesn't cache what it read
+        self._in_flight: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def __getattr__(self, name):
+        # Anything not cached (close, compact, backend-specific helpers) goes straight through
+        return getattr(self.repository, name)
+
+    def save_link(self, link_data: LinkData, *args, **kwargs) -> None:
+        self.repository.save_link(link_data, *args, **kwargs)
+        self.invalidate(link_data.slug)
+
+    def get_link(self, slug: str) -> Optional[LinkData]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(slug)
+            if entry is not None:
+                link_data, deadline = entry
+                if now < deadline:
+                    self._entries.move_to_end(slug)
+                    self._stats['hits' if link_data is not None else 'negative_hits'] += 1
+                    return link_data
+                del self._entries[slug]
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            flight = self._in_flight.setdefault(slug, [0, 0])
+            flight[1] += 1
+            generation = flight[0]
+
+        try:
+            link_data = self.repository.get_link(slug)
+        except Exception:
+            with self._lock:
+                self._finish_fetch(slug, generation)
+            raise
+        self._store(slug, link_data, now, generation)
+        return link_data
+
+    def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        conflicts = self.repository.save_links(link_datas, overwrite)
+        for link_data in link_datas:
+            self.invalidate(link_data.slug)
+        return conflicts
+
+    def log_click(self, slug: str, click_log: ClickLog) -> None:
+        self.repository.log_click(slug, click_log)
+
+    def log_clicks(self, slug: str, click_logs: List[ClickLog]) -> None:
+        self.repository.log_clicks(slug, click_logs)
+
+    def get_analytics(self, slug: str) -> Optional[Analytics]:
+        return self.repository.get_analytics(slug)
+
+    def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        return self.repository.get_rollup(slug)
+
+    def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        # Click totals change on every redirect, so summaries are never cached
+        return self.repository.get_many(slugs)
+
+    def iter_clicks(self, slug: str) -> Iterator[ClickLog]:
+        return self.repository.iter_clicks(slug)
+
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        return self.repository.get_click_page(slug, limit, cursor)
+
+    def allocate_id_block(self, size: int) -> int:
+        return self.repository.allocate_id_block(size)
+
+    def expired_slugs(self, now: int, limit: int) -> List[str]:
+        return self.repository.expired_slugs(now, limit)
+
+    def delete_links(self, slugs: List[str], expired_before: Optional[int] = None) -> int:
+        deleted = self.repository.delete_links(slugs, expired_before)
+        for slug in slugs:
+            self.invalidate(slug)
+        return deleted
+
+    def invalidate(self, slug: str) -> None:
+        with self._lock:
+            self._entries.pop(slug, None)
+            flight = self._in_flight.get(slug)
+            if flight is not None:
+                flight[0] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _finish_fetch(self, slug: str, generation: int) -> bool:
+        # Caller holds the lock; returns whether nothing invalidated the slug during the fetch
+        flight = self._in_flight[slug]
+        flight[1] -= 1
+        if flight[1] == 0:
+            del self._in_flight[slug]
+        return flight[0] == generation
+
+    def _store(self, slug: str, link_data: Optional[LinkData], now: float, generation: int) -> None:
+        if link_data is None:
+            deadline = now + self.negative_ttl_seconds
+        elif link_data.expires_at is not None and link_data.expires_at <= now:
+            # Already expired: remember it briefly, like a miss
+            deadline = now + self.negative_ttl_seconds
+        else:
+            deadline = now + self.ttl_seconds
+            if link_data.expires_at is not None:
+                deadline = min(deadline, link_data.expires_at)
+
+        with self._lock:
+            if not self._finish_fetch(slug, generation):
+                return
+            self._entries[slug] = (link_data, deadline)
+            self._entries.move_to_end(slug)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
@@ -0,0 +1,155 @@
+import socket
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List
+from models import ClickLog
+
+# IPv4 addresses are stored as their 32-bit value; anything else (IPv6,
+# 'unknown', ...) goes through the string dictionary with this bit set
+_DICTIONARY_IP = 1 << 32
+
+class StringDictionary:
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def decode(self, code: int) -> str:
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+class ClickDictionaries:
+    # Shared by every link in a repository so each distinct value is stored once
+    def __init__(self):
+        self.countries = StringDictionary()
+        self.user_agents = StringDictionary()
+        self.ips = StringDictionary()
+
+    def encode_ip(self, ip: str) -> int:
+        try:
+            packed = socket.inet_aton(ip)
+            # inet_aton accepts shorthand like '10.1'; only keep exact round trips
+            if socket.inet_ntoa(packed) == ip:
+                return int.from_bytes(packed, 'big')
+        except (OSError, TypeError):
+            pass
+        return _DICTIONARY_IP | self.ips.encode(ip)
+
+    def decode_ip(self, value: int) -> str:
+        if value & _DICTIONARY_IP:
+            return self.ips.decode(value & ~_DICTIONARY_IP)
+        return socket.inet_ntoa(value.to_bytes(4, 'big'))
+
+class ClickColumns(Sequence):
+    # One link's clicks as parallel typed arrays, roughly 18 bytes per click.
+    # ClickLog objects are only built when a caller indexes or iterates.
+    __slots__ = ('dictionaries', 'timestamps', 'ips', 'countries', 'user_agents')
+
+    def __init__(self, dictionaries: ClickDictionaries):
+        self.dictionaries = dictionaries
+        self.timestamps = array('I')
+        self.ips = array('Q')
+        self.countries = array('H')
+        self.user_agents = array('I')
+
+    def append(self, click_log: ClickLog) -> None:
+        self.ips.append(self.dictionaries.encode_ip(click_log.ip))
+        self.countries.append(self.dictionaries.countries.encode(click_log.country))
+        self.user_agents.append(self.dictionaries.user_agents.encode(click_log.user_agent))
+        # len() follows timestamps, so readers never see a half-appended click
+        self.timestamps.append(click_log.timestamp)
+
+    def replace(self, index: int, click_log: ClickLog) -> None:
+        # Overwrites a click in place; used by sampled links once their sample is full
+        self.ips[index] = self.dictionaries.encode_ip(click_log.ip)
+        self.countries[index] = self.dictionaries.countries.encode(click_log.country)
+        self.user_agents[index] = self.dictionaries.user_agents.encode(click_log.user_agent)
+        self.timestamps[index] = click_log.timestamp
+
+    def extend(self, click_logs: Iterable[ClickLog]) -> None:
+        for click_log in click_logs:
+            self.append(click_log)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._click_log(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('click index out of range')
+        return self._click_log(index)
+
+    def __iter__(self) -> Iterator[ClickLog]:
+        for index in range(len(self)):
+            yield self._click_log(index)
+
+    def view(self) -> 'ClickLogView':
+        return ClickLogView(self, len(self))
+
+    def to_dicts(self) -> List[dict]:
+        return [
+            {
+                'timestamp': log.timestamp,
+                'ip': log.ip,
+                'user_agent': log.user_agent,
+                'country': log.country
+            } for log in self
+        ]
+
+    @classmethod
+    def from_dicts(cls, dictionaries: ClickDictionaries, clicks: Iterable[dict]) -> 'ClickColumns':
+        columns = cls(dictionaries)
+        for click in clicks:
+            columns.append(ClickLog(
+                timestamp=click['timestamp'],
+                ip=click['ip'],
+                user_agent=click['user_agent'],
+                country=click['country']
+            ))
+        return columns
+
+    def _click_log(self, index: int) -> ClickLog:
+        dictionaries = self.dictionaries
+        return ClickLog(
+            timestamp=self.timestamps[index],
+            ip=dictionaries.decode_ip(self.ips[index]),
+            user_agent=dictionaries.user_agents.decode(self.user_agents[index]),
+            country=dictionaries.countries.decode(self.countries[index])
+        )
+
+class ClickLogView(Sequence):
+    # Fixed-length window over a link's columns, so an Analytics result does
+    # not grow while clicks keep arriving
+    __slots__ = ('_columns', '_length')
+
+    def __init__(self, columns: ClickColumns, length: int):
+        self._columns = columns
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._columns[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('click index out of range')
+        return self._columns[index]
+
+    def __iter__(self) -> Iterator[ClickLog]:
+        for index in range(self._length):
+            yield self._columns[index]
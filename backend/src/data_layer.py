@@ -1,12 +1,23 @@
 import json
 import os
+import tempfile
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict
-from models import LinkData, ClickLog, Analytics
+from typing import Optional, List, Dict, Iterator, Sequence
+from models import LinkData, ClickLog, Analytics, ClickPage, LinkSummary
+from journal import ClickJournal
+from rollups import LinkRollup
+from click_store import ClickColumns, ClickDictionaries
+from pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+from expiry import ExpiryIndex
+from snapshot import BinarySnapshot, SnapshotMapping, is_binary_snapshot, write_snapshot
+from sampling import sample_slot, sample_page, is_sampled
+from slug_allocator import SlugConflictError
 
 class LinkRepository(ABC):
     @abstractmethod
-    def save_link(self, link_data: LinkData) -> None:
+    def save_link(self, link_data: LinkData, overwrite: bool = True) -> None:
+        # With overwrite=False an existing slug raises SlugConflictError instead
         pass
     
     @abstractmethod
@@ -17,24 +28,88 @@ class LinkRepository(ABC):
     def log_click(self, slug: str, click_log: ClickLog) -> None:
         pass
     
+    def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        # Bulk save_link; backends override it with one write. With overwrite=False, links whose
+        # slug is taken are skipped and their slugs returned; the rest are still saved.
+        conflicts = []
+        for link_data in link_datas:
+            try:
+                self.save_link(link_data, overwrite)
+            except SlugConflictError:
+                conflicts.append(link_data.slug)
+        return conflicts
+    
+    def log_clicks(self, slug: str, click_logs: List[ClickLog]) -> None:
+        for click_log in click_logs:
+            self.log_click(slug, click_log)
+    
     @abstractmethod
     def get_analytics(self, slug: str) -> Optional[Analytics]:
         pass
+    
+    def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        # Backends that maintain rollups incrementally override this
+        analytics = self.get_analytics(slug)
+        if not analytics:
+            return None
+        rollup = LinkRollup.from_clicks(analytics.click_logs)
+        rollup.total_clicks = analytics.total_clicks
+        return rollup
+    
+    def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        # Summary fields for every slug that exists; unknown slugs are left out
+        summaries = {}
+        for slug in slugs:
+            link_data = self.get_link(slug)
+            rollup = self.get_rollup(slug) if link_data else None
+            if rollup:
+                summaries[slug] = _summary(link_data, rollup)
+        return summaries
+    
+    def iter_clicks(self, slug: str) -> Iterator[ClickLog]:
+        analytics = self.get_analytics(slug)
+        return iter(analytics.click_logs if analytics else [])
+    
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        analytics = self.get_analytics(slug)
+        if not analytics:
+            return None
+        return _page_from_list(analytics.click_logs, limit, cursor)
+    
+    @abstractmethod
+    def allocate_id_block(self, size: int) -> int:
+        # Reserves ids [start, start + size) for a slug allocator; see slug_allocator
+        pass
+    
+    @abstractmethod
+    def expired_slugs(self, now: int, limit: int) -> List[str]:
+        # Up to limit slugs with expires_at <= now, earliest first; used by expiry.ExpirySweeper
+        pass
+    
+    @abstractmethod
+    def delete_links(self, slugs: List[str], expired_before: Optional[int] = None) -> int:
+        # Removes links and their clicks. With expired_before, a link is only removed if it
+        # still expires at or before then, so a link re-saved since the lookup survives.
+        pass
 
 class InMemoryRepository(LinkRepository):
     def __init__(self):
         self.links: Dict[str, dict] = {}
-        self.analytics: Dict[str, List[dict]] = {}
-    
-    def save_link(self, link_data: LinkData) -> None:
-        self.links[link_data.slug] = {
-            'slug': link_data.slug,
-            'original_url': link_data.original_url,
-            'created_at': link_data.created_at,
-            'expires_at': link_data.expires_at,
-            'click_count': link_data.click_count
-        }
-        self.analytics[link_data.slug] = []
+        self.click_dictionaries = ClickDictionaries()
+        self.analytics: Dict[str, ClickColumns] = {}
+        self.rollups: Dict[str, LinkRollup] = {}
+        self.expiry_index = ExpiryIndex()
+        self._next_id = 0
+        self._lock = threading.Lock()
+    
+    def save_link(self, link_data: LinkData, overwrite: bool = True) -> None:
+        if not overwrite and link_data.slug in self.links:
+            raise SlugConflictError(link_data.slug)
+        self.links[link_data.slug] = _link_dict(link_data)
+        self.analytics[link_data.slug] = ClickColumns(self.click_dictionaries)
+        self.rollups[link_data.slug] = LinkRollup()
+        self.expiry_index.add(link_data.slug, link_data.expires_at)
     
     def get_link(self, slug: str) -> Optional[LinkData]:
         if slug not in self.links:
@@ -46,43 +121,96 @@ class InMemoryRepository(LinkRepository):
             original_url=data['original_url'],
             created_at=data['created_at'],
             expires_at=data['expires_at'],
-            click_count=data['click_count']
+            click_count=data['click_count'],
+            redirect_cache=data.get('redirect_cache'),
+            click_sample_size=data.get('click_sample_size')
         )
     
     def log_click(self, slug: str, click_log: ClickLog) -> None:
         if slug in self.analytics:
-            self.analytics[slug].append({
-                'timestamp': click_log.timestamp,
-                'ip': click_log.ip,
-                'user_agent': click_log.user_agent,
-                'country': click_log.country
-            })
+            _store_click(self.analytics[slug], _next_slot(self, slug), click_log)
             self.links[slug]['click_count'] += 1
+            self.rollups[slug].add(click_log)
     
     def get_analytics(self, slug: str) -> Optional[Analytics]:
         if slug not in self.links:
             return None
         
-        click_logs = [
-            ClickLog(
-                timestamp=log['timestamp'],
-                ip=log['ip'],
-                user_agent=log['user_agent'],
-                country=log['country']
-            ) for log in self.analytics.get(slug, [])
-        ]
-        
-        timestamps = [log.timestamp for log in click_logs]
+        # ClickLog objects are only built if the caller walks the view
+        rollup = self.rollups[slug]
         return Analytics(
             total_clicks=self.links[slug]['click_count'],
-            first_click=min(timestamps) if timestamps else None,
-            last_click=max(timestamps) if timestamps else None,
-            click_logs=click_logs
+            first_click=rollup.first_click,
+            last_click=rollup.last_click,
+            click_logs=self.analytics[slug].view(),
+            sampled=_sampled(self.links[slug])
         )
 
+    def iter_clicks(self, slug: str) -> Iterator[ClickLog]:
+        yield from self.analytics.get(slug, ())
+    
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        if slug not in self.links:
+            return None
+        if self.links[slug].get('click_sample_size') is None:
+            page = _page_from_list(self.analytics[slug], limit, cursor)
+        else:
+            page = sample_page(enumerate(self.analytics[slug]), limit, cursor)
+        page.sampled = _sampled(self.links[slug])
+        return page
+    
+    def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        rollup = self.rollups.get(slug)
+        return rollup.copy() if rollup else None
+    
+    def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        return {slug: _summary(self.get_link(slug), self.rollups[slug]) for slug in slugs if slug in self.links}
+    
+    def rebuild_rollups(self) -> int:
+        self.rollups = _rebuilt_rollups(self)
+        return len(self.rollups)
+    
+    def allocate_id_block(self, size: int) -> int:
+        with self._lock:
+            start = self._next_id
+            self._next_id += size
+            return start
+    
+    def expired_slugs(self, now: int, limit: int) -> List[str]:
+        with self._lock:
+            return self.expiry_index.expired(now, limit)
+    
+    def delete_links(self, slugs: List[str], expired_before: Optional[int] = None) -> int:
+        with self._lock:
+            removable = _removable(self.links, slugs, expired_before)
+            for slug in removable:
+                _drop_link(self, slug)
+            return len(removable)
+
+def _fsync(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
 class FileRepository(LinkRepository):
-    def __init__(self, data_file: str = 'linkpulse_data.json'):
+    def __init__(self, data_file: str = 'linkpulse_data.json', journaled: bool = False,
+                 compact_every: int = 10000, fsync_every: int = 64, snapshot_format: Optional[str] = None):
         self.data_file = data_file
+        # 'json' or 'binary'; by default an existing snapshot keeps its format and new ones are JSON
+        if snapshot_format is None:
+            snapshot_format = 'binary' if is_binary_snapshot(data_file) else 'json'
+        if snapshot_format not in ('json', 'binary'):
+            raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+        self.snapshot_format = snapshot_format
+        self.journaled = journaled
+        self.compact_every = compact_every
+        self.journal = ClickJournal(f'{data_file}.journal', fsync_every=fsync_every) if journaled else None
+        self._journal_seq = 0
+        self._next_id = 0
+        self._lock = threading.RLock()
         self._load_data()
     
     def _load_data(self):
@@ -91,45 +219,203 @@ class FileRepository(LinkRepository):
         if dir_path:
             os.makedirs(dir_path, exist_ok=True)
         
-        if os.path.exists(self.data_file):
+        self.click_dictionaries = ClickDictionaries()
+        if is_binary_snapshot(self.data_file):
+            try:
+                self._open_binary_snapshot()
+            except (ValueError, OSError):
+                self.links = {}
+                self.analytics = {}
+                self.rollups = {}
+        elif os.path.exists(self.data_file):
             try:
                 with open(self.data_file, 'r') as f:
                     data = json.load(f)
                     self.links = data.get('links', {})
-                    self.analytics = data.get('analytics', {})
+                    self.analytics = {
+                        slug: ClickColumns.from_dicts(self.click_dictionaries, clicks)
+                        for slug, clicks in data.get('analytics', {}).items()
+                    }
+                    self.rollups = {
+                        slug: LinkRollup.from_dict(rollup)
+                        for slug, rollup in data.get('rollups', {}).items()
+                        if 'unique_ips' in rollup
+                    }
+                    self._journal_seq = data.get('journal_seq', 0)
+                    self._next_id = data.get('next_id', 0)
             except (json.JSONDecodeError, IOError):
                 self.links = {}
                 self.analytics = {}
+                self.rollups = {}
         else:
             self.links = {}
             self.analytics = {}
+            self.rollups = {}
+        
+        self.expiry_index = ExpiryIndex()
+        if isinstance(self.links, SnapshotMapping):
+            # Binary snapshots always carry rollups, and their index has every expiry
+            for slug, expires_at in self.links.snapshot.expiries():
+                self.expiry_index.add(slug, expires_at)
+        else:
+            # Snapshots written before rollups (or their sketches) existed get them rebuilt once
+            if any(slug not in self.rollups for slug in self.analytics):
+                self.rebuild_rollups()
+            for slug, link in self.links.items():
+                self.expiry_index.add(slug, link['expires_at'])
+        
+        if self.journaled:
+            self._replay_journal()
+    
+    def _replay_journal(self):
+        # Records at or below the snapshot's sequence number were already folded in
+        snapshot_seq = self._journal_seq
+        for record in self.journal.replay():
+            seq = record.get('seq', 0)
+            if seq <= snapshot_seq:
+                continue
+            if record['op'] == 'link':
+                self._apply_link(record['link'])
+            elif record['op'] == 'links':
+                for link in record['links']:
+                    self._apply_link(link)
+            elif record['op'] == 'click' and record['slug'] in self.analytics:
+                # Sampled links journal the slot their random draw picked
+                slot = record['slot'] if 'slot' in record else _next_slot(self, record['slug'])
+                self._apply_click(record['slug'], _click_log(record['click']), slot)
+            elif record['op'] == 'alloc':
+                self._next_id = record['next_id']
+            elif record['op'] == 'delete':
+                for slug in record['slugs']:
+                    _drop_link(self, slug)
+            self._journal_seq = seq
+    
+    def _open_binary_snapshot(self):
+        # Only the slug index is read here; records, rollups and clicks decode on first use
+        snapshot = BinarySnapshot(self.data_file)
+        self.click_dictionaries = snapshot.dictionaries()
+        self.links = SnapshotMapping(snapshot, snapshot.link)
+        self.analytics = SnapshotMapping(snapshot, lambda position: snapshot.clicks(position,
+                                                                                    self.click_dictionaries))
+        self.rollups = SnapshotMapping(snapshot, snapshot.rollup)
+        self._journal_seq = snapshot.meta.get('journal_seq', 0)
+        self._next_id = snapshot.meta.get('next_id', 0)
     
     def _save_data(self):
+        # Raises if the snapshot could not be made durable, so callers never drop the journal behind it
+        self.export_snapshot(self.data_file, self.snapshot_format)
+        if self.snapshot_format == 'binary':
+            # Serve from the new file so decoded entries don't pile up between compactions
+            self._open_binary_snapshot()
+    
+    def export_snapshot(self, path: str, snapshot_format: str = 'json') -> None:
         # Create directory if it doesn't exist (handle case where dirname is empty)
-        dir_path = os.path.dirname(self.data_file)
+        dir_path = os.path.dirname(path)
         if dir_path:
             os.makedirs(dir_path, exist_ok=True)
         
+        meta = {'next_id': self._next_id}
+        if self.journaled:
+            meta['journal_seq'] = self._journal_seq
+        
+        # Write to a temp file and swap it in so a crash never leaves a half-written snapshot.
+        # Each writer gets its own temp file, so processes sharing the data file can't rename
+        # each other's away.
+        fd, tmp_file = tempfile.mkstemp(dir=dir_path or '.', prefix=f'{os.path.basename(path)}.', suffix='.tmp')
+        os.close(fd)
         try:
-            with open(self.data_file, 'w') as f:
-                json.dump({
-                    'links': self.links,
-                    'analytics': self.analytics
-                }, f, indent=2)
-        except IOError as e:
-            print(f"Error saving data: {e}")
-    
-    def save_link(self, link_data: LinkData) -> None:
-        self.links[link_data.slug] = {
-            'slug': link_data.slug,
-            'original_url': link_data.original_url,
-            'created_at': link_data.created_at,
-            'expires_at': link_data.expires_at,
-            'click_count': link_data.click_count
-        }
-        self.analytics[link_data.slug] = []
-        print(f"Debug: Saved link with slug '{link_data.slug}', total links: {len(self.links)}")
-        self._save_data()
+            with self._lock:
+                if snapshot_format == 'binary':
+                    write_snapshot(tmp_file, self.links, self.analytics, self.rollups, self.click_dictionaries,
+                                   meta)
+                else:
+                    data = {
+                        'links': dict(self.links),
+                        'analytics': {slug: clicks.to_dicts() for slug, clicks in self.analytics.items()},
+                        'rollups': {slug: rollup.to_dict() for slug, rollup in self.rollups.items()},
+                        **meta
+                    }
+                    with open(tmp_file, 'w') as f:
+                        json.dump(data, f, indent=2)
+                # The data must be on disk before the rename, and the rename before the journal is cut
+                _fsync(tmp_file)
+                os.replace(tmp_file, path)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        _fsync(dir_path or '.')
+    
+    def _append_journal(self, record: dict):
+        self._journal_seq += 1
+        record['seq'] = self._journal_seq
+        self.journal.append(record)
+        if self.journal.records_written >= self.compact_every:
+            try:
+                self.compact()
+            except OSError as e:
+                # The record is safe in the journal; compaction is retried on the next append
+                print(f"Error saving data: {e}")
+    
+    def compact(self) -> None:
+        # Fold the journal into a fresh snapshot, then start a new journal
+        with self._lock:
+            if not self.journaled:
+                self._save_data()
+                return
+            self.journal.sync()
+            self._save_data()
+            self.journal.truncate()
+    
+    def close(self, compact: bool = True) -> None:
+        # compact=False leaves the journal to be replayed on the next open, for callers
+        # that know nothing was written since the last snapshot
+        if self.journaled:
+            if compact:
+                self.compact()
+            self.journal.close()
+    
+    def _apply_link(self, link: dict):
+        self.links[link['slug']] = link
+        self.analytics[link['slug']] = ClickColumns(self.click_dictionaries)
+        self.rollups[link['slug']] = LinkRollup()
+        self.expiry_index.add(link['slug'], link['expires_at'])
+    
+    def _apply_click(self, slug: str, click_log: ClickLog, slot: Optional[int]):
+        _store_click(self.analytics[slug], slot, click_log)
+        self.links[slug]['click_count'] += 1
+        self.rollups[slug].add(click_log)
+    
+    def save_link(self, link_data: LinkData, overwrite: bool = True) -> None:
+        link = _link_dict(link_data)
+        with self._lock:
+            if not overwrite and link_data.slug in self.links:
+                raise SlugConflictError(link_data.slug)
+            self._apply_link(link)
+            print(f"Debug: Saved link with slug '{link_data.slug}', total links: {len(self.links)}")
+            if self.journaled:
+                self._append_journal({'op': 'link', 'link': link})
+            else:
+                self._save_data()
+    
+    def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        # One journal record or one snapshot rewrite for the whole batch
+        links, conflicts = [], []
+        with self._lock:
+            for link_data in link_datas:
+                if not overwrite and link_data.slug in self.links:
+                    conflicts.append(link_data.slug)
+                    continue
+                link = _link_dict(link_data)
+                self._apply_link(link)
+                links.append(link)
+            if not links:
+                return conflicts
+            if self.journaled:
+                self._append_journal({'op': 'links', 'links': links})
+            else:
+                self._save_data()
+        return conflicts
     
     def get_link(self, slug: str) -> Optional[LinkData]:
         if slug not in self.links:
@@ -141,37 +427,188 @@ class FileRepository(LinkRepository):
             original_url=data['original_url'],
             created_at=data['created_at'],
             expires_at=data['expires_at'],
-            click_count=data['click_count']
+            click_count=data['click_count'],
+            redirect_cache=data.get('redirect_cache'),
+            click_sample_size=data.get('click_sample_size')
         )
     
     def log_click(self, slug: str, click_log: ClickLog) -> None:
-        if slug in self.analytics:
-            self.analytics[slug].append({
-                'timestamp': click_log.timestamp,
-                'ip': click_log.ip,
-                'user_agent': click_log.user_agent,
-                'country': click_log.country
-            })
-            self.links[slug]['click_count'] += 1
-            self._save_data()
+        self.log_clicks(slug, [click_log])
+    
+    def log_clicks(self, slug: str, click_logs: List[ClickLog]) -> None:
+        with self._lock:
+            if slug not in self.analytics:
+                return
+            for click_log in click_logs:
+                slot = _next_slot(self, slug)
+                self._apply_click(slug, click_log, slot)
+                if self.journaled:
+                    record = {'op': 'click', 'slug': slug, 'click': {
+                        'timestamp': click_log.timestamp,
+                        'ip': click_log.ip,
+                        'user_agent': click_log.user_agent,
+                        'country': click_log.country
+                    }}
+                    if self.links[slug].get('click_sample_size') is not None:
+                        record['slot'] = slot
+                    self._append_journal(record)
+            # One snapshot rewrite per batch instead of one per click
+            if not self.journaled:
+                self._save_data()
     
     def get_analytics(self, slug: str) -> Optional[Analytics]:
         if slug not in self.links:
             return None
         
-        click_logs = [
-            ClickLog(
-                timestamp=log['timestamp'],
-                ip=log['ip'],
-                user_agent=log['user_agent'],
-                country=log['country']
-            ) for log in self.analytics.get(slug, [])
-        ]
-        
-        timestamps = [log.timestamp for log in click_logs]
+        # ClickLog objects are only built if the caller walks the view
+        rollup = self.rollups[slug]
         return Analytics(
             total_clicks=self.links[slug]['click_count'],
-            first_click=min(timestamps) if timestamps else None,
-            last_click=max(timestamps) if timestamps else None,
-            click_logs=click_logs
-        )
\ No newline at end of file
+            first_click=rollup.first_click,
+            last_click=rollup.last_click,
+            click_logs=self.analytics[slug].view(),
+            sampled=_sampled(self.links[slug])
+        )
+    
+    def iter_clicks(self, slug: str) -> Iterator[ClickLog]:
+        yield from self.analytics.get(slug, ())
+    
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        if slug not in self.links:
+            return None
+        if self.links[slug].get('click_sample_size') is None:
+            page = _page_from_list(self.analytics[slug], limit, cursor)
+        else:
+            page = sample_page(enumerate(self.analytics[slug]), limit, cursor)
+        page.sampled = _sampled(self.links[slug])
+        return page
+    
+    def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        with self._lock:
+            rollup = self.rollups.get(slug)
+            return rollup.copy() if rollup else None
+    
+    def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        with self._lock:
+            return {
+                slug: _summary(self.get_link(slug), self.rollups[slug]) for slug in slugs if slug in self.links
+            }
+    
+    def rebuild_rollups(self) -> int:
+        with self._lock:
+            self.rollups = _rebuilt_rollups(self)
+            return len(self.rollups)
+    
+    def allocate_id_block(self, size: int) -> int:
+        # The reservation is durable before any id from it is handed out
+        with self._lock:
+            start = self._next_id
+            self._next_id += size
+            if self.journaled:
+                self._append_journal({'op': 'alloc', 'next_id': self._next_id})
+                self.journal.sync()
+            else:
+                self._save_data()
+            return start
+    
+    def expired_slugs(self, now: int, limit: int) -> List[str]:
+        with self._lock:
+            return self.expiry_index.expired(now, limit)
+    
+    def delete_links(self, slugs: List[str], expired_before: Optional[int] = None) -> int:
+        with self._lock:
+            removable = _removable(self.links, slugs, expired_before)
+            if not removable:
+                return 0
+            for slug in removable:
+                _drop_link(self, slug)
+            if self.journaled:
+                self._append_journal({'op': 'delete', 'slugs': removable})
+            else:
+                self._save_data()
+            return len(removable)
+
+def _removable(links: Dict[str, dict], slugs: List[str], expired_before: Optional[int]) -> List[str]:
+    removable = []
+    for slug in dict.fromkeys(slugs):
+        link = links.get(slug)
+        if link is None:
+            continue
+        if expired_before is not None and (link['expires_at'] is None or link['expires_at'] > expired_before):
+            continue
+        removable.append(slug)
+    return removable
+
+def _drop_link(repository, slug: str) -> None:
+    repository.links.pop(slug, None)
+    repository.analytics.pop(slug, None)
+    repository.rollups.pop(slug, None)
+    repository.expiry_index.remove(slug)
+
+def _next_slot(repository, slug: str) -> Optional[int]:
+    link = repository.links[slug]
+    return sample_slot(link.get('click_sample_size'), link['click_count'] + 1, len(repository.analytics[slug]))
+
+def _store_click(columns: ClickColumns, slot: Optional[int], click_log: ClickLog) -> None:
+    # slot None means the click is only counted, not kept
+    if slot is None:
+        return
+    if slot == len(columns):
+        columns.append(click_log)
+    else:
+        columns.replace(slot, click_log)
+
+def _sampled(link: dict) -> bool:
+    return is_sampled(link.get('click_sample_size'), link['click_count'])
+
+def _rebuilt_rollups(repository) -> Dict[str, LinkRollup]:
+    # A sample can't give back exact totals, so sampled links keep the rollups they have
+    rollups = {}
+    for slug, clicks in repository.analytics.items():
+        rollup = repository.rollups.get(slug)
+        if rollup is None or repository.links[slug].get('click_sample_size') is None:
+            rollup = LinkRollup.from_clicks(clicks)
+        rollups[slug] = rollup
+    return rollups
+
+def _summary(link_data: LinkData, rollup: LinkRollup) -> LinkSummary:
+    return LinkSummary(
+        link_data=link_data,
+        first_click=rollup.first_click,
+        last_click=rollup.last_click,
+        unique_countries=len(rollup.countries)
+    )
+
+def _link_dict(link_data: LinkData) -> dict:
+    return {
+        'slug': link_data.slug,
+        'original_url': link_data.original_url,
+        'created_at': link_data.created_at,
+        'expires_at': link_data.expires_at,
+        'click_count': link_data.click_count,
+        'redirect_cache': link_data.redirect_cache,
+        'click_sample_size': link_data.click_sample_size
+    }
+
+def _click_log(log: dict) -> ClickLog:
+    return ClickLog(
+        timestamp=log['timestamp'],
+        ip=log['ip'],
+        user_agent=log['user_agent'],
+        country=log['country']
+    )
+
+def _page_from_list(clicks: Sequence[ClickLog], limit: int, cursor: Optional[str]) -> ClickPage:
+    # Unsampled click lists are append-only, so a plain offset is a stable cursor
+    offset = 0
+    if cursor:
+        offset = decode_cursor(cursor).get('offset', 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("Invalid cursor")
+    page = clicks[offset:offset + limit]
+    next_offset = offset + len(page)
+    return ClickPage(
+        click_logs=list(page),
+        next_cursor=encode_cursor({'offset': next_offset}) if next_offset < len(clicks) else None
+    )
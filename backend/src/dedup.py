@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+class ClickDeduplicator:
+    # Remembers which (slug, ip, user_agent) clicks were stored in the last
+    # window_seconds, as a ring of time buckets holding sets of key hashes.
+    # A repeat inside the window is only counted in this process's stats, never
+    # per link, since each worker sees only its own repeats. Buckets older than
+    # the window are dropped whole, and at max_keys the oldest one goes early,
+    # so memory stays bounded at the cost of letting some repeats through.
+    def __init__(self, window_seconds: float = 30, buckets: int = 6, max_keys: int = 100000, clock=time.time):
+        if window_seconds <= 0 or buckets < 1:
+            raise ValueError("window_seconds and buckets must be positive")
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        self.max_keys = max_keys
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._ring: deque = deque()
+        self._tracked = 0
+        self._stats = {'stored': 0, 'suppressed': 0}
+
+    def should_store(self, slug: str, ip: str, user_agent: str, now: Optional[float] = None) -> bool:
+        key = hash((slug, ip, user_agent))
+        bucket_id = int((self.clock() if now is None else now) // self.bucket_seconds)
+        with self._lock:
+            # A stored click is remembered for between window - bucket_seconds and window seconds
+            while self._ring and self._ring[0][0] <= bucket_id - self.buckets:
+                self._drop_oldest()
+            for _, keys in self._ring:
+                if key in keys:
+                    self._stats['suppressed'] += 1
+                    return False
+
+            while self._ring and self._tracked >= self.max_keys:
+                self._drop_oldest()
+            if not self._ring or self._ring[-1][0] != bucket_id:
+                self._ring.append((bucket_id, set()))
+            self._ring[-1][1].add(key)
+            self._tracked += 1
+            self._stats['stored'] += 1
+            return True
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                'tracked_keys': self._tracked,
+                'window_seconds': self.window_seconds
+            }
+
+    def _drop_oldest(self) -> None:
+        _, keys = self._ring.popleft()
+        self._tracked -= len(keys)
+
+def create_click_deduplicator() -> Optional[ClickDeduplicator]:
+    # LINKPULSE_DEDUP_WINDOW=<seconds> turns suppression on; every click is stored by default
+    window = float(os.environ.get('LINKPULSE_DEDUP_WINDOW', 0))
+    if window <= 0:
+        return None
+    return ClickDeduplicator(window, max_keys=int(os.environ.get('LINKPULSE_DEDUP_MAX_KEYS', 100000)))
@@ -0,0 +1,173 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ExpiryIndex:
+    # Min-heap of (expires_at, slug). Removals and re-saves are lazy: an entry
+    # only counts while it still matches the slug's current deadline.
+    def __init__(self):
+        self._heap: List[Tuple[int, str]] = []
+        self._deadlines: Dict[str, int] = {}
+
+    def add(self, slug: str, expires_at: Optional[int]) -> None:
+        if expires_at is None:
+            self._deadlines.pop(slug, None)
+            return
+        self._deadlines[slug] = expires_at
+        heapq.heappush(self._heap, (expires_at, slug))
+        if len(self._heap) > 2 * len(self._deadlines) + 1024:
+            self._heap = [(deadline, slug) for slug, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def remove(self, slug: str) -> None:
+        self._deadlines.pop(slug, None)
+
+    def expired(self, now: int, limit: int) -> List[str]:
+        # Earliest deadlines first; the entries stay indexed until the slugs are removed
+        found = []
+        seen = set()
+        while self._heap and len(found) < limit and self._heap[0][0] <= now:
+            expires_at, slug = heapq.heappop(self._heap)
+            if self._deadlines.get(slug) == expires_at and slug not in seen:
+                seen.add(slug)
+                found.append((expires_at, slug))
+        for entry in found:
+            heapq.heappush(self._heap, entry)
+        return [slug for _, slug in found]
+
+    def earliest(self) -> Optional[int]:
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+class ExpirySweeper:
+    # Background counterpart of DynamoDB TTL for the local backends: removes
+    # expired links and their clicks in bounded batches, optionally appending
+    # them to a JSON-lines archive first.
+    def __init__(self, repository, interval_seconds: float = 60, batch_size: int = 500,
+                 policy: str = 'delete', archive_path: Optional[str] = None, clock=time.time):
+        if policy not in ('delete', 'archive'):
+            raise ValueError(f"Unknown expiry policy: {policy}")
+        if policy == 'archive' and not archive_path:
+            raise ValueError("The archive policy needs an archive_path")
+        self.repository = repository
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.policy = policy
+        self.archive_path = archive_path
+        self._clock = clock
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'sweeps': 0, 'batches': 0, 'expired': 0, 'archived': 0, 'failed': 0,
+            'last_sweep_at': None, 'last_sweep_ms': None
+        }
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def sweep(self) -> int:
+        # Batches run until nothing expired is left; each one takes the repository lock only briefly
+        started = time.perf_counter()
+        now = int(self._clock())
+        removed = 0
+        while not self._stopping.is_set():
+            slugs = self.repository.expired_slugs(now, self.batch_size)
+            if not slugs:
+                break
+            archived = 0
+            try:
+                if self.policy == 'archive':
+                    # Only what was both written to the archive and then deleted counts as archived;
+                    # slugs with nothing left to archive are still cleared from the index
+                    written = self._archive(slugs)
+                    archived = self.repository.delete_links(written, expired_before=now) if written else 0
+                    rest = [slug for slug in slugs if slug not in set(written)]
+                    deleted = archived + (self.repository.delete_links(rest, expired_before=now) if rest else 0)
+                else:
+                    deleted = self.repository.delete_links(slugs, expired_before=now)
+            except Exception as e:
+                logger.error(f"Error sweeping {len(slugs)} expired links: {str(e)}")
+                self._bump('failed', len(slugs))
+                break
+            removed += deleted
+            self._bump('batches')
+            self._bump('expired', deleted)
+            self._bump('archived', archived)
+            if len(slugs) < self.batch_size:
+                break
+
+        with self._stats_lock:
+            self._stats['sweeps'] += 1
+            self._stats['last_sweep_at'] = now
+            self._stats['last_sweep_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return removed
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['policy'] = self.policy
+        return stats
+
+    def _bump(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval_seconds):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Expiry sweep failed: {str(e)}")
+
+    def _archive(self, slugs: List[str]) -> List[str]:
+        # Written and synced before the links are deleted, so a crash can only duplicate an entry.
+        # Returns the slugs written; links that are already gone are skipped.
+        written = []
+        with open(self.archive_path, 'a') as f:
+            for slug in slugs:
+                link_data = self.repository.get_link(slug)
+                if link_data is None:
+                    continue
+                written.append(slug)
+                f.write(json.dumps({
+                    'link': {
+                        'slug': link_data.slug,
+                        'original_url': link_data.original_url,
+                        'created_at': link_data.created_at,
+                        'expires_at': link_data.expires_at,
+                        'click_count': link_data.click_count
+                    },
+                    'clicks': [
+                        {
+                            'timestamp': log.timestamp,
+                            'ip': log.ip,
+                            'user_agent': log.user_agent,
+                            'country': log.country
+                        } for log in self.repository.iter_clicks(slug)
+                    ]
+                }, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return written
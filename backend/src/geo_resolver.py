@@ -0,0 +1,242 @@
+import bisect
+import csv
+import ipaddress
+import logging
+import os
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LOCAL_ADDRESSES = ('127.0.0.1', 'localhost', '::1')
+
+class _PackedKeys:
+    # Sequence view over fixed-width big-endian keys so bisect can search raw bytes
+    def __init__(self, data: bytes, width: int):
+        self._data = data
+        self._width = width
+
+    def __len__(self):
+        return len(self._data) // self._width
+
+    def __getitem__(self, index: int) -> bytes:
+        start = index * self._width
+        return self._data[start:start + self._width]
+
+class IpRangeTable:
+    # IPv4 ranges live in uint32 arrays, IPv6 ranges in packed 16-byte keys;
+    # countries are stored once and referenced by a uint16 index.
+    MAGIC = b'LPGEO1\x00\x00'
+
+    def __init__(self):
+        self.countries: List[str] = []
+        self._v4_starts = array('I')
+        self._v4_ends = array('I')
+        self._v4_countries = array('H')
+        self._v6_starts = b''
+        self._v6_ends = b''
+        self._v6_countries = array('H')
+
+    def __len__(self):
+        return len(self._v4_starts) + len(self._v6_countries)
+
+    @classmethod
+    def from_ranges(cls, ranges: Iterable[Tuple[str, str, str]]) -> 'IpRangeTable':
+        table = cls()
+        country_index = {}
+        v4, v6 = [], []
+        for start, end, country in ranges:
+            start_ip, end_ip = _parse_bound(start), _parse_bound(end)
+            if start_ip.version != end_ip.version:
+                raise ValueError(f"Mixed address families in range {start}-{end}")
+            if country not in country_index:
+                country_index[country] = len(table.countries)
+                table.countries.append(country)
+            target = v4 if start_ip.version == 4 else v6
+            target.append((int(start_ip), int(end_ip), country_index[country]))
+
+        v4.sort()
+        v6.sort()
+        table._v4_starts = array('I', (r[0] for r in v4))
+        table._v4_ends = array('I', (r[1] for r in v4))
+        table._v4_countries = array('H', (r[2] for r in v4))
+        table._v6_starts = b''.join(r[0].to_bytes(16, 'big') for r in v6)
+        table._v6_ends = b''.join(r[1].to_bytes(16, 'big') for r in v6)
+        table._v6_countries = array('H', (r[2] for r in v6))
+        return table
+
+    @classmethod
+    def load_csv(cls, path: str) -> 'IpRangeTable':
+        # Rows are start,end,country with bounds as addresses or integers
+        with open(path, 'r', newline='') as f:
+            rows = [row for row in csv.reader(f) if row and not row[0].startswith('#')]
+        if rows and not _looks_like_bound(rows[0][0]):
+            rows = rows[1:]  # header
+        return cls.from_ranges((row[0], row[1], row[2]) for row in rows)
+
+    @classmethod
+    def load(cls, path: str) -> 'IpRangeTable':
+        with open(path, 'rb') as f:
+            is_binary = f.read(len(cls.MAGIC)) == cls.MAGIC
+        return cls.load_binary(path) if is_binary else cls.load_csv(path)
+
+    @classmethod
+    def load_binary(cls, path: str) -> 'IpRangeTable':
+        table = cls()
+        with open(path, 'rb') as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{path} is not a LinkPulse geo table")
+            (country_count,) = struct.unpack('<I', f.read(4))
+            for _ in range(country_count):
+                (length,) = struct.unpack('<B', f.read(1))
+                table.countries.append(f.read(length).decode('utf-8'))
+
+            (v4_count,) = struct.unpack('<I', f.read(4))
+            table._v4_starts = _read_array(f, 'I', v4_count)
+            table._v4_ends = _read_array(f, 'I', v4_count)
+            table._v4_countries = _read_array(f, 'H', v4_count)
+
+            (v6_count,) = struct.unpack('<I', f.read(4))
+            table._v6_starts = f.read(16 * v6_count)
+            table._v6_ends = f.read(16 * v6_count)
+            table._v6_countries = _read_array(f, 'H', v6_count)
+        return table
+
+    def save_binary(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack('<I', len(self.countries)))
+            for country in self.countries:
+                encoded = country.encode('utf-8')
+                f.write(struct.pack('<B', len(encoded)))
+                f.write(encoded)
+
+            f.write(struct.pack('<I', len(self._v4_starts)))
+            for column in (self._v4_starts, self._v4_ends, self._v4_countries):
+                _write_array(f, column)
+
+            f.write(struct.pack('<I', len(self._v6_countries)))
+            f.write(self._v6_starts)
+            f.write(self._v6_ends)
+            _write_array(f, self._v6_countries)
+
+    def lookup(self, ip: str) -> Optional[str]:
+        address = ipaddress.ip_address(ip)
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+
+        if address.version == 4:
+            value = int(address)
+            index = bisect.bisect_right(self._v4_starts, value) - 1
+            if index >= 0 and value <= self._v4_ends[index]:
+                return self.countries[self._v4_countries[index]]
+            return None
+
+        key = address.packed
+        index = bisect.bisect_right(_PackedKeys(self._v6_starts, 16), key) - 1
+        if index >= 0 and key <= self._v6_ends[index * 16:index * 16 + 16]:
+            return self.countries[self._v6_countries[index]]
+        return None
+
+class HttpGeoResolver:
+    # The original per-click ipinfo.io lookup, kept as an optional fallback
+    def __init__(self, timeout: float = 2):
+        self.timeout = timeout
+
+    def get_country(self, ip: str) -> str:
+        if ip in LOCAL_ADDRESSES:
+            return 'Local'
+
+        import requests
+        try:
+            response = requests.get(f'https://ipinfo.io/{ip}/json', timeout=self.timeout)
+            if response.status_code == 200:
+                return response.json().get('country', 'Unknown')
+        except Exception:
+            pass
+        return 'Unknown'
+
+class _FallbackMiss(Exception):
+    pass
+
+class OfflineGeoResolver:
+    def __init__(self, table: Optional[IpRangeTable] = None, fallback=None, cache_size: int = 65536):
+        self.table = table if table is not None else IpRangeTable()
+        self.fallback = fallback
+        self._cached_resolve = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def get_country(self, ip: str) -> str:
+        if ip in LOCAL_ADDRESSES:
+            return 'Local'
+        try:
+            return self._cached_resolve(ip)
+        except _FallbackMiss:
+            return 'Unknown'
+
+    def cache_info(self):
+        return self._cached_resolve.cache_info()
+
+    def _resolve(self, ip: str) -> str:
+        try:
+            country = self.table.lookup(ip)
+        except ValueError:
+            return 'Unknown'
+        if country:
+            return country
+        if self.fallback is not None:
+            country = self.fallback.get_country(ip)
+            if country == 'Unknown':
+                # Usually a timeout or rate limit; raising keeps it out of the cache so it is retried
+                raise _FallbackMiss(ip)
+            return country
+        return 'Unknown'
+
+_default_resolver: Optional[OfflineGeoResolver] = None
+
+def default_resolver() -> OfflineGeoResolver:
+    # GEO_DB_PATH points at a CSV or binary range table. GEO_HTTP_FALLBACK=1 sends
+    # addresses missing from it to ipinfo.io; without a table that is the default
+    # (as before the table existed) unless GEO_HTTP_FALLBACK=0
+    global _default_resolver
+    if _default_resolver is None:
+        path = os.environ.get('GEO_DB_PATH')
+        has_table = bool(path) and os.path.exists(path)
+        if path and not has_table:
+            logger.warning(f"GEO_DB_PATH {path} does not exist; no offline geo table is loaded")
+        table = IpRangeTable.load(path) if has_table else IpRangeTable()
+        setting = os.environ.get('GEO_HTTP_FALLBACK')
+        use_http = setting == '1' if has_table else setting != '0'
+        if not has_table and not use_http:
+            logger.warning("No geo table and GEO_HTTP_FALLBACK=0; every click's country will be 'Unknown'")
+        _default_resolver = OfflineGeoResolver(table, fallback=HttpGeoResolver() if use_http else None)
+    return _default_resolver
+
+def _looks_like_bound(value: str) -> bool:
+    value = value.strip()
+    return value.isdigit() or ':' in value or value.count('.') == 3
+
+def _parse_bound(value) -> ipaddress._BaseAddress:
+    if isinstance(value, int):
+        return ipaddress.ip_address(value)
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        # Bare integers above the IPv4 space are IPv6 addresses
+        return ipaddress.IPv4Address(number) if number <= 0xFFFFFFFF else ipaddress.IPv6Address(number)
+    return ipaddress.ip_address(value)
+
+def _read_array(f, typecode: str, count: int) -> array:
+    column = array(typecode)
+    column.frombytes(f.read(column.itemsize * count))
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+def _write_array(f, column: array) -> None:
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    f.write(column.tobytes())
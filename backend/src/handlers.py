@@ -1,39 +1,132 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import base64
+import functools
 import json
 import logging
+import os
 from services import LinkService
-from repository import DynamoRepository
+from pagination import parse_limit
+from metrics import REGISTRY
+from redirect_cache import redirect_response
+from response_encoding import encode_json, compress_body
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def create_response(status_code: int, body: dict):
+# Shared per container and reused across warm invocations
+_service = None
+_init_ms = None
+_cold_start = True
+
+def _get_service() -> LinkService:
+    global _service, _init_ms
+    if _service is None:
+        started = time.perf_counter()
+        # boto3 is the heaviest import by far, so it is only paid once per container
+        import boto3
+        from botocore.config import Config
+        from repository import DynamoRepository
+        from caching import CachingRepository
+        from instrumentation import InstrumentedRepository
+        from slug_allocator import create_slug_allocator
+        from dedup import create_click_deduplicator
+        
+        dynamodb = boto3.resource('dynamodb', config=Config(
+            max_pool_connections=int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', '10')),
+            tcp_keepalive=True,
+            retries={'max_attempts': 3, 'mode': 'standard'}
+        ))
+        repository = CachingRepository(InstrumentedRepository(DynamoRepository(dynamodb=dynamodb)))
+        # Each container reserves its own block of slug ids and keeps its own dedup window
+        _service = LinkService(repository, slug_allocator=create_slug_allocator(repository),
+                               deduplicator=create_click_deduplicator())
+        _init_ms = (time.perf_counter() - started) * 1000
+    return _service
+
+def _timed(handler):
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        started = time.perf_counter()
+        # Per-stage milliseconds for this invocation go into the same structured log line
+        with REGISTRY.capture() as stages:
+            try:
+                return handler(event, context)
+            finally:
+                duration = time.perf_counter() - started
+                REGISTRY.observe('linkpulse_handler_seconds', duration, handler=handler.__name__)
+                report = {
+                    'handler': handler.__name__,
+                    'cold_start': cold_start,
+                    'duration_ms': round(duration * 1000, 3),
+                    'stages': {stage: round(ms, 3) for stage, ms in stages.items()}
+                }
+                if cold_start:
+                    report['import_ms'] = round(_IMPORT_MS, 3)
+                    report['init_ms'] = round(_init_ms or 0.0, 3)
+                logger.info(json.dumps(report))
+    return wrapper
+
+def create_response(status_code: int, body: dict, event: dict = None):
+    with REGISTRY.timer('linkpulse_stage_seconds', operation='response', stage='serialize'):
+        serialized = encode_json(body)
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+    if event is None:
+        return {'statusCode': status_code, 'headers': headers, 'body': serialized.decode()}
+    
+    # Handlers that pass their event get a body compressed to what the client accepts
+    accept_encoding = _request_headers(event).get('accept-encoding')
+    with REGISTRY.timer('linkpulse_stage_seconds', operation='response', stage='compress'):
+        compressed, coding = compress_body(serialized, accept_encoding)
+    headers['Vary'] = 'Accept-Encoding'
+    if coding is None:
+        return {'statusCode': status_code, 'headers': headers, 'body': serialized.decode()}
+    headers['Content-Encoding'] = coding
     return {
         'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps(body)
+        'headers': headers,
+        'body': base64.b64encode(compressed).decode(),
+        'isBase64Encoded': True
     }
 
+def _request_headers(event) -> dict:
+    # API Gateway may pass header names in any case
+    return {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+
+def _json_body(event):
+    # With binary media types enabled on the API, request bodies may arrive base64 encoded
+    body = event['body']
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    return json.loads(body)
+
+@_timed
 def shorten_handler(event, context):
     try:
-        body = json.loads(event['body'])
+        body = _json_body(event)
         url = body.get('url')
         ttl_hours = body.get('ttl_hours', 24)
         
         if not url:
             return create_response(400, {'error': 'URL is required'})
         
-        repository = DynamoRepository()
-        service = LinkService(repository)
-        link_data = service.create_short_link(url, ttl_hours)
+        service = _get_service()
+        link_data = service.create_short_link(url, ttl_hours, body.get('redirect_cache'),
+                                              body.get('click_sample_size'))
         
         return create_response(200, {
             'slug': link_data.slug,
             'short_url': f"https://your-domain.com/u/{link_data.slug}",
             'original_url': link_data.original_url,
-            'expires_at': link_data.expires_at
+            'expires_at': link_data.expires_at,
+            'redirect_cache': link_data.redirect_cache,
+            'click_sample_size': link_data.click_sample_size
         })
         
     except ValueError as e:
@@ -42,56 +135,153 @@ def shorten_handler(event, context):
         logger.error(f"Error in shorten_handler: {str(e)}")
         return create_response(500, {'error': 'Internal server error'})
 
+@_timed
+def shorten_batch_handler(event, context):
+    try:
+        body = _json_body(event)
+        links = body.get('links') if isinstance(body, dict) else None
+        if not isinstance(links, list) or not links:
+            return create_response(400, {'error': 'links must be a non-empty array'})
+        
+        default_ttl = body.get('ttl_hours', 24)
+        items = [
+            (link.get('url'), link.get('ttl_hours', default_ttl), link.get('redirect_cache'),
+             link.get('click_sample_size')) if isinstance(link, dict) else (None, None)
+            for link in links
+        ]
+        service = _get_service()
+        results = service.create_short_links(items)
+        
+        return create_response(200, {
+            'created': sum(1 for result in results if result.link_data),
+            'failed': sum(1 for result in results if result.error),
+            'results': [shorten_result_to_dict(result) for result in results]
+        })
+        
+    except ValueError as e:
+        return create_response(400, {'error': str(e)})
+    except Exception as e:
+        logger.error(f"Error in shorten_batch_handler: {str(e)}")
+        return create_response(500, {'error': 'Internal server error'})
+
+def shorten_result_to_dict(result) -> dict:
+    if result.error:
+        return {'original_url': result.original_url, 'error': result.error}
+    return {
+        'slug': result.link_data.slug,
+        'short_url': f"https://your-domain.com/u/{result.link_data.slug}",
+        'original_url': result.link_data.original_url,
+        'expires_at': result.link_data.expires_at,
+        'redirect_cache': result.link_data.redirect_cache,
+        'click_sample_size': result.link_data.click_sample_size
+    }
+
+@_timed
 def redirect_handler(event, context):
     try:
         slug = event['pathParameters']['slug']
         ip = event['requestContext']['identity']['sourceIp']
         user_agent = event['headers'].get('User-Agent', 'Unknown')
         
-        repository = DynamoRepository()
-        service = LinkService(repository)
-        redirect_url = service.get_redirect_url(slug, ip, user_agent)
+        service = _get_service()
+        link_data = service.resolve_redirect(slug, ip, user_agent)
         
-        if not redirect_url:
+        if not link_data:
             return create_response(404, {'error': 'Link not found or expired'})
         
+        request_headers = _request_headers(event)
+        status, headers = redirect_response(link_data, request_headers.get('if-none-match'),
+                                            request_headers.get('if-modified-since'))
+        headers['Access-Control-Allow-Origin'] = '*'
         return {
-            'statusCode': 302,
-            'headers': {
-                'Location': redirect_url,
-                'Access-Control-Allow-Origin': '*'
-            }
+            'statusCode': status,
+            'headers': headers
         }
         
     except Exception as e:
         logger.error(f"Error in redirect_handler: {str(e)}")
         return create_response(500, {'error': 'Internal server error'})
 
+def click_log_to_dict(log) -> dict:
+    return {
+        'timestamp': log.timestamp,
+        'ip': log.ip,
+        'country': log.country,
+        'user_agent': log.user_agent
+    }
+
+@_timed
 def analytics_handler(event, context):
     try:
         slug = event['pathParameters']['slug']
         
-        repository = DynamoRepository()
-        service = LinkService(repository)
-        analytics = service.get_analytics(slug)
+        service = _get_service()
+        summary = service.get_summary(slug)
         
-        if not analytics:
+        if not summary:
             return create_response(404, {'error': 'Link not found'})
         
-        return create_response(200, {
-            'total_clicks': analytics.total_clicks,
-            'first_click': analytics.first_click,
-            'last_click': analytics.last_click,
-            'click_logs': [
-                {
-                    'timestamp': log.timestamp,
-                    'ip': log.ip,
-                    'country': log.country,
-                    'user_agent': log.user_agent
-                } for log in analytics.click_logs
-            ]
-        })
+        summary['recent_clicks'] = [click_log_to_dict(log) for log in summary['recent_clicks']]
+        return create_response(200, summary, event)
         
     except Exception as e:
         logger.error(f"Error in analytics_handler: {str(e)}")
-        return create_response(500, {'error': 'Internal server error'})
\ No newline at end of file
+        return create_response(500, {'error': 'Internal server error'})
+
+@_timed
+def stats_batch_handler(event, context):
+    try:
+        body = _json_body(event)
+        slugs = body.get('slugs') if isinstance(body, dict) else None
+        if not isinstance(slugs, list) or not all(isinstance(slug, str) for slug in slugs):
+            return create_response(400, {'error': 'slugs must be an array of strings'})
+        
+        service = _get_service()
+        stats = service.get_many_stats(slugs)
+        
+        return create_response(200, {
+            'stats': stats,
+            'missing': [slug for slug in dict.fromkeys(slugs) if slug not in stats]
+        }, event)
+        
+    except ValueError as e:
+        return create_response(400, {'error': str(e)})
+    except Exception as e:
+        logger.error(f"Error in stats_batch_handler: {str(e)}")
+        return create_response(500, {'error': 'Internal server error'})
+
+@_timed
+def clicks_handler(event, context):
+    try:
+        slug = event['pathParameters']['slug']
+        params = event.get('queryStringParameters') or {}
+        limit = parse_limit(params.get('limit'))
+        
+        service = _get_service()
+        page = service.get_click_page(slug, limit, params.get('cursor'))
+        
+        if not page:
+            return create_response(404, {'error': 'Link not found'})
+        
+        return create_response(200, {
+            'click_logs': [click_log_to_dict(log) for log in page.click_logs],
+            'next_cursor': page.next_cursor,
+            'sampled': page.sampled
+        }, event)
+        
+    except ValueError as e:
+        return create_response(400, {'error': str(e)})
+    except Exception as e:
+        logger.error(f"Error in clicks_handler: {str(e)}")
+        return create_response(500, {'error': 'Internal server error'})
+
+@_timed
+def sketch_handler(event, context):
+    # Consumes the links table's stream and folds each click batch into its link's unique-IP
+    # and user-agent sketches, so redirects only ever do atomic counter updates. Errors
+    # propagate so the stream retries the batch.
+    service = _get_service()
+    merged = service.repository.merge_stream_records(event.get('Records', []))
+    return {'merged_clicks': merged}
+
+_IMPORT_MS = (time.perf_counter() - _IMPORT_STARTED) * 1000
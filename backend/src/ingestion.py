@@ -0,0 +1,113 @@
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+from models import ClickEvent, ClickLog
+
+logger = logging.getLogger(__name__)
+
+class ClickIngestionPipeline:
+    # Redirects enqueue raw click events and return immediately; a background
+    # worker batches them, resolves the country and writes through the repository.
+    def __init__(self, repository, geo_service, max_queue_size: int = 10000,
+                 flush_size: int = 100, flush_interval: float = 1.0):
+        self.repository = repository
+        self.geo_service = geo_service
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'enqueued': 0, 'dropped': 0, 'flushed': 0, 'failed': 0, 'batches': 0}
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='click-ingestion', daemon=True)
+        self._thread.start()
+
+    def submit(self, slug: str, ip: str, user_agent: str, timestamp: Optional[int] = None) -> bool:
+        event = ClickEvent(
+            slug=slug,
+            timestamp=timestamp if timestamp is not None else int(time.time()),
+            ip=ip,
+            user_agent=user_agent
+        )
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._bump('dropped')
+            return False
+        self._bump('enqueued')
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def _bump(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+
+        # Drain whatever is still queued before shutting down
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.flush_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _collect_batch(self) -> List[ClickEvent]:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _flush(self, batch: List[ClickEvent]) -> None:
+        clicks_by_slug: Dict[str, List[ClickLog]] = {}
+        for event in batch:
+            clicks_by_slug.setdefault(event.slug, []).append(ClickLog(
+                timestamp=event.timestamp,
+                ip=event.ip,
+                user_agent=event.user_agent,
+                country=self.geo_service.get_country(event.ip)
+            ))
+
+        for slug, click_logs in clicks_by_slug.items():
+            try:
+                self.repository.log_clicks(slug, click_logs)
+                self._bump('flushed', len(click_logs))
+            except Exception as e:
+                logger.error(f"Error flushing {len(click_logs)} clicks for '{slug}': {str(e)}")
+                self._bump('failed', len(click_logs))
+        self._bump('batches')
@@ -0,0 +1,70 @@
+import time
+from typing import Dict, Iterator, List, Optional
+from models import LinkData, ClickLog, Analytics, ClickPage, LinkSummary
+from data_layer import LinkRepository
+from rollups import LinkRollup
+from pagination import DEFAULT_PAGE_SIZE
+from metrics import REGISTRY
+
+class InstrumentedRepository(LinkRepository):
+    # Records latency and errors of every repository call, labelled with the
+    # wrapped backend's class name
+    def __init__(self, repository, registry=None, backend: Optional[str] = None):
+        self.repository = repository
+        self.registry = registry if registry is not None else REGISTRY
+        self.backend = backend or type(repository).__name__
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    def _call(self, operation: str, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except Exception:
+            self.registry.inc('linkpulse_repository_errors_total', backend=self.backend, operation=operation)
+            raise
+        finally:
+            self.registry.observe('linkpulse_repository_seconds', time.perf_counter() - started,
+                                  backend=self.backend, operation=operation)
+
+    def save_link(self, link_data: LinkData, *args, **kwargs) -> None:
+        self._call('save_link', lambda: self.repository.save_link(link_data, *args, **kwargs))
+
+    def get_link(self, slug: str) -> Optional[LinkData]:
+        return self._call('get_link', self.repository.get_link, slug)
+
+    def log_click(self, slug: str, click_log: ClickLog) -> None:
+        self._call('log_click', self.repository.log_click, slug, click_log)
+
+    def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        return self._call('save_links', self.repository.save_links, link_datas, overwrite)
+
+    def log_clicks(self, slug: str, click_logs: List[ClickLog]) -> None:
+        self._call('log_clicks', self.repository.log_clicks, slug, click_logs)
+
+    def get_analytics(self, slug: str) -> Optional[Analytics]:
+        return self._call('get_analytics', self.repository.get_analytics, slug)
+
+    def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        return self._call('get_rollup', self.repository.get_rollup, slug)
+
+    def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        return self._call('get_many', self.repository.get_many, slugs)
+
+    def iter_clicks(self, slug: str) -> Iterator[ClickLog]:
+        # Lazy; the time goes to whoever consumes it
+        return self.repository.iter_clicks(slug)
+
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        return self._call('get_click_page', self.repository.get_click_page, slug, limit, cursor)
+
+    def allocate_id_block(self, size: int) -> int:
+        return self._call('allocate_id_block', self.repository.allocate_id_block, size)
+
+    def expired_slugs(self, now: int, limit: int) -> List[str]:
+        return self._call('expired_slugs', self.repository.expired_slugs, now, limit)
+
+    def delete_links(self, slugs: List[str], expired_before: Optional[int] = None) -> int:
+        return self._call('delete_links', self.repository.delete_links, slugs, expired_before)
@@ -0,0 +1,78 @@
+import json
+import os
+import time
+from typing import Iterator
+
+class ClickJournal:
+    # One JSON record per line. Writes reach the OS immediately but are only
+    # fsync'd every `fsync_every` records or `fsync_interval` seconds.
+    def __init__(self, path: str, fsync_every: int = 64, fsync_interval: float = 1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+        self.records_written = 0
+
+    def _open(self):
+        if self._file is None:
+            dir_path = os.path.dirname(self.path)
+            if dir_path:
+                os.makedirs(dir_path, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, record: dict) -> None:
+        f = self._open()
+        f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        f.flush()
+        self._pending += 1
+        self.records_written += 1
+
+        if (self._pending >= self.fsync_every or
+                time.monotonic() - self._last_fsync >= self.fsync_interval):
+            self.sync()
+
+    def sync(self) -> None:
+        if self._file is None or self._pending == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def replay(self) -> Iterator[dict]:
+        if not os.path.exists(self.path):
+            return
+        good = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                # A line without its newline is a torn write even if it parses
+                if not line.endswith(b'\n'):
+                    break
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write at the tail of the journal; everything after it is lost
+                        break
+                    yield record
+                good += len(line)
+            end = f.seek(0, os.SEEK_END)
+        if good < end:
+            # Cut the torn tail off, or the next append would be glued onto it and lost with it
+            self.close()
+            os.truncate(self.path, good)
+
+    def truncate(self) -> None:
+        self.close()
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+        self.records_written = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
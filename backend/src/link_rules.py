@@ -0,0 +1,259 @@
+import inspect
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from models import LinkData, ClickLog, ShortenResult
+from slug_allocator import SlugConflictError
+from redirect_cache import validate_policy
+from sampling import DEFAULT_SAMPLE_SIZE, validate_sample_size
+
+class UrlValidationService:
+    @staticmethod
+    def is_google_drive_url(url: str) -> bool:
+        allowed_domains = ['drive.google.com', 'docs.google.com']
+        return any(domain in url for domain in allowed_domains)
+
+    @staticmethod
+    def is_valid_url(url: str) -> bool:
+        return url.startswith(('http://', 'https://'))
+
+class LinkExpirationService:
+    @staticmethod
+    def is_expired(expires_at: Optional[int]) -> bool:
+        if expires_at is None:
+            return False
+        return int(time.time()) > expires_at
+
+    @staticmethod
+    def calculate_expiry(ttl_hours: int) -> int:
+        return int(time.time()) + (ttl_hours * 3600)
+
+# A batch item: (url, ttl_hours), optionally followed by redirect_cache and click_sample_size
+BatchItem = Tuple
+# A batch item waiting for its slug, with its expires_at, redirect_cache and click_sample_size
+PendingLink = Tuple[ShortenResult, Optional[int], Optional[str], int]
+
+class ShortLinkRules:
+    # Shorten and redirect as LinkBusinessService, the Lambda LinkService and
+    # AsyncLinkBusinessService all do them. The flows (the _*_flow generators) never
+    # call the repository, allocator or geo service themselves: they yield
+    # (function, *args) and get back its result or exception, so _run performs
+    # the calls blocking and _run_async awaits the ones that are coroutines.
+    # Subclasses set repository, slug_allocator, metrics, deduplicator,
+    # click_pipeline and geo_service; this module stays off data_layer so the
+    # Lambda cold start doesn't load it.
+    MAX_BATCH_SIZE = 1000
+
+    @staticmethod
+    def expires_at(ttl_hours: int) -> Optional[int]:
+        return LinkExpirationService.calculate_expiry(ttl_hours) if ttl_hours > 0 else None
+
+    @staticmethod
+    def check_options(redirect_cache: Optional[str], click_sample_size: Optional[int]) -> int:
+        # Raises ValueError for a bad option; returns the link's click sample size
+        validate_policy(redirect_cache)
+        validate_sample_size(click_sample_size)
+        # Links that don't ask for a sample size get the deployment default
+        return DEFAULT_SAMPLE_SIZE if click_sample_size is None else click_sample_size
+
+    @staticmethod
+    def check_link(validate_url: Callable[[str], None], original_url: str, ttl_hours: int,
+                   redirect_cache: Optional[str], click_sample_size: Optional[int]) -> Tuple[Optional[int], int]:
+        # Raises ValueError for a bad request; returns the link's expires_at and click sample size
+        validate_url(original_url)
+        click_sample_size = ShortLinkRules.check_options(redirect_cache, click_sample_size)
+        return ShortLinkRules.expires_at(ttl_hours), click_sample_size
+
+    @staticmethod
+    def check_batch(validate_url: Callable[[str], None], items: List[BatchItem],
+                    max_items: int) -> Tuple[List[ShortenResult], List[PendingLink]]:
+        # Invalid items fail individually and the rest come back pending
+        if len(items) > max_items:
+            raise ValueError(f"At most {max_items} links per batch")
+        results = []
+        pending = []
+        for item in items:
+            original_url, ttl_hours, redirect_cache, click_sample_size = (*item, None, None)[:4]
+            result = ShortenResult(original_url=original_url)
+            results.append(result)
+            try:
+                if not original_url:
+                    raise ValueError("URL is required")
+                validate_url(original_url)
+                if isinstance(ttl_hours, bool) or not isinstance(ttl_hours, int) or ttl_hours < 0:
+                    raise ValueError("Invalid ttl_hours")
+                click_sample_size = ShortLinkRules.check_options(redirect_cache, click_sample_size)
+            except ValueError as e:
+                result.error = str(e)
+                continue
+            pending.append((result, ShortLinkRules.expires_at(ttl_hours), redirect_cache, click_sample_size))
+        return results, pending
+
+    @staticmethod
+    def new_link(slug: str, original_url: str, expires_at: Optional[int], redirect_cache: Optional[str] = None,
+                 click_sample_size: Optional[int] = DEFAULT_SAMPLE_SIZE,
+                 created_at: Optional[int] = None) -> LinkData:
+        return LinkData(
+            slug=slug,
+            original_url=original_url,
+            created_at=int(time.time()) if created_at is None else created_at,
+            expires_at=expires_at,
+            click_count=0,
+            redirect_cache=redirect_cache,
+            click_sample_size=click_sample_size
+        )
+
+    @staticmethod
+    def assign_slugs(pending: List[PendingLink], slugs: List[str]) -> List[LinkData]:
+        # Block slugs are unique by construction, so the whole batch is built up front for one write
+        created_at = int(time.time())
+        for (result, expires_at, redirect_cache, click_sample_size), slug in zip(pending, slugs):
+            result.link_data = ShortLinkRules.new_link(slug, result.original_url, expires_at, redirect_cache,
+                                                       click_sample_size, created_at)
+        return [result.link_data for result, *_ in pending]
+
+    @staticmethod
+    def conflicted(pending: List[PendingLink], conflicts: List[str]) -> List[PendingLink]:
+        # A block slug is only taken if it was handed out before (e.g. under another SLUG_KEY);
+        # those links go on to get a fresh slug through the conditional write
+        taken = set(conflicts)
+        return [item for item in pending if item[0].link_data.slug in taken]
+
+    @staticmethod
+    def admit_redirect(link_data: Optional[LinkData], slug: str, ip: str, user_agent: str, metrics,
+                       deduplicator=None) -> Tuple[Optional[LinkData], bool]:
+        # The link to redirect to (None if it is missing or expired) and whether to store the click
+        if not link_data:
+            metrics.inc('linkpulse_redirects_total', result='not_found')
+            return None, False
+        if LinkExpirationService.is_expired(link_data.expires_at):
+            metrics.inc('linkpulse_redirects_total', result='expired')
+            return None, False
+        metrics.inc('linkpulse_redirects_total', result='found')
+        # Repeats of a click stored moments ago are only counted, not written
+        if deduplicator is not None and not deduplicator.should_store(slug, ip, user_agent):
+            metrics.inc('linkpulse_clicks_total', outcome='suppressed')
+            return link_data, False
+        metrics.inc('linkpulse_clicks_total', outcome='stored')
+        return link_data, True
+
+    @staticmethod
+    def many_stats(repository, slugs: List[str], max_items: int) -> Dict[str, dict]:
+        # One batched read of summary fields; recent clicks are left to the per-link endpoints
+        if len(slugs) > max_items:
+            raise ValueError(f"At most {max_items} slugs per request")
+
+        return {
+            slug: {
+                'original_url': summary.link_data.original_url,
+                'created_at': summary.link_data.created_at,
+                'expires_at': summary.link_data.expires_at,
+                'total_clicks': summary.link_data.click_count,
+                'first_click': summary.first_click,
+                'last_click': summary.last_click,
+                'unique_countries': summary.unique_countries
+            } for slug, summary in repository.get_many(slugs).items()
+        }
+
+    def _validate_url(self, original_url: str) -> None:
+        # Validate URL format
+        if not self.url_validator.is_valid_url(original_url):
+            raise ValueError("Invalid URL format")
+
+        # Validate Google Drive URL
+        if not self.url_validator.is_google_drive_url(original_url):
+            raise ValueError("Only Google Drive URLs are allowed")
+
+    def _next_slugs(self, count: int) -> List[str]:
+        return [self.slug_allocator.next_slug() for _ in range(count)]
+
+    def _create_link_flow(self, original_url: str, ttl_hours: int, redirect_cache: Optional[str],
+                          click_sample_size: Optional[int]):
+        with self.metrics.timer('linkpulse_stage_seconds', operation='shorten', stage='validate'):
+            expires_at, click_sample_size = self.check_link(self._validate_url, original_url, ttl_hours,
+                                                            redirect_cache, click_sample_size)
+
+        # Save under a fresh slug; the repository rejects one that is already taken
+        with self.metrics.timer('linkpulse_stage_seconds', operation='shorten', stage='save'):
+            return (yield from self._save_flow(original_url, expires_at, redirect_cache, click_sample_size))
+
+    def _create_links_flow(self, items: List[BatchItem]):
+        # Invalid items fail individually, the rest are saved together
+        results, pending = self.check_batch(self._validate_url, items, self.MAX_BATCH_SIZE)
+        # Random slugs can collide, so each one still needs its conditional write
+        retry = pending
+        if self.slug_allocator.unique:
+            links = self.assign_slugs(pending, (yield (self._next_slugs, len(pending))))
+            retry = self.conflicted(pending, (yield (self.repository.save_links, links, False)))
+        for result, expires_at, redirect_cache, click_sample_size in retry:
+            try:
+                result.link_data = yield from self._save_flow(result.original_url, expires_at, redirect_cache,
+                                                              click_sample_size)
+            except RuntimeError as e:
+                result.link_data, result.error = None, str(e)
+        return results
+
+    def _save_flow(self, original_url: str, expires_at: Optional[int], redirect_cache: Optional[str] = None,
+                   click_sample_size: Optional[int] = DEFAULT_SAMPLE_SIZE, max_attempts: int = 10):
+        # No existence check: the conditional write rejects a taken slug
+        for _ in range(max_attempts):
+            slug, = yield (self._next_slugs, 1)
+            link_data = self.new_link(slug, original_url, expires_at, redirect_cache, click_sample_size)
+            try:
+                yield (self.repository.save_link, link_data, False)
+                return link_data
+            except SlugConflictError:
+                continue
+        raise RuntimeError("Unable to generate unique slug")
+
+    def _redirect_flow(self, slug: str, ip: str, user_agent: str):
+        with self.metrics.timer('linkpulse_stage_seconds', operation='redirect', stage='get_link'):
+            link_data = yield (self.repository.get_link, slug)
+        link_data, store = self.admit_redirect(link_data, slug, ip, user_agent, self.metrics, self.deduplicator)
+        if not store:
+            return link_data
+        # Hand the click to the background pipeline when one is configured
+        if self.click_pipeline is not None:
+            with self.metrics.timer('linkpulse_stage_seconds', operation='redirect', stage='enqueue'):
+                self.click_pipeline.submit(slug, ip, user_agent)
+            return link_data
+
+        with self.metrics.timer('linkpulse_stage_seconds', operation='redirect', stage='geo'):
+            country = yield (self.geo_service.get_country, ip)
+        click_log = ClickLog(
+            timestamp=int(time.time()),
+            ip=ip,
+            user_agent=user_agent,
+            country=country
+        )
+
+        with self.metrics.timer('linkpulse_stage_seconds', operation='redirect', stage='log_click'):
+            yield (self.repository.log_click, slug, click_log)
+        return link_data
+
+    @staticmethod
+    def _run(flow):
+        result, error = None, None
+        while True:
+            try:
+                call = flow.throw(error) if error is not None else flow.send(result)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result, error = call[0](*call[1:]), None
+            except Exception as e:
+                result, error = None, e
+
+    @staticmethod
+    async def _run_async(flow):
+        result, error = None, None
+        while True:
+            try:
+                call = flow.throw(error) if error is not None else flow.send(result)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result, error = call[0](*call[1:]), None
+                if inspect.isawaitable(result):
+                    result = await result
+            except Exception as e:
+                result, error = None, e
@@ -1,157 +1,120 @@
-import secrets
-import string
-import time
-import requests
-from typing import Optional
+from typing import Optional, Iterator, List, Tuple, Dict
 from abc import ABC, abstractmethod
-from models import LinkData, ClickLog, Analytics
+from models import LinkData, ClickLog, Analytics, ClickPage, ShortenResult
 from data_layer import LinkRepository
-
-class SlugGeneratorService:
-    @staticmethod
-    def generate(length: int = 7) -> str:
-        chars = string.ascii_letters + string.digits
-        return ''.join(secrets.choice(chars) for _ in range(length))
-
-class UrlValidationService:
-    @staticmethod
-    def is_google_drive_url(url: str) -> bool:
-        allowed_domains = ['drive.google.com', 'docs.google.com']
-        return any(domain in url for domain in allowed_domains)
-    
-    @staticmethod
-    def is_valid_url(url: str) -> bool:
-        return url.startswith(('http://', 'https://'))
+from slug_allocator import RandomSlugAllocator
+from pagination import DEFAULT_PAGE_SIZE
+from metrics import REGISTRY
+from geo_resolver import default_resolver
+from link_rules import BatchItem, UrlValidationService, LinkExpirationService, ShortLinkRules
 
 class GeoLocationService:
-    @staticmethod
-    def get_country(ip: str) -> str:
-        if ip in ['127.0.0.1', 'localhost', '::1']:
-            return 'Local'
-        
-        try:
-            response = requests.get(f'https://ipinfo.io/{ip}/json', timeout=2)
-            if response.status_code == 200:
-                return response.json().get('country', 'Unknown')
-        except:
-            pass
-        return 'Unknown'
-
-class LinkExpirationService:
-    @staticmethod
-    def is_expired(expires_at: Optional[int]) -> bool:
-        if expires_at is None:
-            return False
-        return int(time.time()) > expires_at
+    def __init__(self, resolver=None):
+        # Offline range-table lookup by default; see geo_resolver for the HTTP fallback
+        self.resolver = resolver if resolver is not None else default_resolver()
     
-    @staticmethod
-    def calculate_expiry(ttl_hours: int) -> int:
-        return int(time.time()) + (ttl_hours * 3600)
+    def get_country(self, ip: str) -> str:
+        return self.resolver.get_country(ip)
 
-class LinkBusinessService:
-    def __init__(self, repository: LinkRepository):
+class LinkBusinessService(ShortLinkRules):
+    def __init__(self, repository: LinkRepository, click_pipeline=None, geo_service=None,
+                 slug_allocator=None, metrics=None, deduplicator=None):
         self.repository = repository
-        self.slug_generator = SlugGeneratorService()
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.deduplicator = deduplicator
+        self.click_pipeline = click_pipeline
+        self.slug_allocator = slug_allocator if slug_allocator is not None else RandomSlugAllocator()
         self.url_validator = UrlValidationService()
-        self.geo_service = GeoLocationService()
+        self.geo_service = geo_service if geo_service is not None else GeoLocationService()
         self.expiration_service = LinkExpirationService()
     
-    def create_short_link(self, original_url: str, ttl_hours: int = 24) -> LinkData:
-        # Validate URL format
-        if not self.url_validator.is_valid_url(original_url):
-            raise ValueError("Invalid URL format")
-        
-        # Validate Google Drive URL
-        if not self.url_validator.is_google_drive_url(original_url):
-            raise ValueError("Only Google Drive URLs are allowed")
-        
-        # Generate unique slug
-        slug = self._generate_unique_slug()
-        
-        # Calculate expiration
-        expires_at = self.expiration_service.calculate_expiry(ttl_hours) if ttl_hours > 0 else None
-        
-        # Create link data
-        link_data = LinkData(
-            slug=slug,
-            original_url=original_url,
-            created_at=int(time.time()),
-            expires_at=expires_at,
-            click_count=0
-        )
-        
-        # Save to repository
-        self.repository.save_link(link_data)
-        return link_data
+    def create_short_link(self, original_url: str, ttl_hours: int = 24,
+                          redirect_cache: Optional[str] = None,
+                          click_sample_size: Optional[int] = None) -> LinkData:
+        return self._run(self._create_link_flow(original_url, ttl_hours, redirect_cache, click_sample_size))
+    
+    def create_short_links(self, items: List[BatchItem]) -> List[ShortenResult]:
+        return self._run(self._create_links_flow(items))
     
     def get_redirect_url(self, slug: str, ip: str, user_agent: str) -> Optional[str]:
-        # Get link data
-        link_data = self.repository.get_link(slug)
-        print(f"Debug: Looking for slug '{slug}', found: {link_data is not None}")
-        if not link_data:
-            return None
-        
-        # Check expiration
-        if self.expiration_service.is_expired(link_data.expires_at):
-            return None
-        
-        # Log click
-        country = self.geo_service.get_country(ip)
-        click_log = ClickLog(
-            timestamp=int(time.time()),
-            ip=ip,
-            user_agent=user_agent,
-            country=country
-        )
-        
-        self.repository.log_click(slug, click_log)
-        return link_data.original_url
+        link_data = self.resolve_redirect(slug, ip, user_agent)
+        return link_data.original_url if link_data else None
+    
+    def resolve_redirect(self, slug: str, ip: str, user_agent: str) -> Optional[LinkData]:
+        return self._run(self._redirect_flow(slug, ip, user_agent))
     
     def get_link_analytics(self, slug: str) -> Optional[Analytics]:
         return self.repository.get_analytics(slug)
     
-    def _generate_unique_slug(self, max_attempts: int = 10) -> str:
-        for _ in range(max_attempts):
-            slug = self.slug_generator.generate()
-            if not self.repository.get_link(slug):
-                return slug
-        raise RuntimeError("Unable to generate unique slug")
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        return self.repository.get_click_page(slug, limit, cursor)
+    
+    def export_clicks(self, slug: str) -> Optional[Tuple[Iterator[ClickLog], bool]]:
+        # Every kept click, and whether they are only a sample of the link's; a one-click
+        # page answers both that and whether the link exists from the backend's own counts
+        page = self.repository.get_click_page(slug, 1)
+        if page is None:
+            return None
+        return self.repository.iter_clicks(slug), page.sampled
 
 class AnalyticsService:
+    MAX_BATCH_SIZE = 1000
+    
     def __init__(self, repository: LinkRepository):
         self.repository = repository
     
+    def get_link_summary(self, slug: str) -> Optional[dict]:
+        rollup = self.repository.get_rollup(slug)
+        if not rollup:
+            return None
+        
+        return {
+            'total_clicks': rollup.total_clicks,
+            'first_click': rollup.first_click,
+            'last_click': rollup.last_click,
+            'recent_clicks': rollup.recent_clicks
+        }
+    
     def get_link_stats(self, slug: str) -> Optional[dict]:
-        analytics = self.repository.get_analytics(slug)
-        if not analytics:
+        rollup = self.repository.get_rollup(slug)
+        if not rollup:
             return None
         
         return {
-            'total_clicks': analytics.total_clicks,
-            'first_click': analytics.first_click,
-            'last_click': analytics.last_click,
-            'unique_countries': len(set(log.country for log in analytics.click_logs)),
-            'recent_clicks': analytics.click_logs[-10:] if analytics.click_logs else []
+            'total_clicks': rollup.total_clicks,
+            'first_click': rollup.first_click,
+            'last_click': rollup.last_click,
+            'unique_countries': len(rollup.countries),
+            'recent_clicks': rollup.recent_clicks,
+            # Sketch estimates, reported with their error bounds
+            'unique_ips': {
+                'estimate': rollup.unique_ips.count(),
+                'relative_error': round(rollup.unique_ips.relative_error, 4)
+            },
+            'top_user_agents': {
+                'items': [{'user_agent': agent, 'clicks': clicks} for agent, clicks in rollup.user_agents.top()],
+                # Counts never undercount and overcount by at most this many clicks with this confidence
+                'max_overcount': rollup.user_agents.sketch.error_bound(),
+                'confidence': round(1 - rollup.user_agents.sketch.delta, 4)
+            },
+            # Countries are few enough to count exactly
+            'top_countries': [
+                {'country': country, 'clicks': clicks}
+                for country, clicks in sorted(rollup.countries.items(), key=lambda item: (-item[1], item[0]))[:10]
+            ]
         }
     
+    def get_many_stats(self, slugs: List[str]) -> Dict[str, dict]:
+        return ShortLinkRules.many_stats(self.repository, slugs, self.MAX_BATCH_SIZE)
+    
     def get_click_trends(self, slug: str) -> Optional[dict]:
-        analytics = self.repository.get_analytics(slug)
-        if not analytics:
+        rollup = self.repository.get_rollup(slug)
+        if not rollup:
             return None
         
-        # Group clicks by hour
-        hourly_clicks = {}
-        for log in analytics.click_logs:
-            hour = log.timestamp // 3600 * 3600
-            hourly_clicks[hour] = hourly_clicks.get(hour, 0) + 1
-        
         return {
-            'hourly_distribution': hourly_clicks,
-            'country_distribution': self._get_country_stats(analytics.click_logs)
+            'hourly_distribution': rollup.hourly,
+            'country_distribution': rollup.countries
         }
     
-    def _get_country_stats(self, click_logs: list) -> dict:
-        country_counts = {}
-        for log in click_logs:
-            country_counts[log.country] = country_counts.get(log.country, 0) + 1
-        return country_counts
\ No newline at end of file
@@ -0,0 +1,172 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Upper bounds in seconds, from a cache hit to a slow DynamoDB retry
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class _Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self, bucket_count: int):
+        # One slot per bound plus +Inf; rendered cumulatively
+        self.counts = [0] * (bucket_count + 1)
+        self.total = 0.0
+        self.count = 0
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'started')
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+class _Capture:
+    def __init__(self, local):
+        self.local = local
+        self.stages: Dict[str, float] = {}
+
+    def __enter__(self) -> Dict[str, float]:
+        self.previous = getattr(self.local, 'stages', None)
+        self.local.stages = self.stages
+        return self.stages
+
+    def __exit__(self, exc_type, exc, tb):
+        self.local.stages = self.previous
+        return False
+
+class MetricsRegistry:
+    # Latency histograms and counters keyed by metric name and label values.
+    # Recording is a perf_counter pair, a bisect and one short lock, cheap
+    # enough to leave on in production.
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # (name, labels in call order) -> (sorted labels, histogram), so the hot path skips the sort
+        self._resolved: Dict[tuple, Tuple[Labels, _Histogram]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def timer(self, name: str, **labels) -> _Timer:
+        return _Timer(self, name, labels)
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        resolved = self._resolved.get((name, *labels.items()))
+        if resolved is None:
+            resolved = self._resolve(name, labels)
+        key, histogram = resolved
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram.counts[index] += 1
+            histogram.total += seconds
+            histogram.count += 1
+        stages = getattr(self._local, 'stages', None)
+        if stages is not None:
+            stage = '.'.join(str(value) for _, value in key)
+            stages[stage] = stages.get(stage, 0.0) + seconds * 1000
+
+    def _resolve(self, name: str, labels: dict) -> Tuple[Labels, _Histogram]:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(self.buckets))
+            resolved = self._resolved[(name, *labels.items())] = (key, histogram)
+        return resolved
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def capture(self) -> _Capture:
+        # Collects the milliseconds this thread spends in each timed stage, for per-request logs
+        return _Capture(self._local)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': {
+                    name: {_label_text(key): value for key, value in series.items()}
+                    for name, series in self._counters.items()
+                },
+                'histograms': {
+                    name: {
+                        _label_text(key): {'count': histogram.count, 'sum': histogram.total}
+                        for key, histogram in series.items()
+                    } for name, series in self._histograms.items()
+                }
+            }
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                self._header(lines, name, 'counter')
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f'{name}{_label_text(key)} {_number(value)}')
+            for name in sorted(self._histograms):
+                self._header(lines, name, 'histogram')
+                for key, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (None,), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound is None else repr(bound)
+                        lines.append(f'{name}_bucket{_label_text(key + (("le", le),))} {cumulative}')
+                    lines.append(f'{name}_sum{_label_text(key)} {_number(histogram.total)}')
+                    lines.append(f'{name}_count{_label_text(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._resolved.clear()
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        help_text = self._help.get(name, (kind, ''))[1]
+        if help_text:
+            lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+def _label_text(key: Labels) -> str:
+    if not key:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in key)
+    return '{' + pairs + '}'
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+# Shared by the services, repositories and both entry points
+REGISTRY = MetricsRegistry()
+REGISTRY.describe('linkpulse_stage_seconds', 'histogram', 'Time spent in each stage of a service operation')
+REGISTRY.describe('linkpulse_repository_seconds', 'histogram', 'Repository call latency by backend')
+REGISTRY.describe('linkpulse_repository_errors_total', 'counter', 'Repository calls that raised')
+REGISTRY.describe('linkpulse_redirects_total', 'counter', 'Redirect lookups by outcome')
+REGISTRY.describe('linkpulse_clicks_total', 'counter', 'Redirect clicks stored or suppressed as repeats')
+REGISTRY.describe('linkpulse_http_request_seconds', 'histogram', 'Request latency by endpoint and status')
+REGISTRY.describe('linkpulse_handler_seconds', 'histogram', 'Lambda handler latency')
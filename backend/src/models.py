@@ -9,6 +9,10 @@ class LinkData:
     created_at: int
     expires_at: Optional[int]
     click_count: int = 0
+    # None keeps redirects uncacheable; 'temporary' (302) or 'permanent' (301) lets clients cache them
+    redirect_cache: Optional[str] = None
+    # None keeps every raw click; otherwise at most this many are kept (see sampling)
+    click_sample_size: Optional[int] = None
 
 @dataclass
 class ClickLog:
@@ -22,4 +26,32 @@ class Analytics:
     total_clicks: int
     first_click: Optional[int]
     last_click: Optional[int]
-    click_logs: List[ClickLog]
\ No newline at end of file
+    click_logs: List[ClickLog]
+    # True when click_logs is a sample of total_clicks rather than every click
+    sampled: bool = False
+
+@dataclass
+class ClickEvent:
+    slug: str
+    timestamp: int
+    ip: str
+    user_agent: str
+
+@dataclass
+class ClickPage:
+    click_logs: List[ClickLog]
+    next_cursor: Optional[str]
+    sampled: bool = False
+
+@dataclass
+class LinkSummary:
+    link_data: LinkData
+    first_click: Optional[int]
+    last_click: Optional[int]
+    unique_countries: int
+
+@dataclass
+class ShortenResult:
+    original_url: Optional[str]
+    link_data: Optional[LinkData] = None
+    error: Optional[str] = None
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import random
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from models import LinkData
+
+# LinkData.redirect_cache values; None keeps the uncacheable 302
+REDIRECT_CACHE_POLICIES = ('temporary', 'permanent')
+# Upper bound on max-age even for links that never expire, so a changed policy still reaches clients
+MAX_AGE_SECONDS = int(os.environ.get('LINKPULSE_REDIRECT_MAX_AGE', 86400))
+# Share of cacheable redirects served as no-store instead. A cached redirect never reaches us, so this
+# keeps a sample of every client's clicks coming back to be counted; 0 turns it off
+PASSTHROUGH_RATE = float(os.environ.get('LINKPULSE_REDIRECT_PASSTHROUGH', 0.1))
+
+def validate_policy(policy: Optional[str]) -> None:
+    if policy is not None and policy not in REDIRECT_CACHE_POLICIES:
+        raise ValueError(f"redirect_cache must be one of: {', '.join(REDIRECT_CACHE_POLICIES)}")
+
+def redirect_response(link_data: LinkData, if_none_match: Optional[str] = None,
+                      if_modified_since: Optional[str] = None, now: Optional[int] = None,
+                      passthrough: Optional[bool] = None) -> Tuple[int, Dict[str, str]]:
+    # Status and headers for a redirect to link_data, including 304 for a matching conditional request
+    headers = {'Location': link_data.original_url}
+    if link_data.redirect_cache is None:
+        return 302, headers
+    if passthrough is None:
+        passthrough = random.random() < PASSTHROUGH_RATE
+    if passthrough:
+        # Also answers revalidations, so the client's next click comes back here as well
+        headers['Cache-Control'] = 'no-store'
+        return 302, headers
+
+    now = int(time.time()) if now is None else now
+    max_age = MAX_AGE_SECONDS
+    if link_data.expires_at is not None:
+        # Never cached past expiry, so an expired link is seen as gone rather than still redirecting
+        max_age = min(max_age, link_data.expires_at - now)
+    headers['Cache-Control'] = f'public, max-age={max_age}' if max_age > 0 else 'no-cache'
+    headers['ETag'] = etag(link_data)
+    headers['Last-Modified'] = formatdate(link_data.created_at, usegmt=True)
+
+    if _not_modified(link_data, headers['ETag'], if_none_match, if_modified_since):
+        return 304, headers
+    return (301 if link_data.redirect_cache == 'permanent' else 302), headers
+
+def etag(link_data: LinkData) -> str:
+    # Changes whenever anything a cached redirect depends on does
+    digest = hashlib.blake2b(
+        f'{link_data.slug}\0{link_data.original_url}\0{link_data.expires_at}\0{link_data.redirect_cache}'.encode(),
+        digest_size=12
+    ).hexdigest()
+    return f'"{digest}"'
+
+def _not_modified(link_data: LinkData, current: str, if_none_match: Optional[str],
+                  if_modified_since: Optional[str]) -> bool:
+    # If-None-Match wins when both are sent, as RFC 9110 requires
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or current in tags
+    if if_modified_since is not None:
+        try:
+            return link_data.created_at <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
@@ -1,83 +1,842 @@
 import boto3
 import json
 import os
-from typing import Optional
+import random
+import secrets
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
 from boto3.dynamodb.conditions import Key
-from models import LinkData, ClickLog, Analytics
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from models import LinkData, ClickLog, Analytics, ClickPage, LinkSummary
+from slug_allocator import SlugConflictError
+from rollups import LinkRollup, RECENT_CLICKS
+from sampling import sample_slot, sample_page, is_sampled
+from sketches import HyperLogLog, TopK
+from pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+
+# Only these attributes are read on the redirect path
+LINK_PROJECTION = '#slug, original_url, created_at, expires_at, click_count, redirect_cache, click_sample_size'
+LINK_PROJECTION_NAMES = {'#slug': 'slug'}
+# hourly_clicks is only on link items written before hours had their own items
+ROLLUP_PROJECTION = ('click_count, first_click, last_click, hourly_clicks, country_clicks, '
+                     'unique_ips, user_agents, click_sample_size, counter_shards, counter_epoch')
+# A link's clicks per hour are counted on 'hour#<hour>' items in the clicks table, so the
+# link item stays the same size however long it takes clicks. Promoted links count them
+# on 'hour#<hour>#c<n>', next to the counter item that took the batch.
+HOUR_PREFIX = 'hour#'
+# A link's sketches live on a '<slug>#sketch' item that only merge_stream_records writes,
+# off the redirect path: each click update leaves its batch in click_batch, and the
+# links table's stream carries it to the sketch consumer. Sketches are replaced whole,
+# guarded by sketch_version in case two consumers (or rebuild_rollups) meet.
+# merged_sequences keeps the last stream sequence number merged from each item that
+# carried clicks (the link item or a counter item), so redelivered records are skipped.
+SKETCH_PROJECTION = 'sketch_version, unique_ips, user_agents, merged_sequences'
+SKETCH_ATTEMPTS = 5
+# get_many reads the link and its totals but never the hour or click items
+SUMMARY_PROJECTION = LINK_PROJECTION + ', first_click, last_click, country_clicks, counter_shards, counter_epoch'
+# What is read from a promoted link's counter items to total it up
+COUNTER_TOTALS_PROJECTION = '#slug, click_count, first_click, last_click, country_clicks'
+# A hot link's clicks are counted on counter items '<slug>#<epoch>#c<n>' in the links table
+# instead of its own item, so its writes spread over counter_shards partitions. Each
+# promotion picks a new epoch, so a link saved again never inherits old counts.
+COUNTER_SHARDS = int(os.environ.get('LINKPULSE_COUNTER_SHARDS', 10))
+# Clicks per second on a link, across all containers, that get it promoted; 0 turns it off
+HOT_LINK_CLICKS_PER_SECOND = float(os.environ.get('LINKPULSE_HOT_LINK_CLICKS_PER_SECOND', 50))
+# A link item throttled even after boto3's retries is promoted straight away
+THROTTLING_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+BATCH_GET_LIMIT = 100
+BATCH_GET_ATTEMPTS = 8
+# transact_write_items takes at most 100 actions
+TRANSACT_LIMIT = 100
+# Slug id counter for allocate_id_block; '#' never appears in a generated slug
+ALLOCATOR_KEY = '#alloc'
+
+def create_tables(dynamodb, table_name: str, clicks_table_name: str):
+    # Mirrors template.yaml; used by local stand-ins and tests
+    links = dynamodb.create_table(
+        TableName=table_name,
+        KeySchema=[{'AttributeName': 'slug', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'slug', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST',
+        StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+    )
+    clicks = dynamodb.create_table(
+        TableName=clicks_table_name,
+        KeySchema=[
+            {'AttributeName': 'slug', 'KeyType': 'HASH'},
+            {'AttributeName': 'click_id', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'slug', 'AttributeType': 'S'},
+            {'AttributeName': 'click_id', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    return links, clicks
+
+def counter_key(slug: str, epoch: str, index: int) -> str:
+    return f'{slug}#{epoch}#c{index}'
+
+def sketch_key(slug: str) -> str:
+    return f'{slug}#sketch'
+
+class WriteRateTracker:
+    # Click rate per slug in fixed windows, read off the link's shared click_count rather
+    # than counted here, so every container's clicks are in it: record() takes the count
+    # before and after one of this container's updates. It is True once per window for a
+    # slug whose count rose by clicks_per_second on average since the container's first
+    # update in the window.
+    def __init__(self, clicks_per_second: float, window_seconds: float = 10.0, clock=time.monotonic):
+        self.threshold = clicks_per_second * window_seconds
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self._window = None
+        self._starts: Dict[str, int] = {}
+        self._fired = set()
+        self._lock = threading.Lock()
+
+    def record(self, slug: str, count_before: int, count_after: int) -> bool:
+        window = int(self.clock() // self.window_seconds)
+        with self._lock:
+            if window != self._window:
+                # Only slugs written in the current window are tracked
+                self._window = window
+                self._starts = {}
+                self._fired = set()
+            start = self._starts.setdefault(slug, count_before)
+            if slug in self._fired or count_after - start < self.threshold:
+                return False
+            self._fired.add(slug)
+            return True
 
 class DynamoRepository:
-    def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb')
-        self.table = self.dynamodb.Table(os.environ['TABLE_NAME'])
+    def __init__(self, table_name: Optional[str] = None, clicks_table_name: Optional[str] = None,
+                 dynamodb=None, counter_shards: int = COUNTER_SHARDS,
+                 hot_link_clicks_per_second: float = HOT_LINK_CLICKS_PER_SECOND):
+        self.dynamodb = dynamodb or boto3.resource('dynamodb')
+        self.table = self.dynamodb.Table(table_name or os.environ['TABLE_NAME'])
+        self.clicks_table = self.dynamodb.Table(clicks_table_name or os.environ['CLICKS_TABLE_NAME'])
+        self.counter_shards = counter_shards
+        self.hot_links = WriteRateTracker(hot_link_clicks_per_second) if hot_link_clicks_per_second > 0 else None
+        # Promoted links this container has seen: (counter_shards, counter_epoch, clicks counted
+        # on the link item before promotion)
+        self._counters: Dict[str, Tuple[int, str, int]] = {}
 
-    def save_link(self, link_data: LinkData):
-        item = {
-            'slug': link_data.slug,
-            'original_url': link_data.original_url,
-            'created_at': link_data.created_at,
-            'click_count': link_data.click_count,
-            'click_logs': []
-        }
-        if link_data.expires_at:
-            item['expires_at'] = link_data.expires_at
-        
-        self.table.put_item(Item=item)
+    def save_link(self, link_data: LinkData, overwrite: bool = True):
+        item = self._link_item(link_data)
+        if overwrite:
+            # A re-saved link starts over on its own item
+            self._counters.pop(link_data.slug, None)
+            self.table.put_item(Item=item)
+            return
+        # The conditional write is the uniqueness check; nothing is read first
+        try:
+            self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(slug)')
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                raise SlugConflictError(link_data.slug)
+            raise
+
+    def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        if overwrite:
+            # batch_write_item in chunks of 25; the writer resends unprocessed items
+            with self.table.batch_writer(overwrite_by_pkeys=['slug']) as batch:
+                for link_data in link_datas:
+                    self._counters.pop(link_data.slug, None)
+                    batch.put_item(Item=self._link_item(link_data))
+            return []
+        # batch_write_item can't be conditional, so new links go in transactions of conditional
+        # puts; a cancelled one names the taken slugs, and the rest are written again without them.
+        # The resource's client takes the same Python values as the table does.
+        conflicts = []
+        for start in range(0, len(link_datas), TRANSACT_LIMIT):
+            items = [self._link_item(link_data) for link_data in link_datas[start:start + TRANSACT_LIMIT]]
+            while items:
+                try:
+                    self.dynamodb.meta.client.transact_write_items(TransactItems=[{'Put': {
+                        'TableName': self.table.name,
+                        'Item': item,
+                        'ConditionExpression': 'attribute_not_exists(slug)'
+                    }} for item in items])
+                    break
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'TransactionCanceledException':
+                        raise
+                    reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+                    if 'ConditionalCheckFailed' not in reasons:
+                        raise
+                    conflicts += [item['slug'] for item, reason in zip(items, reasons)
+                                  if reason == 'ConditionalCheckFailed']
+                    items = [item for item, reason in zip(items, reasons) if reason != 'ConditionalCheckFailed']
+        return conflicts
 
     def get_link(self, slug: str) -> Optional[LinkData]:
         try:
-            response = self.table.get_item(Key={'slug': slug})
+            response = self.table.get_item(
+                Key={'slug': slug},
+                ProjectionExpression=LINK_PROJECTION,
+                ExpressionAttributeNames=LINK_PROJECTION_NAMES
+            )
             if 'Item' not in response:
                 return None
-            
+
             item = response['Item']
-            return LinkData(
+            link_data = LinkData(
                 slug=item['slug'],
                 original_url=item['original_url'],
-                created_at=item['created_at'],
-                expires_at=item.get('expires_at'),
-                click_count=item.get('click_count', 0)
+                created_at=int(item['created_at']),
+                expires_at=int(item['expires_at']) if 'expires_at' in item else None,
+                click_count=int(item.get('click_count', 0)),
+                redirect_cache=item.get('redirect_cache'),
+                click_sample_size=int(item['click_sample_size']) if 'click_sample_size' in item else None
             )
+            return link_data
         except:
             return None
 
     def log_click(self, slug: str, click_log: ClickLog):
-        self.table.update_item(
+        self.log_clicks(slug, [click_log])
+
+    def log_clicks(self, slug: str, click_logs: List[ClickLog]):
+        if not click_logs:
+            return
+
+        # Only count clicks against links that exist
+        tracked = self.hot_links is not None and slug not in self._counters
+        try:
+            updated = self._update_counters(slug, click_logs)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in THROTTLING_ERRORS and tracked:
+                self.promote_counters(slug)
+            elif code == 'ValidationException':
+                # Items created before rollups existed have no map to update yet
+                self.table.update_item(
+                    Key={'slug': slug},
+                    UpdateExpression='SET country_clicks = if_not_exists(country_clicks, :empty)',
+                    ConditionExpression='attribute_exists(slug)',
+                    ExpressionAttributeValues={':empty': {}}
+                )
+            else:
+                raise
+            updated = self._update_counters(slug, click_logs)
+        if not updated:
+            return
+        # Click items share the link's TTL, read with the counters so it never depends on what this container saw
+        clicks_before, sample_size, expires_at, hour_suffix = updated
+        if tracked and slug not in self._counters:
+            # clicks_before is the link item's own count here, which all containers move
+            if self.hot_links.record(slug, clicks_before, clicks_before + len(click_logs)):
+                self.promote_counters(slug)
+
+        self._add_hourly(slug, click_logs, expires_at, hour_suffix)
+        if sample_size is not None:
+            self._store_sampled(slug, click_logs, clicks_before, sample_size, expires_at)
+            return
+        if len(click_logs) == 1:
+            self.clicks_table.put_item(Item=self._click_item(slug, click_logs[0], expires_at))
+            return
+        with self.clicks_table.batch_writer() as batch:
+            for click_log in click_logs:
+                batch.put_item(Item=self._click_item(slug, click_log, expires_at))
+
+    def _store_sampled(self, slug: str, click_logs: List[ClickLog], clicks_before: int, sample_size: int,
+                       expires_at: Optional[int]):
+        # A sampled link's click items are keyed by slot, so a reservoir hit overwrites in place
+        # and the link never holds more than sample_size of them. Its latest clicks go to a
+        # ring of 'recent#' items placed by click number, so concurrent writers don't collide.
+        last = clicks_before + len(click_logs)
+        with self.clicks_table.batch_writer(overwrite_by_pkeys=['slug', 'click_id']) as batch:
+            for seen, click_log in enumerate(click_logs, clicks_before + 1):
+                if seen > last - RECENT_CLICKS:
+                    item = self._click_item(slug, click_log, expires_at)
+                    item['click_id'] = f'recent#{seen % RECENT_CLICKS:02d}'
+                    batch.put_item(Item=item)
+                slot = sample_slot(sample_size, seen, min(seen - 1, sample_size))
+                if slot is None:
+                    continue
+                item = self._click_item(slug, click_log, expires_at)
+                item['click_id'] = f'slot#{slot:06d}'
+                batch.put_item(Item=item)
+
+    def promote_counters(self, slug: str, shards: Optional[int] = None) -> bool:
+        # Moves a link's click counting onto counter items. The counters it already has
+        # stay on the link item and are added in when reading. Returns False if the link
+        # does not exist or was promoted already.
+        shards = shards or self.counter_shards
+        item = self.table.get_item(
+            Key={'slug': slug}, ProjectionExpression='expires_at, click_sample_size, counter_shards, counter_epoch'
+        ).get('Item')
+        if item is None or 'counter_shards' in item:
+            return False
+
+        # Counter items are written under a fresh epoch before the link points at them
+        epoch = secrets.token_hex(3)
+        counter = {'click_count': 0, 'country_clicks': {}}
+        for attribute in ('expires_at', 'click_sample_size'):
+            if attribute in item:
+                counter[attribute] = item[attribute]
+        keys = [counter_key(slug, epoch, index) for index in range(shards)]
+        with self.table.batch_writer() as batch:
+            for key in keys:
+                batch.put_item(Item={'slug': key, **counter})
+        try:
+            self.table.update_item(
+                Key={'slug': slug},
+                UpdateExpression='SET counter_shards = :shards, counter_epoch = :epoch',
+                ConditionExpression='attribute_exists(slug) AND attribute_not_exists(counter_shards)',
+                ExpressionAttributeValues={':shards': shards, ':epoch': epoch}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            with self.table.batch_writer() as batch:
+                for key in keys:
+                    batch.delete_item(Key={'slug': key})
+            return False
+
+        # The link item's click_count no longer changes, so this read is final
+        self._remember_counters(slug, self.table.get_item(
             Key={'slug': slug},
-            UpdateExpression='ADD click_count :inc SET click_logs = list_append(if_not_exists(click_logs, :empty_list), :click)',
-            ExpressionAttributeValues={
-                ':inc': 1,
-                ':empty_list': [],
-                ':click': [{
-                    'timestamp': click_log.timestamp,
-                    'ip': click_log.ip,
-                    'user_agent': click_log.user_agent,
-                    'country': click_log.country
-                }]
-            }
-        )
+            ProjectionExpression='click_count, counter_shards, counter_epoch',
+            ConsistentRead=True
+        )['Item'])
+        return True
 
     def get_analytics(self, slug: str) -> Optional[Analytics]:
         try:
-            response = self.table.get_item(Key={'slug': slug})
+            response = self.table.get_item(
+                Key={'slug': slug},
+                ProjectionExpression=LINK_PROJECTION + ', first_click, last_click, counter_shards, counter_epoch',
+                ExpressionAttributeNames=LINK_PROJECTION_NAMES
+            )
             if 'Item' not in response:
                 return None
-            
+
             item = response['Item']
-            click_logs = [
-                ClickLog(
-                    timestamp=log['timestamp'],
-                    ip=log['ip'],
-                    user_agent=log['user_agent'],
-                    country=log['country']
-                ) for log in item.get('click_logs', [])
-            ]
-            
+            sampled_link = 'click_sample_size' in item
+            click_logs = [self._click_log(click) for click in self._query_clicks(slug, sampled_link)]
+            if sampled_link:
+                # Slot order, not time order
+                click_logs.sort(key=lambda log: log.timestamp)
+
             timestamps = [log.timestamp for log in click_logs]
+            totals = self._merged_counters(slug, item, COUNTER_TOTALS_PROJECTION)
             return Analytics(
-                total_clicks=item.get('click_count', 0),
-                first_click=min(timestamps) if timestamps else None,
-                last_click=max(timestamps) if timestamps else None,
-                click_logs=click_logs
+                total_clicks=totals.total_clicks,
+                first_click=min(timestamps, default=None) if totals.first_click is None else totals.first_click,
+                last_click=max(timestamps, default=None) if totals.last_click is None else totals.last_click,
+                click_logs=click_logs,
+                sampled=is_sampled(int(item['click_sample_size']) if 'click_sample_size' in item else None,
+                                   totals.total_clicks)
             )
         except:
-            return None
\ No newline at end of file
+            return None
+
+    def iter_clicks(self, slug: str) -> Iterator[ClickLog]:
+        link = self.table.get_item(Key={'slug': slug}, ProjectionExpression='click_sample_size').get('Item', {})
+        for item in self._query_clicks(slug, 'click_sample_size' in link):
+            yield self._click_log(item)
+
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        item = self.table.get_item(
+            Key={'slug': slug},
+            ProjectionExpression='click_count, click_sample_size, counter_shards, counter_epoch'
+        ).get('Item')
+        if item is None:
+            return None
+        sample_size = int(item['click_sample_size']) if 'click_sample_size' in item else None
+        sampled = sample_size is not None and is_sampled(
+            sample_size, self._merged_counters(slug, item, COUNTER_TOTALS_PROJECTION).total_clicks
+        )
+
+        if sample_size is not None:
+            # Slot items come back in slot order, so the (bounded) sample is paged by time instead
+            slotted = ((int(item['click_id'][len('slot#'):]), self._click_log(item))
+                       for item in self._query_clicks(slug, True))
+            page = sample_page(slotted, limit, cursor)
+            page.sampled = sampled
+            return page
+
+        query_kwargs = {'KeyConditionExpression': self._clicks_condition(slug, False), 'Limit': limit}
+        if cursor:
+            click_id = decode_cursor(cursor).get('click_id')
+            if not isinstance(click_id, str):
+                raise ValueError("Invalid cursor")
+            query_kwargs['ExclusiveStartKey'] = {'slug': slug, 'click_id': click_id}
+
+        response = self.clicks_table.query(**query_kwargs)
+        last_key = response.get('LastEvaluatedKey')
+        return ClickPage(
+            click_logs=[self._click_log(item) for item in response.get('Items', [])],
+            next_cursor=encode_cursor({'click_id': last_key['click_id']}) if last_key else None,
+            sampled=sampled
+        )
+
+    def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        response = self.table.get_item(Key={'slug': slug}, ProjectionExpression=ROLLUP_PROJECTION)
+        if 'Item' not in response:
+            return None
+
+        item = response['Item']
+        rollup = self._merged_counters(slug, item, '#slug, ' + ROLLUP_PROJECTION, sketches=True)
+        for bucket in self._query_items(Key('slug').eq(slug) & Key('click_id').begins_with(HOUR_PREFIX)):
+            hour = int(bucket['click_id'].split('#')[1])
+            rollup.hourly[hour] = rollup.hourly.get(hour, 0) + int(bucket['clicks'])
+        if 'click_sample_size' in item:
+            # Sampled links keep their latest clicks in a ring of items, in no particular order
+            recent = self.clicks_table.query(
+                KeyConditionExpression=Key('slug').eq(slug) & Key('click_id').begins_with('recent#')
+            ).get('Items', [])
+            rollup.recent_clicks = sorted((self._click_log(click) for click in recent),
+                                          key=lambda log: log.timestamp)
+            return rollup
+        recent = self.clicks_table.query(
+            KeyConditionExpression=self._clicks_condition(slug, False),
+            ScanIndexForward=False,
+            Limit=RECENT_CLICKS
+        ).get('Items', [])
+        rollup.recent_clicks = [self._click_log(click) for click in reversed(recent)]
+        return rollup
+
+    def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        # '#' only appears in the allocator and counter items, never in a link's slug
+        keys = [{'slug': slug} for slug in dict.fromkeys(slugs) if '#' not in slug]
+        summaries = {}
+        for item in self._batch_get(keys, SUMMARY_PROJECTION):
+            summary = self._link_summary(item)
+            if 'counter_shards' in item:
+                totals = self._merged_counters(item['slug'], item, COUNTER_TOTALS_PROJECTION)
+                summary.link_data.click_count = totals.total_clicks
+                summary.first_click = totals.first_click
+                summary.last_click = totals.last_click
+                summary.unique_countries = len(totals.countries)
+            summaries[item['slug']] = summary
+        return summaries
+
+    def _batch_get(self, keys: List[dict], projection: str) -> Iterator[dict]:
+        # projection must name '#slug'
+        for start in range(0, len(keys), BATCH_GET_LIMIT):
+            request = {self.table.name: {
+                'Keys': keys[start:start + BATCH_GET_LIMIT],
+                'ProjectionExpression': projection,
+                'ExpressionAttributeNames': LINK_PROJECTION_NAMES
+            }}
+            for attempt in range(BATCH_GET_ATTEMPTS):
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                yield from response.get('Responses', {}).get(self.table.name, [])
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+                # Throttled reads come back as unprocessed keys; back off before resending them
+                time.sleep(min(0.05 * 2 ** attempt, 2.0))
+            else:
+                raise RuntimeError("batch_get_item left keys unprocessed")
+
+    def _merged_counters(self, slug: str, item: dict, projection: str, sketches: bool = False) -> LinkRollup:
+        # The link item's counters, plus its counter items' once it has been promoted and,
+        # if asked for, its sketch item's
+        rollup = self._item_rollup(item)
+        keys = [{'slug': sketch_key(slug)}] if sketches else []
+        if 'counter_shards' in item:
+            keys += [{'slug': counter_key(slug, item['counter_epoch'], index)}
+                     for index in range(int(item['counter_shards']))]
+        for counter in self._batch_get(keys, projection):
+            rollup.merge(self._item_rollup(counter))
+        return rollup
+
+    def merge_stream_records(self, records: List[dict]) -> int:
+        # Folds the click batches carried by the links table's stream (NEW_AND_OLD_IMAGES)
+        # into each link's sketches, one update per link. Only updates that raised
+        # click_count are click updates; promotions and rollup rewrites are skipped.
+        # Returns the number of clicks merged, not counting redelivered records.
+        deserializer = TypeDeserializer()
+        batches: Dict[str, Tuple[List[Tuple[str, Optional[int], List[dict]]], Optional[int]]] = {}
+        for record in records:
+            images = record.get('dynamodb', {})
+            if record.get('eventName') not in ('INSERT', 'MODIFY') or 'NewImage' not in images:
+                continue
+            new = {name: deserializer.deserialize(value) for name, value in images['NewImage'].items()}
+            old_count = int(images.get('OldImage', {}).get('click_count', {}).get('N', 0))
+            if 'click_batch' not in new or int(new.get('click_count', 0)) <= old_count:
+                continue
+            # Counter items are '<slug>#<epoch>#c<n>'
+            slug = new['slug'].split('#', 1)[0]
+            sequence = int(images['SequenceNumber']) if 'SequenceNumber' in images else None
+            slug_batches = batches.get(slug, ([], None))[0]
+            slug_batches.append((new['slug'], sequence, new['click_batch']))
+            batches[slug] = (slug_batches, int(new['expires_at']) if 'expires_at' in new else None)
+        return sum(self.merge_sketches(slug, slug_batches, expires_at)
+                   for slug, (slug_batches, expires_at) in batches.items())
+
+    def merge_sketches(self, slug: str, batches: List[Tuple[str, Optional[int], List[dict]]],
+                       expires_at: Optional[int] = None) -> int:
+        # batches are (item key, stream sequence number, clicks), clicks being the
+        # {'ip', 'user_agent'} dicts left in click_batch. The stream delivers at least
+        # once, and a retried Lambda batch comes back whole; an item's sequence numbers
+        # only grow, so a batch at or below the last one merged from its item is a
+        # redelivery and is skipped. Returns the number of clicks merged.
+        key = sketch_key(slug)
+        for attempt in range(SKETCH_ATTEMPTS):
+            item = self.table.get_item(
+                Key={'slug': key}, ProjectionExpression=SKETCH_PROJECTION, ConsistentRead=True
+            ).get('Item', {})
+            unique_ips, user_agents = self._sketches(item)
+            sequences = {source: int(sequence) for source, sequence in item.get('merged_sequences', {}).items()}
+            merged = 0
+            for source, sequence, clicks in batches:
+                if sequence is not None:
+                    if sequence <= sequences.get(source, -1):
+                        continue
+                    sequences[source] = sequence
+                for click in clicks:
+                    unique_ips.add(click['ip'])
+                    user_agents.add(click['user_agent'])
+                merged += len(clicks)
+            if not merged:
+                return 0
+            version = int(item.get('sketch_version', 0))
+            update = ('SET unique_ips = :ips, user_agents = :agents, merged_sequences = :sequences, '
+                      'sketch_version = :next')
+            values = {
+                ':ips': unique_ips.to_bytes(),
+                ':agents': user_agents.to_bytes(),
+                ':sequences': sequences,
+                ':version': version,
+                ':next': version + 1
+            }
+            if expires_at:
+                # The sketch item expires with its link
+                update += ', expires_at = :expires'
+                values[':expires'] = expires_at
+            try:
+                self.table.update_item(
+                    Key={'slug': key},
+                    UpdateExpression=update,
+                    ConditionExpression='attribute_not_exists(sketch_version) OR sketch_version = :version',
+                    ExpressionAttributeValues=values
+                )
+                return merged
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        raise RuntimeError(f"Sketch update for '{slug}' kept conflicting")
+
+    def rebuild_rollups(self) -> int:
+        # Recompute every link's rollup attributes from its click items. A sample can't
+        # give back exact totals, so sampled links keep the rollups they have, and so do
+        # promoted links, whose counters are spread over their counter items.
+        rebuilt = 0
+        scan_kwargs = {
+            'ProjectionExpression': '#slug, expires_at, click_sample_size, counter_shards',
+            'ExpressionAttributeNames': {'#slug': 'slug'}
+        }
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                slug = item['slug']
+                if '#' in slug or 'click_sample_size' in item or 'counter_shards' in item:
+                    continue
+                clicks = self._query_clicks(slug, False)
+                rollup = LinkRollup.from_clicks(self._click_log(click) for click in clicks)
+                self._write_rollup(slug, rollup, int(item['expires_at']) if 'expires_at' in item else None)
+                rebuilt += 1
+            if 'LastEvaluatedKey' not in response:
+                return rebuilt
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def allocate_id_block(self, size: int) -> int:
+        # One atomic counter bump per block; containers never share ids
+        response = self.table.update_item(
+            Key={'slug': ALLOCATOR_KEY},
+            UpdateExpression='ADD next_id :size',
+            ExpressionAttributeValues={':size': size},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['next_id']) - size
+
+    def migrate_click_logs(self) -> int:
+        # Move click_logs embedded in legacy link items into the clicks table
+        migrated = 0
+        scan_kwargs = {
+            'FilterExpression': 'attribute_exists(click_logs)',
+            'ProjectionExpression': '#slug, click_logs, expires_at',
+            'ExpressionAttributeNames': {'#slug': 'slug'}
+        }
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                migrated += self._migrate_item(item)
+            if 'LastEvaluatedKey' not in response:
+                return migrated
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _migrate_item(self, item: dict) -> int:
+        slug = item['slug']
+        legacy_logs = item.get('click_logs', [])
+        expires_at = int(item['expires_at']) if 'expires_at' in item else None
+
+        with self.clicks_table.batch_writer() as batch:
+            for index, log in enumerate(legacy_logs):
+                click_item = self._click_item(slug, self._click_log(log), expires_at)
+                # Deterministic ids make a re-run after a partial failure idempotent
+                click_item['click_id'] = f"{int(log['timestamp']):010d}#legacy{index:06d}"
+                batch.put_item(Item=click_item)
+
+        try:
+            # Only drop the list if nothing was appended to it in the meantime
+            self.table.update_item(
+                Key={'slug': slug},
+                UpdateExpression='REMOVE click_logs',
+                ConditionExpression='size(click_logs) = :count',
+                ExpressionAttributeValues={':count': len(legacy_logs)}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            fresh = self.table.get_item(Key={'slug': slug}, ConsistentRead=True).get('Item')
+            return self._migrate_item(fresh) if fresh and 'click_logs' in fresh else 0
+        return len(legacy_logs)
+
+    def _update_counters(self, slug: str,
+                         click_logs: List[ClickLog]) -> Optional[Tuple[int, Optional[int], Optional[int], str]]:
+        # One atomic update per batch, with nothing read first, so concurrent writers never
+        # conflict: totals, first/last click, per-country counts, and the batch's ips and
+        # user agents in click_batch for merge_stream_records. Returns the link's click
+        # count before the batch, its click_sample_size and expires_at, and the suffix for
+        # its hour items, or None if the link does not exist. Promoted links are counted
+        # on one of their counter items, picked at random.
+        countries: Dict[str, int] = {}
+        for click_log in click_logs:
+            countries[click_log.country] = countries.get(click_log.country, 0) + 1
+
+        names = {}
+        values = {
+            ':inc': len(click_logs),
+            ':first': min(log.timestamp for log in click_logs),
+            ':last': max(log.timestamp for log in click_logs),
+            ':zero': 0,
+            ':batch': [{'ip': log.ip, 'user_agent': log.user_agent} for log in click_logs]
+        }
+        assignments = ['first_click = if_not_exists(first_click, :first)', 'click_batch = :batch']
+        for index, (country, count) in enumerate(countries.items()):
+            name, value = f'#c{index}', f':c{index}'
+            names[name] = country
+            values[value] = count
+            assignments.append(f'country_clicks.{name} = if_not_exists(country_clicks.{name}, :zero) + {value}')
+
+        counters = self._counters.get(slug)
+        index = None if counters is None else random.randrange(counters[0])
+        key = slug if counters is None else counter_key(slug, counters[1], index)
+        # A promoted link item takes no more clicks, so a writer that missed the promotion
+        # fails here. last_click only moves forward: a batch older than the last one written
+        # (a delayed retry, a slower container) is counted again without touching it.
+        # ALL_NEW hands back expires_at and click_sample_size without a separate read.
+        condition = 'attribute_exists(slug) AND attribute_not_exists(counter_shards)'
+        in_order = ' AND (attribute_not_exists(last_click) OR last_click <= :last)'
+        item = None
+        for update, check in ((assignments + ['last_click = :last'], condition + in_order),
+                              (assignments, condition)):
+            try:
+                item = self.table.update_item(
+                    Key={'slug': key},
+                    UpdateExpression='ADD click_count :inc SET ' + ', '.join(update),
+                    ConditionExpression=check,
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values if ':last' in check else
+                    {name: value for name, value in values.items() if name != ':last'},
+                    ReturnValues='ALL_NEW'
+                )['Attributes']
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        if item is None:
+            return self._retry_counters(slug, click_logs, counters)
+
+        sample_size = int(item['click_sample_size']) if 'click_sample_size' in item else None
+        expires_at = int(item['expires_at']) if 'expires_at' in item else None
+        clicks_before = int(item['click_count']) - len(click_logs)
+        if counters is not None:
+            # Clicks spread evenly at random, so this estimates the link's count, which
+            # is all a sampled link's reservoir needs
+            shards, _, base = counters
+            clicks_before = base + clicks_before * shards
+        return clicks_before, sample_size, expires_at, '' if index is None else f'#c{index}'
+
+    def _add_hourly(self, slug: str, click_logs: List[ClickLog], expires_at: Optional[int], suffix: str):
+        # One atomic add per hour in the batch, which is nearly always a single hour
+        hourly: Dict[int, int] = {}
+        for click_log in click_logs:
+            hour = click_log.timestamp // 3600 * 3600
+            hourly[hour] = hourly.get(hour, 0) + 1
+        for hour, count in hourly.items():
+            update, values = 'ADD clicks :count', {':count': count}
+            if expires_at:
+                update += ' SET expires_at = :expires'
+                values[':expires'] = expires_at
+            self.clicks_table.update_item(
+                Key={'slug': slug, 'click_id': f'{HOUR_PREFIX}{hour}{suffix}'},
+                UpdateExpression=update,
+                ExpressionAttributeValues=values
+            )
+
+    def _retry_counters(self, slug: str, click_logs: List[ClickLog], counters: Optional[Tuple[int, str, int]]):
+        # The conditional update failed: the link is gone, was promoted by another
+        # container, or was saved again since this one promoted it
+        link = self.table.get_item(
+            Key={'slug': slug},
+            ProjectionExpression='click_count, counter_shards, counter_epoch',
+            ConsistentRead=True
+        ).get('Item')
+        if link is None:
+            return None
+        if 'counter_shards' in link:
+            if counters is not None and counters[1] == link['counter_epoch']:
+                return None
+            self._remember_counters(slug, link)
+        elif counters is not None:
+            self._counters.pop(slug, None)
+        else:
+            return None
+        return self._update_counters(slug, click_logs)
+
+    def _write_rollup(self, slug: str, rollup: LinkRollup, expires_at: Optional[int] = None):
+        # Sketches and hourly maps kept on the link item before they had their own items are
+        # dropped with click_batch, so the stream consumer has nothing to merge from this update
+        with self.clicks_table.batch_writer(overwrite_by_pkeys=['slug', 'click_id']) as batch:
+            for hour, count in rollup.hourly.items():
+                bucket = {'slug': slug, 'click_id': f'{HOUR_PREFIX}{hour}', 'clicks': count}
+                if expires_at:
+                    bucket['expires_at'] = expires_at
+                batch.put_item(Item=bucket)
+        update = ('SET click_count = :total, country_clicks = :countries '
+                  'REMOVE click_batch, hourly_clicks, unique_ips, user_agents, sketch_version')
+        values = {
+            ':total': rollup.total_clicks,
+            ':countries': rollup.countries
+        }
+        if rollup.first_click is not None:
+            update = update.replace(' REMOVE', ', first_click = :first, last_click = :last REMOVE')
+            values[':first'] = rollup.first_click
+            values[':last'] = rollup.last_click
+        self.table.update_item(Key={'slug': slug}, UpdateExpression=update, ExpressionAttributeValues=values)
+        self.table.update_item(
+            Key={'slug': sketch_key(slug)},
+            UpdateExpression='SET unique_ips = :ips, user_agents = :agents, '
+                             'sketch_version = if_not_exists(sketch_version, :zero) + :one',
+            ExpressionAttributeValues={
+                ':ips': rollup.unique_ips.to_bytes(),
+                ':agents': rollup.user_agents.to_bytes(),
+                ':zero': 0,
+                ':one': 1
+            }
+        )
+
+    @staticmethod
+    def _clicks_condition(slug: str, sampled: bool):
+        # A sampled link's kept clicks are its 'slot#' items; anyone else's click ids start
+        # with the timestamp's digits, which sort before ':'
+        if sampled:
+            return Key('slug').eq(slug) & Key('click_id').begins_with('slot#')
+        return Key('slug').eq(slug) & Key('click_id').lt(':')
+
+    def _query_clicks(self, slug: str, sampled: bool):
+        return self._query_items(self._clicks_condition(slug, sampled))
+
+    def _query_items(self, condition):
+        query_kwargs = {'KeyConditionExpression': condition}
+        while True:
+            response = self.clicks_table.query(**query_kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _remember_counters(self, slug: str, item: dict):
+        if len(self._counters) >= 10000:
+            self._counters.clear()
+        self._counters[slug] = (
+            int(item['counter_shards']), item['counter_epoch'], int(item.get('click_count', 0))
+        )
+
+    def _item_rollup(self, item: dict) -> LinkRollup:
+        # Counters held by one link or counter item
+        unique_ips, user_agents = self._sketches(item)
+        return LinkRollup(
+            total_clicks=int(item.get('click_count', 0)),
+            first_click=int(item['first_click']) if 'first_click' in item else None,
+            last_click=int(item['last_click']) if 'last_click' in item else None,
+            hourly={int(hour): int(count) for hour, count in item.get('hourly_clicks', {}).items()},
+            countries={country: int(count) for country, count in item.get('country_clicks', {}).items()},
+            unique_ips=unique_ips,
+            user_agents=user_agents
+        )
+
+    @staticmethod
+    def _link_item(link_data: LinkData) -> dict:
+        item = {
+            'slug': link_data.slug,
+            'original_url': link_data.original_url,
+            'created_at': link_data.created_at,
+            'click_count': link_data.click_count,
+            'country_clicks': {}
+        }
+        if link_data.expires_at:
+            item['expires_at'] = link_data.expires_at
+        if link_data.redirect_cache:
+            item['redirect_cache'] = link_data.redirect_cache
+        if link_data.click_sample_size is not None:
+            item['click_sample_size'] = link_data.click_sample_size
+        return item
+
+    @staticmethod
+    def _sketches(item: dict):
+        # boto3 hands binary attributes back wrapped in Binary
+        if 'unique_ips' not in item:
+            return HyperLogLog(), TopK()
+        return HyperLogLog.from_bytes(bytes(item['unique_ips'])), TopK.from_bytes(bytes(item['user_agents']))
+
+    @staticmethod
+    def _link_summary(item: dict) -> LinkSummary:
+        return LinkSummary(
+            link_data=LinkData(
+                slug=item['slug'],
+                original_url=item['original_url'],
+                created_at=int(item['created_at']),
+                expires_at=int(item['expires_at']) if 'expires_at' in item else None,
+                click_count=int(item.get('click_count', 0)),
+                redirect_cache=item.get('redirect_cache'),
+                click_sample_size=int(item['click_sample_size']) if 'click_sample_size' in item else None
+            ),
+            first_click=int(item['first_click']) if 'first_click' in item else None,
+            last_click=int(item['last_click']) if 'last_click' in item else None,
+            unique_countries=len(item.get('country_clicks', {}))
+        )
+
+    @staticmethod
+    def _click_item(slug: str, click_log: ClickLog, expires_at: Optional[int]) -> dict:
+        # Sort keys start with the timestamp so a link's clicks are stored and read in time order
+        item = {
+            'slug': slug,
+            'click_id': f"{click_log.timestamp:010d}#{secrets.token_hex(4)}",
+            'timestamp': click_log.timestamp,
+            'ip': click_log.ip,
+            'user_agent': click_log.user_agent,
+            'country': click_log.country
+        }
+        if expires_at:
+            item['expires_at'] = expires_at
+        return item
+
+    @staticmethod
+    def _click_log(item: dict) -> ClickLog:
+        return ClickLog(
+            timestamp=int(item['timestamp']),
+            ip=item['ip'],
+            user_agent=item['user_agent'],
+            country=item['country']
+        )
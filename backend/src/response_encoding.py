@@ -0,0 +1,102 @@
+import dataclasses
+import gzip
+import json
+import os
+from decimal import Decimal
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies below this size are sent as-is; compressing them costs more than it saves
+MIN_COMPRESS_BYTES = int(os.environ.get('LINKPULSE_COMPRESS_MIN_BYTES', 1024))
+# Click logs are repetitive enough that level 1 gets most of level 6's ratio in a third of the time
+GZIP_LEVEL = int(os.environ.get('LINKPULSE_GZIP_LEVEL', 1))
+ZSTD_LEVEL = int(os.environ.get('LINKPULSE_ZSTD_LEVEL', 3))
+
+def _json_default(value):
+    # Dataclasses (e.g. the recent ClickLogs in stats) serialize as Flask's jsonify does;
+    # DynamoDB numbers arrive as Decimal
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def _stdlib_dumps(body) -> bytes:
+    return json.dumps(body, default=_json_default, separators=(',', ':')).encode()
+
+def _orjson_dumps(body) -> bytes:
+    # Non-string keys (the hourly distribution's hour timestamps) become strings, as with json
+    return orjson.dumps(body, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+JSON_ENCODERS: Dict[str, Callable[[object], bytes]] = {'json': _stdlib_dumps}
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = _orjson_dumps
+
+def register_json_encoder(name: str, dumps: Callable[[object], bytes]) -> None:
+    JSON_ENCODERS[name] = dumps
+
+def get_json_encoder(name: Optional[str] = None) -> Callable[[object], bytes]:
+    # 'auto' picks orjson when it is installed and falls back to the standard library
+    name = name or os.environ.get('LINKPULSE_JSON_ENCODER', 'auto')
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in JSON_ENCODERS else 'json'
+    if name not in JSON_ENCODERS:
+        raise ValueError(f"Unknown JSON encoder '{name}'; expected one of: {', '.join(JSON_ENCODERS)}")
+    return JSON_ENCODERS[name]
+
+def encode_json(body) -> bytes:
+    return get_json_encoder()(body)
+
+def _zstd_compress(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+def _gzip_compress(body: bytes) -> bytes:
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+# In order of preference when a client accepts several with the same q-value
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {}
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _zstd_compress
+COMPRESSORS['gzip'] = _gzip_compress
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    # The supported coding with the highest q-value in Accept-Encoding, or None for identity
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for coding in COMPRESSORS:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+def compress_body(body: bytes, accept_encoding: Optional[str],
+                  min_bytes: Optional[int] = None) -> Tuple[bytes, Optional[str]]:
+    # Returns the body to send and its Content-Encoding (None when it is sent uncompressed)
+    if len(body) < (MIN_COMPRESS_BYTES if min_bytes is None else min_bytes):
+        return body, None
+    coding = negotiate_encoding(accept_encoding)
+    if coding is None:
+        return body, None
+    return COMPRESSORS[coding](body), coding
@@ -0,0 +1,108 @@
+import base64
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+from models import ClickLog
+from sketches import HyperLogLog, TopK
+
+RECENT_CLICKS = 10
+
+@dataclass
+class LinkRollup:
+    # Per-link aggregates kept up to date on every click so the stats and
+    # trends endpoints never have to walk the raw click history
+    total_clicks: int = 0
+    first_click: Optional[int] = None
+    last_click: Optional[int] = None
+    hourly: Dict[int, int] = field(default_factory=dict)
+    countries: Dict[str, int] = field(default_factory=dict)
+    recent_clicks: List[ClickLog] = field(default_factory=list)
+    # Approximate, fixed-size summaries: distinct IPs and the heaviest user agents
+    unique_ips: HyperLogLog = field(default_factory=HyperLogLog)
+    user_agents: TopK = field(default_factory=TopK)
+
+    def add(self, click_log: ClickLog) -> None:
+        self.total_clicks += 1
+        if self.first_click is None or click_log.timestamp < self.first_click:
+            self.first_click = click_log.timestamp
+        if self.last_click is None or click_log.timestamp > self.last_click:
+            self.last_click = click_log.timestamp
+
+        hour = click_log.timestamp // 3600 * 3600
+        self.hourly[hour] = self.hourly.get(hour, 0) + 1
+        self.countries[click_log.country] = self.countries.get(click_log.country, 0) + 1
+        self.unique_ips.add(click_log.ip)
+        self.user_agents.add(click_log.user_agent)
+
+        self.recent_clicks.append(click_log)
+        if len(self.recent_clicks) > RECENT_CLICKS:
+            del self.recent_clicks[0]
+
+    def copy(self) -> 'LinkRollup':
+        return LinkRollup(
+            total_clicks=self.total_clicks,
+            first_click=self.first_click,
+            last_click=self.last_click,
+            hourly=dict(self.hourly),
+            countries=dict(self.countries),
+            recent_clicks=list(self.recent_clicks),
+            unique_ips=self.unique_ips.copy(),
+            user_agents=self.user_agents.copy()
+        )
+
+    def merge(self, other: 'LinkRollup') -> None:
+        # Combines rollups of disjoint click sets, e.g. two time windows
+        self.total_clicks += other.total_clicks
+        if self.first_click is None or (other.first_click is not None and other.first_click < self.first_click):
+            self.first_click = other.first_click
+        if self.last_click is None or (other.last_click is not None and other.last_click > self.last_click):
+            self.last_click = other.last_click
+        for hour, count in other.hourly.items():
+            self.hourly[hour] = self.hourly.get(hour, 0) + count
+        for country, count in other.countries.items():
+            self.countries[country] = self.countries.get(country, 0) + count
+        self.recent_clicks = sorted(self.recent_clicks + other.recent_clicks,
+                                    key=lambda log: log.timestamp)[-RECENT_CLICKS:]
+        self.unique_ips.merge(other.unique_ips)
+        self.user_agents.merge(other.user_agents)
+
+    @classmethod
+    def from_clicks(cls, click_logs: Iterable[ClickLog]) -> 'LinkRollup':
+        rollup = cls()
+        for click_log in click_logs:
+            rollup.add(click_log)
+        return rollup
+
+    def to_dict(self) -> dict:
+        return {
+            'total_clicks': self.total_clicks,
+            'first_click': self.first_click,
+            'last_click': self.last_click,
+            # JSON object keys are strings
+            'hourly': {str(hour): count for hour, count in self.hourly.items()},
+            'countries': dict(self.countries),
+            'recent_clicks': [
+                {
+                    'timestamp': log.timestamp,
+                    'ip': log.ip,
+                    'user_agent': log.user_agent,
+                    'country': log.country
+                } for log in self.recent_clicks
+            ],
+            'unique_ips': base64.b64encode(self.unique_ips.to_bytes()).decode(),
+            'user_agents': base64.b64encode(self.user_agents.to_bytes()).decode()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LinkRollup':
+        return cls(
+            total_clicks=data.get('total_clicks', 0),
+            first_click=data.get('first_click'),
+            last_click=data.get('last_click'),
+            hourly={int(hour): count for hour, count in data.get('hourly', {}).items()},
+            countries=dict(data.get('countries', {})),
+            recent_clicks=[ClickLog(**log) for log in data.get('recent_clicks', [])],
+            unique_ips=HyperLogLog.from_bytes(base64.b64decode(data['unique_ips']))
+            if 'unique_ips' in data else HyperLogLog(),
+            user_agents=TopK.from_bytes(base64.b64decode(data['user_agents']))
+            if 'user_agents' in data else TopK()
+        )
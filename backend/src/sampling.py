@@ -0,0 +1,48 @@
+import os
+import random
+from typing import Iterable, Optional, Tuple
+from models import ClickLog, ClickPage
+from pagination import encode_cursor, decode_cursor
+
+# Default LinkData.click_sample_size for new links; unset keeps every raw click
+DEFAULT_SAMPLE_SIZE = int(os.environ['LINKPULSE_CLICK_SAMPLE_SIZE']) \
+    if os.environ.get('LINKPULSE_CLICK_SAMPLE_SIZE') else None
+
+def validate_sample_size(sample_size) -> None:
+    if sample_size is not None and (not isinstance(sample_size, int) or isinstance(sample_size, bool)
+                                    or sample_size < 1):
+        raise ValueError("click_sample_size must be a positive integer")
+
+def sample_slot(sample_size: Optional[int], clicks_seen: int, retained: int,
+                rng: random.Random = random) -> Optional[int]:
+    # Where the clicks_seen-th click of a link is stored: retained (an append) while
+    # there is room, then a slot it overwrites, or None when the sample passes it over.
+    # The first half of the slots keep the link's first clicks; the rest are a
+    # uniform reservoir (Algorithm R) over every click after those.
+    if sample_size is None or retained < sample_size:
+        return retained
+    head = sample_size // 2
+    j = rng.randrange(clicks_seen - head)
+    return head + j if j < sample_size - head else None
+
+def is_sampled(sample_size: Optional[int], total_clicks: int) -> bool:
+    # True once some clicks were counted but not kept as raw events
+    return sample_size is not None and total_clicks > sample_size
+
+def sample_page(slotted: Iterable[Tuple[int, ClickLog]], limit: int, cursor: Optional[str]) -> ClickPage:
+    # Pages a sampled link's (slot, click) pairs in (timestamp, slot) order. Slot order can't
+    # carry a cursor, since a reservoir hit puts a new click into a slot the walk has passed.
+    # That click is newer than any the walk has seen, so it sorts after every cursor handed
+    # out: a walk never repeats a click and only misses the ones evicted before it reached them.
+    after = (-1, -1)
+    if cursor:
+        position = decode_cursor(cursor)
+        after = (position.get('ts'), position.get('slot'))
+        if not all(isinstance(value, int) for value in after):
+            raise ValueError("Invalid cursor")
+    pending = sorted((log.timestamp, slot, log) for slot, log in slotted if (log.timestamp, slot) > after)
+    page = pending[:limit]
+    next_cursor = None
+    if len(pending) > limit:
+        next_cursor = encode_cursor({'ts': page[-1][0], 'slot': page[-1][1]})
+    return ClickPage(click_logs=[log for _, _, log in page], next_cursor=next_cursor)
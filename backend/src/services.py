@@ -1,15 +1,10 @@
-import secrets
-import string
-import time
-import requests
-from typing import Optional
-from models import LinkData, ClickLog, Analytics
-
-class SlugGenerator:
-    @staticmethod
-    def generate(length: int = 7) -> str:
-        chars = string.ascii_letters + string.digits
-        return ''.join(secrets.choice(chars) for _ in range(length))
+from typing import Dict, List, Optional
+from models import LinkData, Analytics, ClickPage, ShortenResult
+from slug_allocator import RandomSlugAllocator
+from geo_resolver import default_resolver
+from pagination import DEFAULT_PAGE_SIZE
+from metrics import REGISTRY
+from link_rules import BatchItem, ShortLinkRules
 
 class UrlValidator:
     @staticmethod
@@ -17,58 +12,61 @@ class UrlValidator:
         return 'drive.google.com' in url or 'docs.google.com' in url
 
 class GeoService:
-    @staticmethod
-    def get_country(ip: str) -> str:
-        try:
-            response = requests.get(f'https://ipinfo.io/{ip}/json', timeout=2)
-            return response.json().get('country', 'Unknown')
-        except:
-            return 'Unknown'
+    def __init__(self, resolver=None):
+        self.resolver = resolver if resolver is not None else default_resolver()
 
-class LinkService:
-    def __init__(self, repository):
+    def get_country(self, ip: str) -> str:
+        return self.resolver.get_country(ip)
+
+class LinkService(ShortLinkRules):
+    def __init__(self, repository, click_pipeline=None, geo_service=None, slug_allocator=None, metrics=None,
+                 deduplicator=None):
         self.repository = repository
-        self.slug_generator = SlugGenerator()
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.deduplicator = deduplicator
+        self.click_pipeline = click_pipeline
+        self.slug_allocator = slug_allocator if slug_allocator is not None else RandomSlugAllocator()
         self.url_validator = UrlValidator()
-        self.geo_service = GeoService()
+        self.geo_service = geo_service if geo_service is not None else GeoService()
 
-    def create_short_link(self, original_url: str, ttl_hours: int = 24) -> LinkData:
-        if not self.url_validator.is_google_drive_url(original_url):
-            raise ValueError("Only Google Drive URLs are allowed")
-        
-        slug = self.slug_generator.generate()
-        while self.repository.get_link(slug):
-            slug = self.slug_generator.generate()
-        
-        expires_at = int(time.time()) + (ttl_hours * 3600) if ttl_hours else None
-        link_data = LinkData(
-            slug=slug,
-            original_url=original_url,
-            created_at=int(time.time()),
-            expires_at=expires_at
-        )
-        
-        self.repository.save_link(link_data)
-        return link_data
+    def create_short_link(self, original_url: str, ttl_hours: int = 24,
+                          redirect_cache: Optional[str] = None,
+                          click_sample_size: Optional[int] = None) -> LinkData:
+        return self._run(self._create_link_flow(original_url, ttl_hours, redirect_cache, click_sample_size))
+
+    def create_short_links(self, items: List[BatchItem]) -> List[ShortenResult]:
+        return self._run(self._create_links_flow(items))
 
     def get_redirect_url(self, slug: str, ip: str, user_agent: str) -> Optional[str]:
-        link_data = self.repository.get_link(slug)
-        if not link_data:
-            return None
-        
-        if link_data.expires_at and int(time.time()) > link_data.expires_at:
-            return None
-        
-        country = self.geo_service.get_country(ip)
-        click_log = ClickLog(
-            timestamp=int(time.time()),
-            ip=ip,
-            user_agent=user_agent,
-            country=country
-        )
-        
-        self.repository.log_click(slug, click_log)
-        return link_data.original_url
+        link_data = self.resolve_redirect(slug, ip, user_agent)
+        return link_data.original_url if link_data else None
+
+    def resolve_redirect(self, slug: str, ip: str, user_agent: str) -> Optional[LinkData]:
+        return self._run(self._redirect_flow(slug, ip, user_agent))
 
     def get_analytics(self, slug: str) -> Optional[Analytics]:
-        return self.repository.get_analytics(slug)
\ No newline at end of file
+        return self.repository.get_analytics(slug)
+
+    def get_summary(self, slug: str) -> Optional[dict]:
+        rollup = self.repository.get_rollup(slug)
+        if not rollup:
+            return None
+
+        return {
+            'total_clicks': rollup.total_clicks,
+            'first_click': rollup.first_click,
+            'last_click': rollup.last_click,
+            'recent_clicks': rollup.recent_clicks
+        }
+
+    def get_many_stats(self, slugs: List[str]) -> Dict[str, dict]:
+        return self.many_stats(self.repository, slugs, self.MAX_BATCH_SIZE)
+
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        return self.repository.get_click_page(slug, limit, cursor)
+
+    def _validate_url(self, original_url: str) -> None:
+        # Lighter than the shared check: any string on a Drive domain
+        if not self.url_validator.is_google_drive_url(original_url):
+            raise ValueError("Only Google Drive URLs are allowed")
@@ -0,0 +1,260 @@
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from data_layer import FileRepository, LinkRepository
+from models import LinkData, ClickLog, Analytics, ClickPage, LinkSummary
+from rollups import LinkRollup
+from pagination import DEFAULT_PAGE_SIZE
+from snapshot import CLICK_BYTES, SnapshotMapping
+
+# Rough resident cost of one link with its rollup (the HyperLogLog alone is 1 KB),
+# used with CLICK_BYTES to keep the resident shards under the memory budget
+RESIDENT_LINK_BYTES = 6 * 1024
+MANIFEST_VERSION = 1
+
+class ShardedFileRepository(LinkRepository):
+    # Links partitioned by crc32(slug) into shard_count FileRepository files.
+    # A shard is opened the first time one of its slugs is touched and resident
+    # shards are evicted least recently used first once their estimated
+    # footprint passes memory_budget_bytes, so startup and memory follow the
+    # hot working set. Like FileRepository it expects a single writing process.
+    def __init__(self, directory: str = 'linkpulse_shards', shard_count: int = 64,
+                 memory_budget_bytes: int = 256 * 1024 * 1024, journaled: bool = True,
+                 snapshot_format: Optional[str] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.memory_budget_bytes = memory_budget_bytes
+        self.journaled = journaled
+        self.snapshot_format = snapshot_format
+        self._manifest_file = os.path.join(directory, 'manifest.json')
+        self._load_manifest(shard_count)
+
+        self._lock = threading.RLock()
+        self._resident: 'OrderedDict[int, FileRepository]' = OrderedDict()
+        self._pins: Dict[int, int] = {}
+        self._clicks: Dict[int, int] = {}
+        # Resident shards written since they were opened; only these are compacted on eviction
+        self._dirty = set()
+        self._stats = {'loads': 0, 'evictions': 0}
+        # Id blocks for the slug allocator live outside the shards, in a link-less snapshot
+        self._ids = FileRepository(os.path.join(directory, 'ids.json'), journaled=journaled)
+
+    def _load_manifest(self, shard_count: int):
+        # Shard count and each shard's earliest expiry, so the sweeper only opens shards with due links
+        self.expiries: Dict[int, int] = {}
+        if os.path.exists(self._manifest_file):
+            with open(self._manifest_file) as f:
+                manifest = json.load(f)
+            if manifest['shards'] != shard_count:
+                raise ValueError(f"{self.directory} has {manifest['shards']} shards, not {shard_count}")
+            self.expiries = {int(index): expires_at for index, expires_at in manifest['expiries'].items()}
+        self.shard_count = shard_count
+        self._save_manifest()
+
+    def _save_manifest(self):
+        tmp_file = f'{self._manifest_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'shards': self.shard_count, 'expiries': self.expiries}, f)
+        os.replace(tmp_file, self._manifest_file)
+
+    def shard_index(self, slug: str) -> int:
+        return zlib.crc32(slug.encode()) % self.shard_count
+
+    def shard_path(self, index: int) -> str:
+        return os.path.join(self.directory, f'shard-{index:04d}.json')
+
+    @contextmanager
+    def _shard(self, index: int, writes: bool = False) -> Iterator[FileRepository]:
+        # Pinned while in use so another thread's load cannot evict it mid-call.
+        # Only loads and writes grow the footprint, so reads skip the budget check.
+        with self._lock:
+            shard = self._resident.get(index)
+            opened = shard is None
+            if opened:
+                shard = self._open_shard(index)
+            else:
+                self._resident.move_to_end(index)
+            self._pins[index] = self._pins.get(index, 0) + 1
+            if writes:
+                self._dirty.add(index)
+        try:
+            yield shard
+        finally:
+            with self._lock:
+                self._pins[index] -= 1
+                if opened or writes:
+                    self._evict()
+
+    def _open_shard(self, index: int) -> FileRepository:
+        shard = FileRepository(self.shard_path(index), journaled=self.journaled,
+                               snapshot_format=self.snapshot_format)
+        if isinstance(shard.analytics, SnapshotMapping):
+            self._clicks[index] = shard.analytics.snapshot.click_total()
+        else:
+            self._clicks[index] = sum(len(columns) for columns in shard.analytics.values())
+        self._resident[index] = shard
+        self._stats['loads'] += 1
+        return shard
+
+    def _footprint(self, index: int) -> int:
+        return len(self._resident[index].links) * RESIDENT_LINK_BYTES + self._clicks[index] * CLICK_BYTES
+
+    def _evict(self):
+        total = sum(self._footprint(index) for index in self._resident)
+        # The most recent shard always stays, even when it alone is over budget
+        for index in list(self._resident)[:-1]:
+            if total <= self.memory_budget_bytes:
+                return
+            if self._pins.get(index):
+                continue
+            total -= self._footprint(index)
+            self._close_shard(index)
+            self._stats['evictions'] += 1
+
+    def _close_shard(self, index: int):
+        shard = self._resident.pop(index)
+        self._record_expiry(index, shard.expiry_index.earliest(), replace=True)
+        # A shard that was only read is already on disk as it stands
+        shard.close(compact=index in self._dirty)
+        self._dirty.discard(index)
+        del self._clicks[index]
+
+    def _record_expiry(self, index: int, expires_at: Optional[int], replace: bool = False):
+        # Kept current whenever a shard's earliest deadline moves earlier, so a crash
+        # can leave it late (the shard is opened early) but never miss a due link
+        current = self.expiries.get(index)
+        if replace:
+            if expires_at == current:
+                return
+            if expires_at is None:
+                del self.expiries[index]
+            else:
+                self.expiries[index] = expires_at
+        elif expires_at is None or (current is not None and current <= expires_at):
+            return
+        else:
+            self.expiries[index] = expires_at
+        self._save_manifest()
+
+    def _by_shard(self, slugs) -> Dict[int, list]:
+        groups: Dict[int, list] = {}
+        for slug in slugs:
+            groups.setdefault(self.shard_index(slug), []).append(slug)
+        return groups
+
+    def save_link(self, link_data: LinkData, overwrite: bool = True) -> None:
+        index = self.shard_index(link_data.slug)
+        with self._shard(index, writes=True) as shard:
+            shard.save_link(link_data, overwrite)
+        with self._lock:
+            self._record_expiry(index, link_data.expires_at)
+
+    def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        groups: Dict[int, List[LinkData]] = {}
+        for link_data in link_datas:
+            groups.setdefault(self.shard_index(link_data.slug), []).append(link_data)
+        conflicts = []
+        for index, group in groups.items():
+            with self._shard(index, writes=True) as shard:
+                conflicts += shard.save_links(group, overwrite)
+            expiries = [link_data.expires_at for link_data in group if link_data.expires_at is not None]
+            with self._lock:
+                self._record_expiry(index, min(expiries) if expiries else None)
+        return conflicts
+
+    def get_link(self, slug: str) -> Optional[LinkData]:
+        with self._shard(self.shard_index(slug)) as shard:
+            return shard.get_link(slug)
+
+    def log_click(self, slug: str, click_log: ClickLog) -> None:
+        self.log_clicks(slug, [click_log])
+
+    def log_clicks(self, slug: str, click_logs: List[ClickLog]) -> None:
+        index = self.shard_index(slug)
+        with self._shard(index, writes=True) as shard:
+            # Sampled links stop growing once full, so count what was actually kept
+            retained = len(shard.analytics.get(slug, ()))
+            shard.log_clicks(slug, click_logs)
+            with self._lock:
+                self._clicks[index] += len(shard.analytics.get(slug, ())) - retained
+
+    def get_analytics(self, slug: str) -> Optional[Analytics]:
+        with self._shard(self.shard_index(slug)) as shard:
+            return shard.get_analytics(slug)
+
+    def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        with self._shard(self.shard_index(slug)) as shard:
+            return shard.get_rollup(slug)
+
+    def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        summaries = {}
+        for index, group in self._by_shard(dict.fromkeys(slugs)).items():
+            with self._shard(index) as shard:
+                summaries.update(shard.get_many(group))
+        return summaries
+
+    def iter_clicks(self, slug: str) -> Iterator[ClickLog]:
+        with self._shard(self.shard_index(slug)) as shard:
+            analytics = shard.get_analytics(slug)
+        # The view holds its own columns, so it stays readable if the shard is evicted
+        yield from analytics.click_logs if analytics else ()
+
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        with self._shard(self.shard_index(slug)) as shard:
+            return shard.get_click_page(slug, limit, cursor)
+
+    def rebuild_rollups(self) -> int:
+        # One shard at a time, so the budget still holds
+        rebuilt = 0
+        for index in range(self.shard_count):
+            if index in self._resident or os.path.exists(self.shard_path(index)):
+                with self._shard(index, writes=True) as shard:
+                    rebuilt += shard.rebuild_rollups()
+        return rebuilt
+
+    def allocate_id_block(self, size: int) -> int:
+        return self._ids.allocate_id_block(size)
+
+    def expired_slugs(self, now: int, limit: int) -> List[str]:
+        # Earliest first within each shard; shards whose earliest deadline is still ahead stay closed
+        with self._lock:
+            candidates = set(self._resident)
+            candidates.update(index for index, expires_at in self.expiries.items() if expires_at <= now)
+        found = []
+        for index in sorted(candidates):
+            if len(found) >= limit:
+                break
+            with self._shard(index) as shard:
+                found.extend(shard.expired_slugs(now, limit - len(found)))
+        return found
+
+    def delete_links(self, slugs: List[str], expired_before: Optional[int] = None) -> int:
+        deleted = 0
+        for index, group in self._by_shard(slugs).items():
+            with self._shard(index, writes=True) as shard:
+                retained = sum(len(shard.analytics.get(slug, ())) for slug in group)
+                deleted += shard.delete_links(group, expired_before)
+                with self._lock:
+                    self._clicks[index] -= retained - sum(len(shard.analytics.get(slug, ())) for slug in group)
+        return deleted
+
+    def get_shard_stats(self) -> dict:
+        with self._lock:
+            return {
+                'shards': self.shard_count,
+                'resident': len(self._resident),
+                'resident_bytes': sum(self._footprint(index) for index in self._resident),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                **self._stats
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            for index in list(self._resident):
+                self._close_shard(index)
+            self._ids.close()
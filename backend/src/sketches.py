@@ -0,0 +1,179 @@
+import hashlib
+import json
+import math
+import struct
+import sys
+import zlib
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+def _hash64(value: str, salt: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8, salt=salt).digest(), 'big')
+
+def _counters_to_bytes(counters: array) -> bytes:
+    # Stored little-endian whatever the host is
+    if sys.byteorder == 'big':
+        counters = array(counters.typecode, counters)
+        counters.byteswap()
+    return counters.tobytes()
+
+def _counters_from_bytes(typecode: str, data: bytes) -> array:
+    counters = array(typecode)
+    counters.frombytes(data)
+    if sys.byteorder == 'big':
+        counters.byteswap()
+    return counters
+
+class HyperLogLog:
+    # Distinct count in 2**precision one-byte registers (1 KB by default) with
+    # a relative standard error of 1.04 / sqrt(registers)
+    _SALT = b'hll'
+
+    def __init__(self, precision: int = 10, registers: Optional[bytearray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value: str) -> None:
+        hashed = _hash64(value, self._SALT)
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while most registers are still empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def copy(self) -> 'HyperLogLog':
+        return HyperLogLog(self.precision, bytearray(self.registers))
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        return cls(data[0], bytearray(zlib.decompress(data[1:])))
+
+    def __eq__(self, other):
+        return isinstance(other, HyperLogLog) and self.registers == other.registers
+
+class CountMinSketch:
+    # Frequency estimates that never undercount and overcount by at most
+    # epsilon * total with probability 1 - delta
+    _SALT = b'cms'
+
+    def __init__(self, width: int = 64, depth: int = 4, counters: Optional[array] = None, total: int = 0):
+        self.width = width
+        self.depth = depth
+        self.counters = counters if counters is not None else array('I', bytes(4 * width * depth))
+        self.total = total
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    def error_bound(self) -> int:
+        return math.ceil(self.epsilon * self.total)
+
+    def add(self, value: str, count: int = 1) -> int:
+        self.total += count
+        estimate = None
+        for slot in self._slots(value):
+            self.counters[slot] += count
+            estimate = self.counters[slot] if estimate is None else min(estimate, self.counters[slot])
+        return estimate
+
+    def estimate(self, value: str) -> int:
+        return min(self.counters[slot] for slot in self._slots(value))
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge count-min sketches of different shapes")
+        self.counters = array('I', (a + b for a, b in zip(self.counters, other.counters)))
+        self.total += other.total
+
+    def copy(self) -> 'CountMinSketch':
+        return CountMinSketch(self.width, self.depth, array('I', self.counters), self.total)
+
+    def to_bytes(self) -> bytes:
+        header = struct.pack('<HHQ', self.width, self.depth, self.total)
+        return header + zlib.compress(_counters_to_bytes(self.counters))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CountMinSketch':
+        width, depth, total = struct.unpack_from('<HHQ', data)
+        counters = _counters_from_bytes('I', zlib.decompress(data[struct.calcsize('<HHQ'):]))
+        return cls(width, depth, counters, total)
+
+    def _slots(self, value: str):
+        # Two halves of one hash give every row its own index (Kirsch-Mitzenmacher)
+        hashed = _hash64(value, self._SALT)
+        first, second = hashed & 0xFFFFFFFF, (hashed >> 32) | 1
+        for row in range(self.depth):
+            yield row * self.width + (first + row * second) % self.width
+
+    def __eq__(self, other):
+        return isinstance(other, CountMinSketch) and (self.total, self.counters) == (other.total, other.counters)
+
+class TopK:
+    # Heavy hitters: a count-min sketch for the counts plus the k values with
+    # the highest estimates seen so far
+    def __init__(self, k: int = 10, sketch: Optional[CountMinSketch] = None,
+                 candidates: Optional[Dict[str, int]] = None):
+        self.k = k
+        self.sketch = sketch if sketch is not None else CountMinSketch()
+        self.candidates = candidates if candidates is not None else {}
+
+    def add(self, value: str) -> None:
+        estimate = self.sketch.add(value)
+        if value in self.candidates or len(self.candidates) < self.k:
+            self.candidates[value] = estimate
+            return
+        smallest = min(self.candidates, key=self.candidates.get)
+        if estimate > self.candidates[smallest]:
+            del self.candidates[smallest]
+            self.candidates[value] = estimate
+
+    def top(self) -> List[Tuple[str, int]]:
+        return sorted(self.candidates.items(), key=lambda item: (-item[1], item[0]))
+
+    def merge(self, other: 'TopK') -> None:
+        self.sketch.merge(other.sketch)
+        merged = {value: self.sketch.estimate(value) for value in {**self.candidates, **other.candidates}}
+        self.candidates = dict(sorted(merged.items(), key=lambda item: (-item[1], item[0]))[:self.k])
+
+    def copy(self) -> 'TopK':
+        return TopK(self.k, self.sketch.copy(), dict(self.candidates))
+
+    def to_bytes(self) -> bytes:
+        sketch = self.sketch.to_bytes()
+        return struct.pack('<BI', self.k, len(sketch)) + sketch + json.dumps(self.candidates).encode()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'TopK':
+        k, length = struct.unpack_from('<BI', data)
+        offset = struct.calcsize('<BI')
+        sketch = CountMinSketch.from_bytes(data[offset:offset + length])
+        return cls(k, sketch, json.loads(data[offset + length:].decode()))
+
+    def __eq__(self, other):
+        return isinstance(other, TopK) and (self.sketch, self.candidates) == (other.sketch, other.candidates)
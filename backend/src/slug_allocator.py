@@ -0,0 +1,132 @@
+import hashlib
+import os
+import secrets
+import string
+import threading
+from typing import Callable
+
+ALPHABET = string.ascii_letters + string.digits
+SLUG_LENGTH = 7
+DEFAULT_BLOCK_SIZE = 1000
+
+class SlugConflictError(Exception):
+    # Raised by a conditional save when the slug is already taken
+    pass
+
+def encode_base62(value: int, length: int = SLUG_LENGTH) -> str:
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    if value:
+        raise ValueError("Value does not fit in the slug length")
+    return ''.join(reversed(chars))
+
+class FeistelPermutation:
+    # Keyed bijection on [0, domain). A balanced Feistel network permutes the
+    # smallest even-width power of two that covers the domain; values that
+    # land outside it are encrypted again (cycle walking) until they fall back in.
+    def __init__(self, key: bytes, domain: int, rounds: int = 4):
+        # blake2b keys are limited to 64 bytes
+        self.key = key if len(key) <= 64 else hashlib.blake2b(key).digest()
+        self.domain = domain
+        self.rounds = rounds
+        bits = max(2, (domain - 1).bit_length())
+        self._half_bits = (bits + 1) // 2
+        self._mask = (1 << self._half_bits) - 1
+
+    def permute(self, value: int) -> int:
+        if not 0 <= value < self.domain:
+            raise ValueError("Value outside the permutation domain")
+        value = self._encrypt(value)
+        while value >= self.domain:
+            value = self._encrypt(value)
+        return value
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._mask
+        for round_index in range(self.rounds):
+            left, right = right, left ^ self._round(round_index, right)
+        return (left << self._half_bits) | right
+
+    def _round(self, round_index: int, half: int) -> int:
+        digest = hashlib.blake2b(
+            round_index.to_bytes(1, 'big') + half.to_bytes(8, 'big'), key=self.key, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, 'big') & self._mask
+
+class BlockSlugAllocator:
+    # Hands out slugs from a block of sequential ids reserved in the repository
+    # (allocate_id_block), so creating a link needs no existence check and
+    # concurrent workers never pick the same id. The permutation keeps
+    # consecutive ids from producing guessable neighbouring slugs.
+    # Slugs are unique by construction, so bulk creation can skip the conditional write
+    unique = True
+
+    def __init__(self, block_source, key: bytes, block_size: int = DEFAULT_BLOCK_SIZE,
+                 length: int = SLUG_LENGTH):
+        self.block_source = block_source
+        self.block_size = block_size
+        self.length = length
+        self.permutation = FeistelPermutation(key, len(ALPHABET) ** length)
+        self._next_id = 0
+        self._block_end = 0
+        self._lock = threading.Lock()
+
+    def next_slug(self) -> str:
+        with self._lock:
+            if self._next_id >= self._block_end:
+                self._next_id = self.block_source.allocate_id_block(self.block_size)
+                self._block_end = self._next_id + self.block_size
+            value = self._next_id
+            self._next_id += 1
+        if value >= self.permutation.domain:
+            raise RuntimeError("Slug space exhausted")
+        return encode_base62(self.permutation.permute(value), self.length)
+
+class RandomSlugAllocator:
+    unique = False
+
+    def __init__(self, length: int = SLUG_LENGTH):
+        self.length = length
+
+    def next_slug(self) -> str:
+        return ''.join(secrets.choice(ALPHABET) for _ in range(self.length))
+
+def load_slug_key(path: str) -> bytes:
+    # The key has to outlive restarts as long as the id counter does: under a new key, fresh
+    # ids could permute onto slugs already handed out. So it is made once and kept at path.
+    if not os.path.exists(path):
+        # Written whole, then linked into place, so workers starting together agree on one key
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path) as f:
+        return f.read().strip().encode()
+
+def create_slug_allocator(repository, mode: str = None, key_source: Callable[[], bytes] = None):
+    # SLUG_ALLOCATOR=random keeps the old behaviour (uniqueness still comes
+    # from the conditional write). Block mode needs a secret key: SLUG_KEY, or
+    # else key_source's (see storage.slug_key). There is no default key; a known
+    # one would let anyone walk the id sequence and enumerate every link.
+    mode = mode or os.environ.get('SLUG_ALLOCATOR', 'block')
+    if mode == 'random':
+        return RandomSlugAllocator()
+    if mode != 'block':
+        raise ValueError(f"Unknown slug allocator: {mode}")
+    key = os.environ.get('SLUG_KEY', '').encode()
+    if not key and key_source is not None:
+        key = key_source()
+    if not key:
+        raise RuntimeError("SLUG_KEY must be set for the block slug allocator (or set SLUG_ALLOCATOR=random)")
+    block_size = int(os.environ.get('SLUG_BLOCK_SIZE', DEFAULT_BLOCK_SIZE))
+    return BlockSlugAllocator(repository, key, block_size)
@@ -0,0 +1,272 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from typing import Iterator, List, Optional, Tuple
+from click_store import ClickColumns, ClickDictionaries, StringDictionary
+from rollups import LinkRollup
+
+# Binary FileRepository snapshot, little-endian throughout:
+#
+#   header   magic, version, link count and the offsets of the sections below
+#   data     per link: link JSON, rollup JSON, then the click columns
+#            (uint32 timestamps, uint64 ips, uint16 countries, uint32 user agents)
+#   slugs    every slug's UTF-8 bytes, in sorted order
+#   index    one fixed-size entry per link, sorted by slug bytes
+#   meta     JSON: journal_seq, next_id and the shared click dictionaries
+#
+# Opening maps the file and reads only the header, index and meta, so links
+# can be served straight away; a link's record, rollup and clicks are decoded
+# the first time they are asked for.
+MAGIC = b'LPSNAP1\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIQQQQQQ')
+INDEX_ENTRY = struct.Struct('<QHqQIII')
+NO_EXPIRY = -(1 << 63)
+CLICK_BYTES = 4 + 8 + 2 + 4
+
+def is_binary_snapshot(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+class _SlugKeys:
+    # Sequence view over the index's slugs so bisect can search the mapped file
+    def __init__(self, snapshot: 'BinarySnapshot'):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return self._snapshot.count
+
+    def __getitem__(self, position: int) -> bytes:
+        return self._snapshot.slug_bytes(position)
+
+class BinarySnapshot:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.count, self._slugs_offset, _, self._index_offset,
+         meta_offset, meta_length) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} LinkPulse snapshot")
+        self.meta = json.loads(self._mmap[meta_offset:meta_offset + meta_length])
+        self._keys = _SlugKeys(self)
+
+    def find(self, slug: str) -> Optional[int]:
+        key = slug.encode()
+        position = bisect_left(self._keys, key)
+        if position < self.count and self.slug_bytes(position) == key:
+            return position
+        return None
+
+    def entry(self, position: int) -> tuple:
+        return INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + position * INDEX_ENTRY.size)
+
+    def slug_bytes(self, position: int) -> bytes:
+        slug_offset, slug_length = struct.unpack_from('<QH', self._mmap,
+                                                      self._index_offset + position * INDEX_ENTRY.size)
+        start = self._slugs_offset + slug_offset
+        return self._mmap[start:start + slug_length]
+
+    def slugs(self) -> Iterator[str]:
+        for position in range(self.count):
+            yield self.slug_bytes(position).decode()
+
+    def expiries(self) -> Iterator[Tuple[str, int]]:
+        for position in range(self.count):
+            expires_at = self.entry(position)[2]
+            if expires_at != NO_EXPIRY:
+                yield self.slug_bytes(position).decode(), expires_at
+
+    def click_total(self) -> int:
+        return sum(self.entry(position)[6] for position in range(self.count))
+
+    def dictionaries(self) -> ClickDictionaries:
+        dictionaries = ClickDictionaries()
+        for name in ('countries', 'user_agents', 'ips'):
+            setattr(dictionaries, name, _string_dictionary(self.meta['dictionaries'][name]))
+        return dictionaries
+
+    def link(self, position: int) -> dict:
+        _, _, _, data_offset, link_length, _, _ = self.entry(position)
+        return json.loads(self._mmap[data_offset:data_offset + link_length])
+
+    def rollup(self, position: int) -> LinkRollup:
+        _, _, _, data_offset, link_length, rollup_length, _ = self.entry(position)
+        start = data_offset + link_length
+        return LinkRollup.from_dict(json.loads(self._mmap[start:start + rollup_length]))
+
+    def clicks(self, position: int, dictionaries: ClickDictionaries) -> ClickColumns:
+        _, _, _, data_offset, link_length, rollup_length, count = self.entry(position)
+        offset = data_offset + link_length + rollup_length
+        columns = ClickColumns(dictionaries)
+        for name, typecode in (('timestamps', 'I'), ('ips', 'Q'), ('countries', 'H'), ('user_agents', 'I')):
+            column = array(typecode)
+            length = column.itemsize * count
+            column.frombytes(self._mmap[offset:offset + length])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            setattr(columns, name, column)
+            offset += length
+        return columns
+
+    def raw(self, position: int) -> Tuple[bytes, bytes, bytes, int]:
+        # Encoded link, rollup and click bytes, copied as-is when a snapshot is rewritten
+        _, _, _, data_offset, link_length, rollup_length, count = self.entry(position)
+        rollup_start = data_offset + link_length
+        clicks_start = rollup_start + rollup_length
+        return (self._mmap[data_offset:rollup_start], self._mmap[rollup_start:clicks_start],
+                self._mmap[clicks_start:clicks_start + count * CLICK_BYTES], count)
+
+class SnapshotMapping(MutableMapping):
+    # Dict over one section of a snapshot. Entries are decoded on first access
+    # and kept in an overlay, which also takes every write and delete, so
+    # in-place updates (click_count += 1, columns.append) behave as on a dict.
+    def __init__(self, snapshot: BinarySnapshot, decode):
+        self.snapshot = snapshot
+        self._decode = decode
+        self._overlay: dict = {}
+        self._deleted = set()
+        # Snapshot slugs that are overlaid or deleted, so __len__ needs no scan
+        self._hidden = set()
+
+    def __getitem__(self, key):
+        if key in self._overlay:
+            return self._overlay[key]
+        position = self.position(key)
+        if position is None:
+            raise KeyError(key)
+        # setdefault so a reader racing a locked writer never swaps in a second, stale copy
+        value = self._overlay.setdefault(key, self._decode(position))
+        self._hidden.add(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self._hidden and self.snapshot.find(key) is not None:
+            self._hidden.add(key)
+        self._overlay[key] = value
+
+    def __delitem__(self, key):
+        found = self._overlay.pop(key, _MISSING) is not _MISSING
+        if key not in self._deleted and self.snapshot.find(key) is not None:
+            self._deleted.add(key)
+            self._hidden.add(key)
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._overlay or self.position(key) is not None
+
+    def __iter__(self):
+        yield from list(self._overlay)
+        for slug in self.snapshot.slugs():
+            if slug not in self._hidden:
+                yield slug
+
+    def __len__(self):
+        return len(self._overlay) + self.snapshot.count - len(self._hidden)
+
+    def pop(self, key, *default):
+        # Deleting must not decode the entry first, as MutableMapping.pop would
+        try:
+            value = self._overlay.get(key)
+            del self[key]
+            return value
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+
+    def position(self, key) -> Optional[int]:
+        # Index position of an entry still served from the snapshot, else None
+        if key in self._hidden:
+            return None
+        return self.snapshot.find(key)
+
+_MISSING = object()
+
+def write_snapshot(path: str, links, analytics, rollups, dictionaries: ClickDictionaries, meta: dict) -> None:
+    # Entries still undecoded in a SnapshotMapping are copied byte for byte
+    slugs = sorted(links, key=lambda slug: slug.encode())
+    entries = []
+    with open(path, 'wb') as f:
+        f.write(b'\x00' * HEADER.size)
+        for slug in slugs:
+            raw = _raw_entry(slug, links, analytics, rollups)
+            if raw is None:
+                link = links[slug]
+                columns = analytics.get(slug)
+                rollup = rollups.get(slug)
+                raw = (
+                    json.dumps(link, separators=(',', ':')).encode(),
+                    json.dumps((rollup or LinkRollup()).to_dict(), separators=(',', ':')).encode(),
+                    _column_bytes(columns) if columns is not None else b'',
+                    len(columns) if columns is not None else 0
+                )
+                expires_at = link['expires_at']
+            else:
+                expires_at = links.snapshot.entry(links.position(slug))[2]
+                expires_at = None if expires_at == NO_EXPIRY else expires_at
+            link_bytes, rollup_bytes, click_bytes, count = raw
+            entries.append((slug.encode(), expires_at, f.tell(), len(link_bytes), len(rollup_bytes), count))
+            f.write(link_bytes)
+            f.write(rollup_bytes)
+            f.write(click_bytes)
+
+        slugs_offset = f.tell()
+        slug_offsets = []
+        for slug_bytes, *_ in entries:
+            slug_offsets.append(f.tell() - slugs_offset)
+            f.write(slug_bytes)
+        slugs_length = f.tell() - slugs_offset
+
+        index_offset = f.tell()
+        for (slug_bytes, expires_at, data_offset, link_length, rollup_length, count), slug_offset in zip(
+                entries, slug_offsets):
+            f.write(INDEX_ENTRY.pack(slug_offset, len(slug_bytes), NO_EXPIRY if expires_at is None else expires_at,
+                                     data_offset, link_length, rollup_length, count))
+
+        meta = dict(meta, dictionaries={
+            'countries': dictionaries.countries.values,
+            'user_agents': dictionaries.user_agents.values,
+            'ips': dictionaries.ips.values
+        })
+        meta_bytes = json.dumps(meta, separators=(',', ':')).encode()
+        meta_offset = f.tell()
+        f.write(meta_bytes)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries), slugs_offset, slugs_length, index_offset,
+                            meta_offset, len(meta_bytes)))
+        f.flush()
+
+def _raw_entry(slug: str, links, analytics, rollups):
+    # Only when none of the three sections has been decoded or changed for this slug
+    if not all(isinstance(mapping, SnapshotMapping) for mapping in (links, analytics, rollups)):
+        return None
+    position = links.position(slug)
+    if position is None or analytics.position(slug) is None or rollups.position(slug) is None:
+        return None
+    return links.snapshot.raw(position)
+
+def _column_bytes(columns: ClickColumns) -> bytes:
+    chunks = []
+    for column in (columns.timestamps, columns.ips, columns.countries, columns.user_agents):
+        if sys.byteorder == 'big':
+            column = array(column.typecode, column)
+            column.byteswap()
+        chunks.append(column.tobytes())
+    return b''.join(chunks)
+
+def _string_dictionary(values: List[str]) -> StringDictionary:
+    dictionary = StringDictionary()
+    dictionary.values = list(values)
+    dictionary._codes = {value: code for code, value in enumerate(values)}
+    return dictionary
@@ -0,0 +1,457 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional
+from models import LinkData, ClickLog, Analytics, ClickPage, LinkSummary
+from data_layer import LinkRepository, SlugConflictError
+from rollups import LinkRollup, RECENT_CLICKS
+from sampling import sample_slot, is_sampled
+from sketches import HyperLogLog, TopK
+from pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    slug TEXT PRIMARY KEY,
+    original_url TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    expires_at INTEGER,
+    click_count INTEGER NOT NULL DEFAULT 0,
+    first_click INTEGER,
+    last_click INTEGER,
+    redirect_cache TEXT,
+    click_sample_size INTEGER
+) WITHOUT ROWID;
+-- Only links that can expire are indexed; the sweeper walks it in expiry order
+CREATE INDEX IF NOT EXISTS links_expires_at ON links (expires_at) WHERE expires_at IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS clicks (
+    id INTEGER PRIMARY KEY,
+    slug TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    ip TEXT NOT NULL,
+    user_agent TEXT NOT NULL,
+    country TEXT NOT NULL,
+    -- Position in a sampled link's reservoir; NULL for links that keep every click
+    slot INTEGER
+);
+CREATE INDEX IF NOT EXISTS clicks_slug_timestamp ON clicks (slug, timestamp);
+
+CREATE TABLE IF NOT EXISTS click_hourly (
+    slug TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    clicks INTEGER NOT NULL,
+    PRIMARY KEY (slug, hour)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS click_countries (
+    slug TEXT NOT NULL,
+    country TEXT NOT NULL,
+    clicks INTEGER NOT NULL,
+    PRIMARY KEY (slug, country)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS link_sketches (
+    slug TEXT PRIMARY KEY,
+    unique_ips BLOB NOT NULL,
+    user_agents BLOB NOT NULL,
+    -- JSON list; only sampled links, whose clicks table may have dropped them, keep it
+    recent_clicks TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO counters (name, value) VALUES ('slug_id', 0);
+"""
+
+# Columns added since the first schema; older databases get them on open
+ADDED_COLUMNS = (
+    ('links', 'redirect_cache', 'TEXT'),
+    ('links', 'click_sample_size', 'INTEGER'),
+    ('clicks', 'slot', 'INTEGER'),
+    ('link_sketches', 'recent_clicks', 'TEXT')
+)
+# Created after ADDED_COLUMNS, since it needs the slot column
+CLICK_SLOT_INDEX = ('CREATE UNIQUE INDEX IF NOT EXISTS clicks_slug_slot ON clicks (slug, slot) '
+                    'WHERE slot IS NOT NULL')
+
+# Per-link tables cleared when a slug is saved again
+CLICK_TABLES = ('clicks', 'click_hourly', 'click_countries', 'link_sketches')
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache compiles each one once and reuses it
+SELECT_LINK = ('SELECT slug, original_url, created_at, expires_at, click_count, redirect_cache, click_sample_size '
+               'FROM links WHERE slug = ?')
+INSERT_LINK = ('INSERT INTO links '
+               '(slug, original_url, created_at, expires_at, click_count, redirect_cache, click_sample_size) '
+               'VALUES (?, ?, ?, ?, ?, ?, ?)')
+INSERT_NEW_LINK = INSERT_LINK + ' ON CONFLICT (slug) DO NOTHING'
+REPLACE_LINK = ('INSERT OR REPLACE INTO links '
+                '(slug, original_url, created_at, expires_at, click_count, redirect_cache, click_sample_size) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)')
+SELECT_LINK_TOTALS = 'SELECT click_count, first_click, last_click, click_sample_size FROM links WHERE slug = ?'
+INSERT_CLICK = 'INSERT INTO clicks (slug, timestamp, ip, user_agent, country) VALUES (?, ?, ?, ?, ?)'
+# A sampled click either fills a new slot or overwrites the one the reservoir picked
+UPSERT_SAMPLED_CLICK = (
+    'INSERT INTO clicks (slug, slot, timestamp, ip, user_agent, country) VALUES (?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (slug, slot) WHERE slot IS NOT NULL DO UPDATE SET timestamp = excluded.timestamp, '
+    'ip = excluded.ip, user_agent = excluded.user_agent, country = excluded.country'
+)
+SELECT_RECENT_SAMPLED = 'SELECT recent_clicks FROM link_sketches WHERE slug = ?'
+UPDATE_RECENT_SAMPLED = 'UPDATE link_sketches SET recent_clicks = ? WHERE slug = ?'
+# rebuild_rollups only recomputes links that still have every click
+UNSAMPLED_SLUGS = 'slug IN (SELECT slug FROM links WHERE click_sample_size IS NULL)'
+UPDATE_LINK_COUNTERS = (
+    'UPDATE links SET click_count = click_count + ?, '
+    'first_click = MIN(COALESCE(first_click, ?), ?), '
+    'last_click = MAX(COALESCE(last_click, ?), ?) '
+    'WHERE slug = ?'
+)
+UPSERT_HOURLY = ('INSERT INTO click_hourly (slug, hour, clicks) VALUES (?, ?, ?) '
+                 'ON CONFLICT (slug, hour) DO UPDATE SET clicks = clicks + excluded.clicks')
+UPSERT_COUNTRY = ('INSERT INTO click_countries (slug, country, clicks) VALUES (?, ?, ?) '
+                  'ON CONFLICT (slug, country) DO UPDATE SET clicks = clicks + excluded.clicks')
+SELECT_CLICKS_PAGE = (
+    'SELECT id, timestamp, ip, user_agent, country FROM clicks '
+    'WHERE slug = ? AND (timestamp, id) > (?, ?) ORDER BY timestamp, id LIMIT ?'
+)
+# SQLite caps bound parameters per statement (999 on older builds)
+SUMMARY_CHUNK = 500
+
+SELECT_SKETCHES = 'SELECT unique_ips, user_agents FROM link_sketches WHERE slug = ?'
+UPSERT_SKETCHES = ('INSERT INTO link_sketches (slug, unique_ips, user_agents) VALUES (?, ?, ?) '
+                   'ON CONFLICT (slug) DO UPDATE SET unique_ips = excluded.unique_ips, '
+                   'user_agents = excluded.user_agents')
+SELECT_EXPIRED = (
+    'SELECT slug FROM links WHERE expires_at IS NOT NULL AND expires_at <= ? ORDER BY expires_at LIMIT ?'
+)
+DELETE_EXPIRED_LINK = 'DELETE FROM links WHERE slug = ? AND expires_at IS NOT NULL AND expires_at <= ?'
+SELECT_RECENT_CLICKS = (
+    'SELECT timestamp, ip, user_agent, country FROM clicks '
+    'WHERE slug = ? ORDER BY timestamp DESC, id DESC LIMIT ?'
+)
+
+class SqliteRepository(LinkRepository):
+    # Shared by every gunicorn worker through one WAL-mode database file.
+    # Each thread gets its own connection.
+    def __init__(self, db_path: str = 'linkpulse.db', busy_timeout_ms: int = 5000):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+
+        dir_path = os.path.dirname(db_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            for table, column, column_type in ADDED_COLUMNS:
+                if column not in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+            conn.execute(CLICK_SLOT_INDEX)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def save_link(self, link_data: LinkData, overwrite: bool = True) -> None:
+        row = (
+            link_data.slug,
+            link_data.original_url,
+            link_data.created_at,
+            link_data.expires_at,
+            link_data.click_count,
+            link_data.redirect_cache,
+            link_data.click_sample_size
+        )
+        if not overwrite:
+            # The primary key is the uniqueness check; nothing is read first
+            try:
+                with self._connection() as conn:
+                    conn.execute(INSERT_LINK, row)
+            except sqlite3.IntegrityError:
+                raise SlugConflictError(link_data.slug)
+            return
+
+        with self._connection() as conn:
+            # Re-saving a slug starts it over, like the other repositories
+            for table in CLICK_TABLES:
+                conn.execute(f'DELETE FROM {table} WHERE slug = ?', (link_data.slug,))
+            conn.execute(REPLACE_LINK, row)
+
+    def save_links(self, link_datas: List[LinkData], overwrite: bool = True) -> List[str]:
+        # One transaction for the whole batch
+        rows = [
+            (
+                link_data.slug,
+                link_data.original_url,
+                link_data.created_at,
+                link_data.expires_at,
+                link_data.click_count,
+                link_data.redirect_cache,
+                link_data.click_sample_size
+            ) for link_data in link_datas
+        ]
+        conflicts = []
+        with self._connection() as conn:
+            if not overwrite:
+                # Taken slugs are left alone, clicks and all; nothing is read first
+                for row in rows:
+                    if conn.execute(INSERT_NEW_LINK, row).rowcount == 0:
+                        conflicts.append(row[0])
+                return conflicts
+            slugs = [(row[0],) for row in rows]
+            for table in CLICK_TABLES:
+                conn.executemany(f'DELETE FROM {table} WHERE slug = ?', slugs)
+            conn.executemany(REPLACE_LINK, rows)
+        return conflicts
+
+    def get_link(self, slug: str) -> Optional[LinkData]:
+        row = self._connection().execute(SELECT_LINK, (slug,)).fetchone()
+        if row is None:
+            return None
+        return LinkData(
+            slug=row[0],
+            original_url=row[1],
+            created_at=row[2],
+            expires_at=row[3],
+            click_count=row[4],
+            redirect_cache=row[5],
+            click_sample_size=row[6]
+        )
+
+    def log_click(self, slug: str, click_log: ClickLog) -> None:
+        self.log_clicks(slug, [click_log])
+
+    def log_clicks(self, slug: str, click_logs: List[ClickLog]) -> None:
+        if not click_logs:
+            return
+
+        hourly: Dict[int, int] = {}
+        countries: Dict[str, int] = {}
+        for click_log in click_logs:
+            hour = click_log.timestamp // 3600 * 3600
+            hourly[hour] = hourly.get(hour, 0) + 1
+            countries[click_log.country] = countries.get(click_log.country, 0) + 1
+        first = min(log.timestamp for log in click_logs)
+        last = max(log.timestamp for log in click_logs)
+
+        # One transaction per batch: the click rows plus the rollup counters
+        with self._connection() as conn:
+            updated = conn.execute(UPDATE_LINK_COUNTERS, (len(click_logs), first, first, last, last, slug))
+            if updated.rowcount == 0:
+                return
+            click_count, _, _, sample_size = conn.execute(SELECT_LINK_TOTALS, (slug,)).fetchone()
+            if sample_size is None:
+                conn.executemany(INSERT_CLICK, [
+                    (slug, log.timestamp, log.ip, log.user_agent, log.country) for log in click_logs
+                ])
+            else:
+                self._store_sampled(conn, slug, click_logs, click_count - len(click_logs), sample_size)
+            conn.executemany(UPSERT_HOURLY, [(slug, hour, count) for hour, count in hourly.items()])
+            conn.executemany(UPSERT_COUNTRY, [(slug, country, count) for country, count in countries.items()])
+            # Read-modify-write is safe here: the UPDATE above holds the write lock
+            unique_ips, user_agents = self._load_sketches(conn, slug)
+            for click_log in click_logs:
+                unique_ips.add(click_log.ip)
+                user_agents.add(click_log.user_agent)
+            conn.execute(UPSERT_SKETCHES, (slug, unique_ips.to_bytes(), user_agents.to_bytes()))
+            if sample_size is not None:
+                # The clicks table may not have a sampled link's latest clicks, so they are kept here
+                row = conn.execute(SELECT_RECENT_SAMPLED, (slug,)).fetchone()
+                recent = json.loads(row[0]) if row and row[0] else []
+                recent += [[log.timestamp, log.ip, log.user_agent, log.country] for log in click_logs]
+                conn.execute(UPDATE_RECENT_SAMPLED, (json.dumps(recent[-RECENT_CLICKS:]), slug))
+
+    def _store_sampled(self, conn: sqlite3.Connection, slug: str, click_logs: List[ClickLog],
+                       clicks_before: int, sample_size: int) -> None:
+        # The counter UPDATE holds the write lock, so the count and slots can't race another writer
+        retained = conn.execute('SELECT COUNT(*) FROM clicks WHERE slug = ?', (slug,)).fetchone()[0]
+        rows = []
+        for seen, log in enumerate(click_logs, clicks_before + 1):
+            slot = sample_slot(sample_size, seen, retained)
+            if slot is None:
+                continue
+            retained = max(retained, slot + 1)
+            rows.append((slug, slot, log.timestamp, log.ip, log.user_agent, log.country))
+        conn.executemany(UPSERT_SAMPLED_CLICK, rows)
+
+    def get_analytics(self, slug: str) -> Optional[Analytics]:
+        row = self._connection().execute(SELECT_LINK_TOTALS, (slug,)).fetchone()
+        if row is None:
+            return None
+
+        return Analytics(
+            total_clicks=row[0],
+            first_click=row[1],
+            last_click=row[2],
+            click_logs=list(self.iter_clicks(slug)),
+            sampled=is_sampled(row[3], row[0])
+        )
+
+    def iter_clicks(self, slug: str) -> Iterator[ClickLog]:
+        # Keyset pages keep each read transaction short while streaming
+        after = (-1, -1)
+        while True:
+            rows = self._connection().execute(SELECT_CLICKS_PAGE, (slug, after[0], after[1], 1000)).fetchall()
+            for row in rows:
+                yield _click_log(row[1:])
+            if len(rows) < 1000:
+                return
+            after = (rows[-1][1], rows[-1][0])
+
+    def get_click_page(self, slug: str, limit: int = DEFAULT_PAGE_SIZE,
+                       cursor: Optional[str] = None) -> Optional[ClickPage]:
+        link_data = self.get_link(slug)
+        if link_data is None:
+            return None
+
+        after_timestamp, after_id = -1, -1
+        if cursor:
+            position = decode_cursor(cursor)
+            after_timestamp, after_id = position.get('ts'), position.get('id')
+            if not isinstance(after_timestamp, int) or not isinstance(after_id, int):
+                raise ValueError("Invalid cursor")
+
+        rows = self._connection().execute(
+            SELECT_CLICKS_PAGE, (slug, after_timestamp, after_id, limit + 1)
+        ).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor({'ts': rows[-1][1], 'id': rows[-1][0]})
+        return ClickPage(click_logs=[_click_log(row[1:]) for row in rows], next_cursor=next_cursor,
+                         sampled=is_sampled(link_data.click_sample_size, link_data.click_count))
+
+    def get_rollup(self, slug: str) -> Optional[LinkRollup]:
+        conn = self._connection()
+        row = conn.execute(SELECT_LINK_TOTALS, (slug,)).fetchone()
+        if row is None:
+            return None
+
+        hourly = conn.execute('SELECT hour, clicks FROM click_hourly WHERE slug = ?', (slug,)).fetchall()
+        countries = conn.execute('SELECT country, clicks FROM click_countries WHERE slug = ?', (slug,)).fetchall()
+        if row[3] is None:
+            recent = conn.execute(SELECT_RECENT_CLICKS, (slug, RECENT_CLICKS)).fetchall()
+        else:
+            stored = conn.execute(SELECT_RECENT_SAMPLED, (slug,)).fetchone()
+            recent = list(reversed(json.loads(stored[0]))) if stored and stored[0] else []
+        unique_ips, user_agents = self._load_sketches(conn, slug)
+        return LinkRollup(
+            total_clicks=row[0],
+            first_click=row[1],
+            last_click=row[2],
+            hourly=dict(hourly),
+            countries=dict(countries),
+            recent_clicks=[_click_log(r) for r in reversed(recent)],
+            unique_ips=unique_ips,
+            user_agents=user_agents
+        )
+
+    def get_many(self, slugs: List[str]) -> Dict[str, LinkSummary]:
+        conn = self._connection()
+        unique_slugs = list(dict.fromkeys(slugs))
+        summaries = {}
+        for start in range(0, len(unique_slugs), SUMMARY_CHUNK):
+            chunk = unique_slugs[start:start + SUMMARY_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = conn.execute(
+                'SELECT slug, original_url, created_at, expires_at, click_count, first_click, last_click, '
+                '(SELECT COUNT(*) FROM click_countries WHERE click_countries.slug = links.slug), redirect_cache, '
+                'click_sample_size '
+                f'FROM links WHERE slug IN ({placeholders})', chunk
+            ).fetchall()
+            for row in rows:
+                summaries[row[0]] = LinkSummary(
+                    link_data=LinkData(
+                        slug=row[0],
+                        original_url=row[1],
+                        created_at=row[2],
+                        expires_at=row[3],
+                        click_count=row[4],
+                        redirect_cache=row[8],
+                        click_sample_size=row[9]
+                    ),
+                    first_click=row[5],
+                    last_click=row[6],
+                    unique_countries=row[7]
+                )
+        return summaries
+
+    def rebuild_rollups(self) -> int:
+        # A sample can't give back exact totals, so sampled links keep the rollups they have
+        with self._connection() as conn:
+            conn.execute(f'DELETE FROM click_hourly WHERE {UNSAMPLED_SLUGS}')
+            conn.execute(f'DELETE FROM click_countries WHERE {UNSAMPLED_SLUGS}')
+            conn.execute(f'DELETE FROM link_sketches WHERE {UNSAMPLED_SLUGS}')
+            conn.execute(
+                'INSERT INTO click_hourly (slug, hour, clicks) '
+                'SELECT slug, timestamp / 3600 * 3600, COUNT(*) FROM clicks '
+                f'WHERE {UNSAMPLED_SLUGS} GROUP BY slug, timestamp / 3600'
+            )
+            conn.execute(
+                'INSERT INTO click_countries (slug, country, clicks) '
+                f'SELECT slug, country, COUNT(*) FROM clicks WHERE {UNSAMPLED_SLUGS} GROUP BY slug, country'
+            )
+            conn.execute(
+                'UPDATE links SET '
+                'click_count = (SELECT COUNT(*) FROM clicks WHERE clicks.slug = links.slug), '
+                'first_click = (SELECT MIN(timestamp) FROM clicks WHERE clicks.slug = links.slug), '
+                'last_click = (SELECT MAX(timestamp) FROM clicks WHERE clicks.slug = links.slug) '
+                'WHERE click_sample_size IS NULL'
+            )
+            slugs = [row[0] for row in conn.execute(
+                f'SELECT DISTINCT slug FROM clicks WHERE {UNSAMPLED_SLUGS}'
+            ).fetchall()]
+            for slug in slugs:
+                rollup = LinkRollup.from_clicks(self.iter_clicks(slug))
+                conn.execute(UPSERT_SKETCHES, (slug, rollup.unique_ips.to_bytes(), rollup.user_agents.to_bytes()))
+            return conn.execute('SELECT COUNT(*) FROM links').fetchone()[0]
+
+    def allocate_id_block(self, size: int) -> int:
+        # The UPDATE takes the write lock, so the read after it can't race another worker
+        with self._connection() as conn:
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'slug_id'", (size,))
+            end = conn.execute("SELECT value FROM counters WHERE name = 'slug_id'").fetchone()[0]
+        return end - size
+
+    def expired_slugs(self, now: int, limit: int) -> List[str]:
+        return [row[0] for row in self._connection().execute(SELECT_EXPIRED, (now, limit)).fetchall()]
+
+    def delete_links(self, slugs: List[str], expired_before: Optional[int] = None) -> int:
+        # Clicks go only for links this transaction removed, never for one re-saved meanwhile
+        with self._connection() as conn:
+            deleted = []
+            for slug in dict.fromkeys(slugs):
+                if expired_before is None:
+                    cursor = conn.execute('DELETE FROM links WHERE slug = ?', (slug,))
+                else:
+                    cursor = conn.execute(DELETE_EXPIRED_LINK, (slug, expired_before))
+                if cursor.rowcount:
+                    deleted.append((slug,))
+            for table in CLICK_TABLES:
+                conn.executemany(f'DELETE FROM {table} WHERE slug = ?', deleted)
+        return len(deleted)
+
+    @staticmethod
+    def _load_sketches(conn: sqlite3.Connection, slug: str):
+        row = conn.execute(SELECT_SKETCHES, (slug,)).fetchone()
+        if row is None:
+            return HyperLogLog(), TopK()
+        return HyperLogLog.from_bytes(row[0]), TopK.from_bytes(row[1])
+
+def _click_log(row) -> ClickLog:
+    return ClickLog(timestamp=row[0], ip=row[1], user_agent=row[2], country=row[3])
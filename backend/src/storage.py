@@ -0,0 +1,43 @@
+import atexit
+import os
+import secrets
+from data_layer import FileRepository, InMemoryRepository
+from sqlite_repository import SqliteRepository
+from sharded_repository import ShardedFileRepository
+from slug_allocator import load_slug_key
+
+def create_repository():
+    # LINKPULSE_STORAGE=sqlite lets several gunicorn workers share one database
+    storage = os.environ.get('LINKPULSE_STORAGE', 'file')
+    if storage == 'sqlite':
+        return SqliteRepository(os.environ.get('LINKPULSE_DB_PATH', 'linkpulse.db'))
+    if storage == 'memory':
+        return InMemoryRepository()
+    if storage == 'sharded':
+        backend = ShardedFileRepository(
+            os.environ.get('LINKPULSE_SHARD_DIR', 'linkpulse_shards'),
+            shard_count=int(os.environ.get('LINKPULSE_SHARDS', 64)),
+            memory_budget_bytes=int(os.environ.get('LINKPULSE_SHARD_MEMORY_MB', 256)) * 1024 * 1024,
+            snapshot_format=os.environ.get('LINKPULSE_SNAPSHOT_FORMAT')
+        )
+        atexit.register(backend.close)
+        return backend
+    backend = FileRepository(os.environ.get('LINKPULSE_DATA_FILE', 'linkpulse_data.json'), journaled=True,
+                             snapshot_format=os.environ.get('LINKPULSE_SNAPSHOT_FORMAT'))
+    atexit.register(backend.close)
+    return backend
+
+def slug_key() -> bytes:
+    # Key for the block slug allocator when SLUG_KEY is not set, kept next to the data
+    # create_repository() opens, so it lives exactly as long as the ids it permutes
+    storage = os.environ.get('LINKPULSE_STORAGE', 'file')
+    if storage == 'memory':
+        # Ids start over with the process, and so can the key
+        return secrets.token_hex(32).encode()
+    if storage == 'sqlite':
+        return load_slug_key(os.environ.get('LINKPULSE_DB_PATH', 'linkpulse.db') + '.slugkey')
+    if storage == 'sharded':
+        directory = os.environ.get('LINKPULSE_SHARD_DIR', 'linkpulse_shards')
+        os.makedirs(directory, exist_ok=True)
+        return load_slug_key(os.path.join(directory, 'slug.key'))
+    return load_slug_key(os.environ.get('LINKPULSE_DATA_FILE', 'linkpulse_data.json') + '.slugkey')
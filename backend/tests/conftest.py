@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models import LinkData, ClickLog
+
+# Link and click factories shared by the test modules, which import them from here
+
+def make_link(slug='abc1234', expires_at=None):
+    return LinkData(
+        slug=slug,
+        original_url='https://drive.google.com/file/d/123/view',
+        created_at=1700000000,
+        expires_at=expires_at
+    )
+
+def make_click(timestamp=1700000100, country='US', ip='1.2.3.4'):
+    return ClickLog(timestamp=timestamp, ip=ip, user_agent='Test Agent', country=country)
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from async_layer import ThreadPoolRepository, AsyncLinkBusinessService
+from data_layer import InMemoryRepository
+from metrics import MetricsRegistry
+from models import ClickLog
+from asgi_server import LinkPulseApp
+from conftest import make_link
+
+class StubGeoService:
+    async def get_country(self, ip: str) -> str:
+        return 'US'
+
+async def call(app, method, path, body=None, query=b'', headers=()):
+    sent = []
+    payload = json.dumps(body).encode() if body is not None else b''
+
+    async def receive():
+        return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': [(b'user-agent', b'Test Agent'), *headers], 'client': ('1.2.3.4', 5000)}
+    await app(scope, receive, send)
+    headers = dict(sent[0]['headers'])
+    return sent[0]['status'], headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+class TestAsyncLinkBusinessService:
+    def test_redirect_logs_click_through_thread_pool(self):
+        repository = InMemoryRepository()
+        repository.save_link(make_link())
+        service = AsyncLinkBusinessService(ThreadPoolRepository(repository), geo_service=StubGeoService(),
+                                           metrics=MetricsRegistry())
+
+        url = asyncio.run(service.get_redirect_url('abc1234', '1.2.3.4', 'Test Agent'))
+        assert url == 'https://drive.google.com/file/d/123/view'
+        assert repository.get_analytics('abc1234').click_logs[0].country == 'US'
+        assert asyncio.run(service.get_redirect_url('missing', '1.2.3.4', 'Test Agent')) is None
+
+    def test_export_clicks_streams_in_chunks(self):
+        repository = InMemoryRepository()
+        repository.save_link(make_link())
+        repository.log_clicks('abc1234', [
+            ClickLog(1700000000 + i, '1.2.3.4', 'Test Agent', 'US') for i in range(7)
+        ])
+        service = AsyncLinkBusinessService(ThreadPoolRepository(repository, chunk_size=3),
+                                           metrics=MetricsRegistry())
+
+        async def collect():
+            click_logs, sampled = await service.export_clicks('abc1234')
+            return [log.timestamp async for log in click_logs], sampled
+        assert asyncio.run(collect()) == ([1700000000 + i for i in range(7)], False)
+
+    def test_concurrent_creates_get_distinct_slugs(self):
+        service = AsyncLinkBusinessService(ThreadPoolRepository(InMemoryRepository()), metrics=MetricsRegistry())
+
+        async def create_many():
+            return await asyncio.gather(*[
+                service.create_short_link('https://drive.google.com/file/d/123/view') for _ in range(50)
+            ])
+        assert len({link.slug for link in asyncio.run(create_many())}) == 50
+
+class TestAsgiApp:
+    @pytest.fixture
+    def app(self, monkeypatch):
+        monkeypatch.setenv('SLUG_KEY', 'test-key')
+        return LinkPulseApp(repository=InMemoryRepository(), start_background=False)
+
+    def test_shorten_redirect_and_stats(self, app):
+        async def scenario():
+            status, _, body = await call(app, 'POST', '/dev/shorten',
+                                         {'url': 'https://drive.google.com/file/d/123/view'})
+            slug = json.loads(body)['slug']
+            redirect = await call(app, 'GET', f'/u/{slug}')
+            stats = await call(app, 'GET', f'/dev/stats/{slug}')
+            missing = await call(app, 'GET', '/u/missing')
+            return status, redirect, stats, missing
+
+        status, redirect, stats, missing = asyncio.run(scenario())
+        assert status == 200
+        assert redirect[0] == 302
+        assert redirect[1][b'location'] == b'https://drive.google.com/file/d/123/view'
+        assert json.loads(stats[2])['total_clicks'] == 1
+        assert missing[0] == 404
+
+    def test_rejects_invalid_url_and_unknown_routes(self, app):
+        status, headers, body = asyncio.run(call(app, 'POST', '/dev/shorten', {'url': 'https://example.com'}))
+        assert status == 400
+        assert headers[b'access-control-allow-origin'] == b'*'
+        assert asyncio.run(call(app, 'GET', '/dev/nothing'))[0] == 404
+        assert asyncio.run(call(app, 'GET', '/dev/shorten'))[0] == 405
@@ -0,0 +1,79 @@
+import os
+import sys
+from unittest.mock import Mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from caching import CachingRepository
+from data_layer import InMemoryRepository
+from conftest import make_link
+
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class TestCachingRepository:
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.backend = InMemoryRepository()
+        self.backend.get_link = Mock(wraps=self.backend.get_link)
+        self.repository = CachingRepository(self.backend, max_entries=2, ttl_seconds=60,
+                                            negative_ttl_seconds=5, clock=self.clock)
+
+    def test_repeated_reads_hit_the_cache(self):
+        self.repository.save_link(make_link())
+        for _ in range(3):
+            assert self.repository.get_link('abc1234').original_url.startswith('https://drive')
+        
+        assert self.backend.get_link.call_count == 1
+        stats = self.repository.get_stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 1
+
+    def test_entry_never_outlives_link_expiry(self):
+        self.repository.save_link(make_link(expires_at=int(self.clock.now) + 10))
+        self.repository.get_link('abc1234')
+        self.clock.now += 11
+        self.repository.get_link('abc1234')
+        
+        assert self.backend.get_link.call_count == 2
+        assert self.repository.get_stats()['expirations'] == 1
+
+    def test_misses_are_negatively_cached(self):
+        assert self.repository.get_link('missing') is None
+        assert self.repository.get_link('missing') is None
+        assert self.backend.get_link.call_count == 1
+        
+        self.clock.now += 6
+        assert self.repository.get_link('missing') is None
+        assert self.backend.get_link.call_count == 2
+
+    def test_save_invalidates_negative_entry(self):
+        assert self.repository.get_link('abc1234') is None
+        self.repository.save_link(make_link())
+        assert self.repository.get_link('abc1234') is not None
+
+    def test_evicts_least_recently_used(self):
+        for slug in ('a', 'b', 'c'):
+            self.repository.save_link(make_link(slug))
+            self.repository.get_link(slug)
+        
+        stats = self.repository.get_stats()
+        assert stats['evictions'] == 1
+        assert stats['size'] == 2
+
+    def test_invalidation_during_a_fetch_is_not_overwritten(self):
+        # A link created while a miss is being read must not be hidden by the stale negative result
+        def racing_get_link(slug):
+            result = InMemoryRepository.get_link(self.backend, slug)
+            self.repository.save_link(make_link())
+            return result
+        self.backend.get_link = Mock(side_effect=racing_get_link)
+        
+        assert self.repository.get_link('abc1234') is None
+        del self.backend.get_link
+        assert self.repository.get_link('abc1234') is not None
+        assert self.repository._in_flight == {}
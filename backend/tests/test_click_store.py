@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from click_store import ClickColumns, ClickDictionaries
+from models import ClickLog
+
+CLICKS = [
+    ClickLog(timestamp=1700000000, ip='8.8.8.8', user_agent='Chrome', country='US'),
+    ClickLog(timestamp=1700000001, ip='2001:db8::1', user_agent='Firefox', country='DE'),
+    ClickLog(timestamp=1700000002, ip='localhost', user_agent='Chrome', country='Local'),
+    ClickLog(timestamp=1700000003, ip='10.1', user_agent='curl', country='Unknown')
+]
+
+class TestClickColumns:
+    def setup_method(self):
+        self.dictionaries = ClickDictionaries()
+        self.columns = ClickColumns(self.dictionaries)
+        self.columns.extend(CLICKS)
+
+    def test_round_trips_every_field(self):
+        assert list(self.columns) == CLICKS
+        assert self.columns[-1] == CLICKS[-1]
+        assert self.columns[1:3] == CLICKS[1:3]
+
+    def test_values_are_dictionary_encoded(self):
+        assert len(self.dictionaries.user_agents) == 3
+        assert self.columns.user_agents[0] == self.columns.user_agents[2]
+        # IPv4 is packed inline; only the non-IPv4 values land in the dictionary
+        assert self.dictionaries.ips.values == ['2001:db8::1', 'localhost', '10.1']
+
+    def test_view_does_not_grow_with_new_clicks(self):
+        view = self.columns.view()
+        self.columns.append(CLICKS[0])
+        assert len(view) == 4
+        assert len(self.columns) == 5
+
+    def test_dict_round_trip(self):
+        restored = ClickColumns.from_dicts(ClickDictionaries(), self.columns.to_dicts())
+        assert list(restored) == CLICKS
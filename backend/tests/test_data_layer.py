@@ -0,0 +1,137 @@
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_layer import FileRepository, InMemoryRepository
+from conftest import make_link, make_click
+
+class TestJournaledFileRepository:
+    def test_replays_journal_on_startup(self, tmp_path):
+        data_file = str(tmp_path / 'data.json')
+        repo = FileRepository(data_file, journaled=True)
+        repo.save_link(make_link())
+        repo.log_click('abc1234', make_click())
+        repo.journal.close()
+        
+        # Nothing was compacted, so the snapshot must not exist yet
+        assert not os.path.exists(data_file)
+        
+        reloaded = FileRepository(data_file, journaled=True)
+        assert reloaded.get_link('abc1234').click_count == 1
+        assert len(reloaded.get_analytics('abc1234').click_logs) == 1
+
+    def test_save_links_is_one_journal_record(self, tmp_path):
+        data_file = str(tmp_path / 'data.json')
+        repo = FileRepository(data_file, journaled=True)
+        repo.save_links([make_link('first00'), make_link('second0')])
+        assert repo.journal.records_written == 1
+        repo.journal.close()
+        
+        reloaded = FileRepository(data_file, journaled=True)
+        assert reloaded.get_link('first00') == make_link('first00')
+        assert reloaded.get_link('second0') == make_link('second0')
+
+    def test_compaction_folds_journal_into_snapshot(self, tmp_path):
+        data_file = str(tmp_path / 'data.json')
+        repo = FileRepository(data_file, journaled=True, compact_every=3)
+        repo.save_link(make_link())
+        for i in range(4):
+            repo.log_click('abc1234', make_click(1700000100 + i))
+        repo.journal.close()
+        
+        assert os.path.exists(data_file)
+        assert len(list(repo.journal.replay())) == 2
+        
+        reloaded = FileRepository(data_file, journaled=True)
+        analytics = reloaded.get_analytics('abc1234')
+        assert analytics.total_clicks == 4
+        assert [log.timestamp for log in analytics.click_logs] == [1700000100 + i for i in range(4)]
+
+    def test_ignores_journal_records_already_in_snapshot(self, tmp_path):
+        data_file = str(tmp_path / 'data.json')
+        repo = FileRepository(data_file, journaled=True)
+        repo.save_link(make_link())
+        repo.log_click('abc1234', make_click())
+        
+        # Simulate a crash between writing the snapshot and truncating the journal
+        repo.journal.sync()
+        repo._save_data()
+        repo.journal.close()
+        
+        reloaded = FileRepository(data_file, journaled=True)
+        assert reloaded.get_analytics('abc1234').total_clicks == 1
+
+    def test_torn_tail_is_cut_before_new_records(self, tmp_path):
+        data_file = str(tmp_path / 'data.json')
+        repo = FileRepository(data_file, journaled=True)
+        repo.save_link(make_link())
+        repo.log_click('abc1234', make_click())
+        repo.journal.close()
+        with open(f'{data_file}.journal', 'a') as f:
+            f.write('{"op":"click","slug":"abc1')
+
+        # Appends after the torn record must survive the next restart
+        repo = FileRepository(data_file, journaled=True)
+        for i in range(3):
+            repo.log_click('abc1234', make_click(1700000200 + i))
+        repo.journal.close()
+        assert FileRepository(data_file, journaled=True).get_link('abc1234').click_count == 4
+
+    def test_failed_snapshot_keeps_the_journal(self, tmp_path, monkeypatch):
+        data_file = str(tmp_path / 'data.json')
+        repo = FileRepository(data_file, journaled=True)
+        repo.save_link(make_link())
+        repo.log_click('abc1234', make_click())
+
+        def disk_full(*args, **kwargs):
+            raise OSError(28, 'No space left on device')
+        monkeypatch.setattr(os, 'replace', disk_full)
+        with pytest.raises(OSError):
+            repo.compact()
+        monkeypatch.undo()
+        repo.journal.close()
+
+        assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+        assert len(list(repo.journal.replay())) == 2
+        assert FileRepository(data_file, journaled=True).get_link('abc1234').click_count == 1
+
+    def test_rollups_survive_restart(self, tmp_path):
+        data_file = str(tmp_path / 'data.json')
+        repo = FileRepository(data_file, journaled=True)
+        repo.save_link(make_link())
+        repo.log_click('abc1234', make_click())
+        repo.close()
+        
+        rollup = FileRepository(data_file, journaled=True).get_rollup('abc1234')
+        assert rollup.total_clicks == 1
+        assert rollup.countries == {'US': 1}
+
+class TestClickPagination:
+    def setup_method(self):
+        self.repo = InMemoryRepository()
+        self.repo.save_link(make_link())
+        for i in range(5):
+            self.repo.log_click('abc1234', make_click(1700000100 + i))
+
+    def test_pages_follow_cursor_to_the_end(self):
+        timestamps, cursor = [], None
+        while True:
+            page = self.repo.get_click_page('abc1234', limit=2, cursor=cursor)
+            timestamps.extend(log.timestamp for log in page.click_logs)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert timestamps == [1700000100 + i for i in range(5)]
+
+    def test_invalid_cursor(self):
+        with pytest.raises(ValueError):
+            self.repo.get_click_page('abc1234', limit=2, cursor='not-a-cursor')
+
+    def test_unknown_slug(self):
+        assert self.repo.get_click_page('missing') is None
+
+    def test_iter_clicks_is_lazy(self):
+        clicks = self.repo.iter_clicks('abc1234')
+        assert next(clicks).timestamp == 1700000100
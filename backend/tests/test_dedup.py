@@ -0,0 +1,62 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from dedup import ClickDeduplicator
+from logic_layer import LinkBusinessService, AnalyticsService
+from data_layer import InMemoryRepository
+from metrics import MetricsRegistry
+from models import LinkData
+
+NOW = 1700000000
+
+class StubGeoService:
+    def get_country(self, ip: str) -> str:
+        return 'US'
+
+class TestClickDeduplicator:
+    def test_suppresses_repeats_inside_the_window(self):
+        deduplicator = ClickDeduplicator(window_seconds=30, buckets=6)
+        assert deduplicator.should_store('abc1234', '1.2.3.4', 'Bot', now=NOW)
+        assert not deduplicator.should_store('abc1234', '1.2.3.4', 'Bot', now=NOW + 10)
+        assert deduplicator.should_store('abc1234', '1.2.3.4', 'Browser', now=NOW + 10)
+        assert deduplicator.should_store('def5678', '1.2.3.4', 'Bot', now=NOW + 10)
+        # Remembered for between 25 and 30 seconds, then the next click is stored again
+        assert deduplicator.should_store('abc1234', '1.2.3.4', 'Bot', now=NOW + 31)
+
+        stats = deduplicator.get_stats()
+        assert (stats['stored'], stats['suppressed']) == (4, 1)
+
+    def test_refresh_storm_stores_one_click_per_window(self):
+        deduplicator = ClickDeduplicator(window_seconds=30, buckets=6)
+        stored = sum(deduplicator.should_store('abc1234', '1.2.3.4', 'Bot', now=NOW + second)
+                     for second in range(300))
+        assert 10 <= stored <= 12
+
+    def test_memory_is_bounded_by_max_keys(self):
+        deduplicator = ClickDeduplicator(window_seconds=60, buckets=6, max_keys=100)
+        for i in range(1000):
+            deduplicator.should_store('abc1234', f'10.0.{i // 256}.{i % 256}', 'Bot', now=NOW + i // 10)
+        assert deduplicator.get_stats()['tracked_keys'] <= 100
+
+class TestServiceSuppression:
+    def test_repeats_are_redirected_but_not_stored(self):
+        repository = InMemoryRepository()
+        repository.save_link(LinkData(slug='abc1234', original_url='https://drive.google.com/file/d/123/view',
+                                      created_at=NOW, expires_at=None))
+        deduplicator = ClickDeduplicator(window_seconds=30)
+        metrics = MetricsRegistry()
+        service = LinkBusinessService(repository, geo_service=StubGeoService(), metrics=metrics,
+                                      deduplicator=deduplicator)
+
+        urls = [service.get_redirect_url('abc1234', '1.2.3.4', 'Bot') for _ in range(3)]
+        assert urls == ['https://drive.google.com/file/d/123/view'] * 3
+
+        # Each worker only sees its own repeats, so links report stored clicks alone
+        stats = AnalyticsService(repository).get_link_stats('abc1234')
+        assert stats['total_clicks'] == 1
+        assert 'suppressed_clicks' not in stats
+        assert deduplicator.get_stats()['suppressed'] == 2
+        counters = metrics.snapshot()['counters']['linkpulse_clicks_total']
+        assert counters == {'{outcome="stored"}': 1, '{outcome="suppressed"}': 2}
@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_layer import FileRepository, InMemoryRepository
+from sqlite_repository import SqliteRepository
+from caching import CachingRepository
+from expiry import ExpiryIndex, ExpirySweeper
+from conftest import make_link, make_click
+
+NOW = 1700100000
+
+@pytest.fixture(params=['memory', 'file', 'file-journaled', 'sqlite'])
+def repository(request, tmp_path):
+    if request.param == 'memory':
+        return InMemoryRepository()
+    if request.param == 'sqlite':
+        return SqliteRepository(str(tmp_path / 'links.db'))
+    return FileRepository(str(tmp_path / 'data.json'), journaled=request.param == 'file-journaled')
+
+class TestExpiryIndex:
+    def test_returns_earliest_deadlines_first(self):
+        index = ExpiryIndex()
+        index.add('late', NOW - 10)
+        index.add('early', NOW - 100)
+        index.add('future', NOW + 100)
+        index.add('never', None)
+        assert index.expired(NOW, 10) == ['early', 'late']
+        assert index.expired(NOW, 1) == ['early']
+
+    def test_resaved_and_removed_slugs_are_skipped(self):
+        index = ExpiryIndex()
+        index.add('moved', NOW - 100)
+        index.add('moved', NOW + 100)
+        index.add('gone', NOW - 50)
+        index.remove('gone')
+        assert index.expired(NOW, 10) == []
+        assert len(index) == 1
+
+class TestRepositoryExpiry:
+    def test_deletes_expired_links_and_clicks(self, repository):
+        repository.save_link(make_link('expired', NOW - 100))
+        repository.save_link(make_link('live', NOW + 100))
+        repository.save_link(make_link('forever', None))
+        repository.log_click('expired', make_click())
+
+        assert repository.expired_slugs(NOW, 10) == ['expired']
+        assert repository.delete_links(['expired', 'live', 'forever'], expired_before=NOW) == 1
+        assert repository.get_link('expired') is None
+        assert repository.get_analytics('expired') is None
+        assert repository.get_link('live') is not None
+        assert repository.get_link('forever') is not None
+        assert repository.expired_slugs(NOW, 10) == []
+
+    def test_file_repository_reloads_without_deleted_links(self, tmp_path):
+        data_file = str(tmp_path / 'data.json')
+        repo = FileRepository(data_file, journaled=True)
+        repo.save_link(make_link('expired', NOW - 100))
+        repo.save_link(make_link('later', NOW + 100))
+        repo.delete_links(['expired'], expired_before=NOW)
+        repo.journal.close()
+
+        reloaded = FileRepository(data_file, journaled=True)
+        assert reloaded.get_link('expired') is None
+        assert reloaded.expired_slugs(NOW + 200, 10) == ['later']
+
+class TestExpirySweeper:
+    def test_sweeps_in_bounded_batches(self, repository):
+        for i in range(7):
+            repository.save_link(make_link(f'old{i}', NOW - 100 + i))
+        repository.save_link(make_link('live', NOW + 100))
+        sweeper = ExpirySweeper(CachingRepository(repository), batch_size=3, clock=lambda: NOW)
+
+        assert sweeper.sweep() == 7
+        stats = sweeper.get_stats()
+        assert (stats['sweeps'], stats['batches'], stats['expired']) == (1, 3, 7)
+        assert repository.get_link('live') is not None
+
+    def test_archives_before_deleting(self, tmp_path):
+        repository = InMemoryRepository()
+        repository.save_link(make_link('expired', NOW - 100))
+        repository.log_click('expired', make_click())
+        archive = tmp_path / 'expired.jsonl'
+        sweeper = ExpirySweeper(repository, policy='archive', archive_path=str(archive), clock=lambda: NOW)
+
+        assert sweeper.sweep() == 1
+        entry = json.loads(archive.read_text())
+        assert entry['link']['slug'] == 'expired'
+        assert entry['clicks'][0]['ip'] == '1.2.3.4'
+        assert sweeper.get_stats()['archived'] == 1
+        assert repository.get_link('expired') is None
+
+    def test_archived_counts_only_links_written_and_deleted(self, tmp_path):
+        class StaleIndex(InMemoryRepository):
+            # Also reports a link re-saved since it expired and one that is already gone
+            def expired_slugs(self, now, limit):
+                return super().expired_slugs(now, limit) + ['resaved', 'gone']
+        repository = StaleIndex()
+        repository.save_link(make_link('expired', NOW - 100))
+        repository.save_link(make_link('resaved', NOW + 100))
+        archive = tmp_path / 'expired.jsonl'
+        sweeper = ExpirySweeper(repository, policy='archive', archive_path=str(archive), clock=lambda: NOW)
+
+        assert sweeper.sweep() == 1
+        stats = sweeper.get_stats()
+        assert (stats['expired'], stats['archived']) == (1, 1)
+        assert repository.get_link('resaved') is not None
+
+    def test_rejects_unknown_policy(self):
+        with pytest.raises(ValueError):
+            ExpirySweeper(InMemoryRepository(), policy='keep')
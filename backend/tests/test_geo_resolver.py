@@ -0,0 +1,99 @@
+import os
+import sys
+from unittest.mock import Mock
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import geo_resolver
+from geo_resolver import HttpGeoResolver, IpRangeTable, OfflineGeoResolver
+from logic_layer import GeoLocationService
+
+RANGES = [
+    ('1.0.0.0', '1.0.0.255', 'AU'),
+    ('8.8.8.0', '8.8.8.255', 'US'),
+    ('81.2.69.0', '81.2.69.255', 'GB'),
+    ('2001:db8::', '2001:db8::ffff', 'DE')
+]
+
+class TestIpRangeTable:
+    def test_lookup_ipv4_and_ipv6(self):
+        table = IpRangeTable.from_ranges(RANGES)
+        assert table.lookup('8.8.8.8') == 'US'
+        assert table.lookup('81.2.69.160') == 'GB'
+        assert table.lookup('2001:db8::1') == 'DE'
+        assert table.lookup('::ffff:1.0.0.7') == 'AU'
+
+    def test_lookup_outside_ranges(self):
+        table = IpRangeTable.from_ranges(RANGES)
+        assert table.lookup('8.8.9.1') is None
+        assert table.lookup('0.0.0.1') is None
+        assert table.lookup('2001:db9::1') is None
+
+    def test_load_csv_with_integer_bounds(self, tmp_path):
+        path = tmp_path / 'ranges.csv'
+        path.write_text('start,end,country\n16777216,16777471,AU\n134744064,134744319,US\n')
+        table = IpRangeTable.load(str(path))
+        assert table.lookup('1.0.0.1') == 'AU'
+        assert table.lookup('8.8.8.8') == 'US'
+
+    def test_binary_round_trip(self, tmp_path):
+        path = str(tmp_path / 'ranges.bin')
+        IpRangeTable.from_ranges(RANGES).save_binary(path)
+        table = IpRangeTable.load(path)
+        assert len(table) == len(RANGES)
+        assert table.lookup('1.0.0.200') == 'AU'
+        assert table.lookup('2001:db8::abcd') == 'DE'
+
+class TestOfflineGeoResolver:
+    def test_local_and_invalid_addresses(self):
+        resolver = OfflineGeoResolver(IpRangeTable.from_ranges(RANGES))
+        assert resolver.get_country('127.0.0.1') == 'Local'
+        assert resolver.get_country('not-an-ip') == 'Unknown'
+
+    def test_fallback_only_for_misses(self):
+        fallback = Mock()
+        fallback.get_country.return_value = 'FR'
+        resolver = OfflineGeoResolver(IpRangeTable.from_ranges(RANGES), fallback=fallback)
+        
+        assert resolver.get_country('8.8.8.8') == 'US'
+        assert resolver.get_country('90.1.1.1') == 'FR'
+        assert resolver.get_country('90.1.1.1') == 'FR'
+        fallback.get_country.assert_called_once_with('90.1.1.1')
+        assert resolver.cache_info().hits == 1
+
+    def test_plugs_into_geo_location_service(self):
+        resolver = OfflineGeoResolver(IpRangeTable.from_ranges(RANGES))
+        assert GeoLocationService(resolver).get_country('81.2.69.1') == 'GB'
+
+    def test_fallback_failures_are_retried(self):
+        fallback = Mock()
+        fallback.get_country.side_effect = ['Unknown', 'FR', 'DE']
+        resolver = OfflineGeoResolver(IpRangeTable.from_ranges(RANGES), fallback=fallback)
+        
+        assert resolver.get_country('90.1.1.1') == 'Unknown'
+        assert resolver.get_country('90.1.1.1') == 'FR'
+        assert resolver.get_country('90.1.1.1') == 'FR'
+        assert fallback.get_country.call_count == 2
+
+class TestDefaultResolver:
+    @pytest.fixture(autouse=True)
+    def fresh_resolver(self, monkeypatch):
+        monkeypatch.setattr(geo_resolver, '_default_resolver', None)
+        monkeypatch.delenv('GEO_DB_PATH', raising=False)
+        monkeypatch.delenv('GEO_HTTP_FALLBACK', raising=False)
+
+    def test_http_fallback_is_on_without_a_table(self):
+        assert isinstance(geo_resolver.default_resolver().fallback, HttpGeoResolver)
+
+    def test_table_without_fallback(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'ranges.bin')
+        IpRangeTable.from_ranges(RANGES).save_binary(path)
+        monkeypatch.setenv('GEO_DB_PATH', path)
+        resolver = geo_resolver.default_resolver()
+        assert resolver.fallback is None and len(resolver.table) == len(RANGES)
+
+    def test_disabled_fallback_without_a_table_warns(self, monkeypatch, caplog):
+        monkeypatch.setenv('GEO_HTTP_FALLBACK', '0')
+        assert geo_resolver.default_resolver().fallback is None
+        assert "every click's country will be 'Unknown'" in caplog.text
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+from unittest.mock import Mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ingestion import ClickIngestionPipeline
+from data_layer import InMemoryRepository
+from logic_layer import LinkBusinessService
+
+def make_geo_service(country='US'):
+    geo_service = Mock()
+    geo_service.get_country.return_value = country
+    return geo_service
+
+class TestClickIngestionPipeline:
+    def setup_method(self):
+        self.repository = InMemoryRepository()
+        self.service = LinkBusinessService(self.repository)
+        self.link = self.service.create_short_link('https://drive.google.com/file/d/123/view', 24)
+
+    def test_stop_drains_queued_events(self):
+        pipeline = ClickIngestionPipeline(self.repository, make_geo_service(), flush_interval=60)
+        pipeline.start()
+        for _ in range(5):
+            assert pipeline.submit(self.link.slug, '1.2.3.4', 'Test Agent')
+        pipeline.stop()
+        
+        analytics = self.repository.get_analytics(self.link.slug)
+        assert analytics.total_clicks == 5
+        assert all(log.country == 'US' for log in analytics.click_logs)
+        assert pipeline.get_stats()['flushed'] == 5
+
+    def test_flushes_when_batch_is_full(self):
+        pipeline = ClickIngestionPipeline(self.repository, make_geo_service(), flush_size=2, flush_interval=60)
+        pipeline.start()
+        pipeline.submit(self.link.slug, '1.2.3.4', 'Test Agent')
+        pipeline.submit(self.link.slug, '1.2.3.4', 'Test Agent')
+        
+        deadline = time.time() + 2
+        while pipeline.get_stats()['flushed'] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert self.repository.get_analytics(self.link.slug).total_clicks == 2
+        pipeline.stop()
+
+    def test_drops_events_when_queue_is_full(self):
+        pipeline = ClickIngestionPipeline(self.repository, make_geo_service(), max_queue_size=2)
+        assert pipeline.submit(self.link.slug, '1.2.3.4', 'Test Agent')
+        assert pipeline.submit(self.link.slug, '1.2.3.4', 'Test Agent')
+        assert not pipeline.submit(self.link.slug, '1.2.3.4', 'Test Agent')
+        
+        stats = pipeline.get_stats()
+        assert stats['enqueued'] == 2
+        assert stats['dropped'] == 1
+
+    def test_redirect_does_not_block_on_geo_lookup(self):
+        geo_service = make_geo_service()
+        pipeline = ClickIngestionPipeline(self.repository, geo_service)
+        service = LinkBusinessService(self.repository, click_pipeline=pipeline)
+        
+        redirect_url = service.get_redirect_url(self.link.slug, '1.2.3.4', 'Test Agent')
+        assert redirect_url == self.link.original_url
+        geo_service.get_country.assert_not_called()
+        assert pipeline.get_stats()['queued'] == 1
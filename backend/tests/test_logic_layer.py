@@ -7,23 +7,25 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from logic_layer import (
-    SlugGeneratorService, 
     UrlValidationService, 
     GeoLocationService,
     LinkExpirationService,
-    LinkBusinessService
+    LinkBusinessService,
+    AnalyticsService
 )
 from data_layer import InMemoryRepository
-from models import LinkData
+from slug_allocator import BlockSlugAllocator
+from models import LinkData, ClickLog
 
-class TestSlugGeneratorService:
+class TestSlugAllocation:
+    # Slugs come from the allocator the service is given, block allocation by default
     def test_generate_default_length(self):
-        slug = SlugGeneratorService.generate()
+        slug = BlockSlugAllocator(InMemoryRepository(), b'key').next_slug()
         assert len(slug) == 7
         assert slug.isalnum()
 
     def test_generate_custom_length(self):
-        slug = SlugGeneratorService.generate(10)
+        slug = BlockSlugAllocator(InMemoryRepository(), b'key', length=10).next_slug()
         assert len(slug) == 10
 
 class TestUrlValidationService:
@@ -83,4 +85,80 @@ class TestLinkBusinessService:
 
     def test_get_redirect_url_not_found(self):
         result = self.service.get_redirect_url('nonexistent', '127.0.0.1', 'Test Agent')
-        assert result is None
\ No newline at end of file
+        assert result is None
+
+    @pytest.mark.parametrize('block_allocated', [True, False])
+    def test_create_short_links_reports_each_item(self, block_allocated):
+        if block_allocated:
+            self.service.slug_allocator = BlockSlugAllocator(self.repository, b'key')
+            self.repository.save_links = Mock(wraps=self.repository.save_links)
+        url = 'https://drive.google.com/file/d/123/view'
+        results = self.service.create_short_links([
+            (url, 24), ('https://example.com', 24), (None, 24), (url, 0), (url, -1), (url, True)
+        ])
+        
+        assert [result.error for result in results] == [
+            None, 'Only Google Drive URLs are allowed', 'URL is required', None, 'Invalid ttl_hours',
+            'Invalid ttl_hours'
+        ]
+        created = [results[0].link_data, results[3].link_data]
+        assert created[0].slug != created[1].slug
+        assert created[1].expires_at is None
+        assert all(self.repository.get_link(link.slug) == link for link in created)
+        if block_allocated:
+            self.repository.save_links.assert_called_once()
+
+    def test_create_short_links_limits_batch_size(self):
+        with pytest.raises(ValueError):
+            self.service.create_short_links([('https://drive.google.com/x', 1)] * 1001)
+
+
+class TestAnalyticsService:
+    def setup_method(self):
+        self.repository = InMemoryRepository()
+        self.service = LinkBusinessService(self.repository)
+        self.analytics_service = AnalyticsService(self.repository)
+        self.link = self.service.create_short_link('https://drive.google.com/file/d/123/view', 24)
+
+    def log_clicks(self, *clicks):
+        for timestamp, country in clicks:
+            self.repository.log_click(self.link.slug, ClickLog(
+                timestamp=timestamp, ip='1.2.3.4', user_agent='Test Agent', country=country))
+
+    def test_stats_come_from_rollups(self):
+        self.log_clicks((1700000000, 'US'), (1700003700, 'DE'), (1700000100, 'US'))
+        
+        stats = self.analytics_service.get_link_stats(self.link.slug)
+        assert stats['total_clicks'] == 3
+        assert stats['first_click'] == 1700000000
+        assert stats['last_click'] == 1700003700
+        assert stats['unique_countries'] == 2
+        assert len(stats['recent_clicks']) == 3
+
+    def test_click_trends(self):
+        self.log_clicks((1699999200, 'US'), (1700000100, 'US'), (1700003700, 'DE'))
+        
+        trends = self.analytics_service.get_click_trends(self.link.slug)
+        assert trends['hourly_distribution'] == {1699999200: 2, 1700002800: 1}
+        assert trends['country_distribution'] == {'US': 2, 'DE': 1}
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.log_clicks((1700000000, 'US'), (1700003700, 'DE'))
+        before = self.repository.get_rollup(self.link.slug)
+        self.repository.rebuild_rollups()
+        assert self.repository.get_rollup(self.link.slug) == before
+
+    def test_many_stats_match_single_stats(self):
+        self.log_clicks((1700000000, 'US'), (1700003600, 'DE'))
+        slug = self.link.slug
+        stats = self.analytics_service.get_many_stats([slug, 'missing'])
+        single = self.analytics_service.get_link_stats(slug)
+        
+        assert list(stats) == [slug]
+        for key in ('total_clicks', 'first_click', 'last_click', 'unique_countries'):
+            assert stats[slug][key] == single[key]
+        assert stats[slug]['original_url'] == self.link.original_url
+    
+    def test_unknown_slug(self):
+        assert self.analytics_service.get_link_stats('missing') is None
+        assert self.analytics_service.get_click_trends('missing') is None
@@ -0,0 +1,75 @@
+import os
+import sys
+import pytest
+from unittest.mock import Mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from metrics import MetricsRegistry
+from instrumentation import InstrumentedRepository
+from data_layer import InMemoryRepository
+from logic_layer import LinkBusinessService
+from conftest import make_link
+
+class TestMetricsRegistry:
+    def test_renders_cumulative_histogram_buckets(self):
+        registry = MetricsRegistry(buckets=(0.001, 0.01))
+        registry.describe('op_seconds', 'histogram', 'Operation latency')
+        registry.observe('op_seconds', 0.0005, operation='get')
+        registry.observe('op_seconds', 0.005, operation='get')
+        registry.observe('op_seconds', 1.0, operation='get')
+        registry.inc('calls_total', operation='get')
+
+        text = registry.render_prometheus()
+        assert '# HELP op_seconds Operation latency\n# TYPE op_seconds histogram' in text
+        assert 'op_seconds_bucket{operation="get",le="0.001"} 1' in text
+        assert 'op_seconds_bucket{operation="get",le="0.01"} 2' in text
+        assert 'op_seconds_bucket{operation="get",le="+Inf"} 3' in text
+        assert 'op_seconds_count{operation="get"} 3' in text
+        assert 'calls_total{operation="get"} 1' in text
+
+    def test_escapes_label_values(self):
+        registry = MetricsRegistry()
+        registry.inc('calls_total', endpoint='a"b\\c')
+        assert 'calls_total{endpoint="a\\"b\\\\c"} 1' in registry.render_prometheus()
+
+    def test_capture_collects_stage_times_for_this_thread(self):
+        registry = MetricsRegistry()
+        with registry.capture() as stages:
+            with registry.timer('stage_seconds', operation='redirect', stage='get_link'):
+                pass
+        registry.observe('stage_seconds', 0.1, operation='redirect', stage='geo')
+        assert list(stages) == ['redirect.get_link']
+
+class TestInstrumentedRepository:
+    def test_records_latency_and_errors_per_backend(self):
+        registry = MetricsRegistry()
+        repository = InstrumentedRepository(InMemoryRepository(), registry)
+        repository.save_link(make_link())
+        assert repository.get_link('abc1234') is not None
+        with pytest.raises(NotImplementedError):
+            InstrumentedRepository(Mock(**{'get_link.side_effect': NotImplementedError}), registry,
+                                   backend='Broken').get_link('abc1234')
+
+        histograms = registry.snapshot()['histograms']['linkpulse_repository_seconds']
+        assert histograms['{backend="InMemoryRepository",operation="get_link"}']['count'] == 1
+        assert histograms['{backend="InMemoryRepository",operation="save_link"}']['count'] == 1
+        counters = registry.snapshot()['counters']['linkpulse_repository_errors_total']
+        assert counters == {'{backend="Broken",operation="get_link"}': 1}
+
+class TestRedirectStages:
+    def test_times_each_redirect_stage(self):
+        registry = MetricsRegistry()
+        repository = InMemoryRepository()
+        repository.save_link(make_link())
+        geo_service = Mock()
+        geo_service.get_country.return_value = 'US'
+        service = LinkBusinessService(repository, geo_service=geo_service, metrics=registry)
+
+        with registry.capture() as stages:
+            service.get_redirect_url('abc1234', '1.2.3.4', 'Test Agent')
+        service.get_redirect_url('missing', '1.2.3.4', 'Test Agent')
+
+        assert set(stages) == {'redirect.get_link', 'redirect.geo', 'redirect.log_click'}
+        counters = registry.snapshot()['counters']['linkpulse_redirects_total']
+        assert counters == {'{result="found"}': 1, '{result="not_found"}': 1}
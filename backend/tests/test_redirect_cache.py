@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import redirect_cache
+from redirect_cache import MAX_AGE_SECONDS, redirect_response, validate_policy
+from data_layer import FileRepository, InMemoryRepository
+from sqlite_repository import SqliteRepository
+from models import LinkData
+from asgi_server import LinkPulseApp
+from test_async_layer import call
+
+NOW = 1700000000
+URL = 'https://drive.google.com/file/d/123/view'
+
+def make_link(redirect_cache=None, expires_at=NOW + 3600, slug='abc1234'):
+    return LinkData(slug=slug, original_url=URL, created_at=NOW - 60, expires_at=expires_at,
+                    redirect_cache=redirect_cache)
+
+@pytest.fixture(autouse=True)
+def no_passthrough(monkeypatch):
+    # Every cacheable redirect is cached unless a test samples pass-throughs itself
+    monkeypatch.setattr(redirect_cache, 'PASSTHROUGH_RATE', 0)
+
+class TestRedirectResponse:
+    def test_default_redirect_stays_uncacheable(self):
+        assert redirect_response(make_link(), now=NOW) == (302, {'Location': URL})
+
+    def test_max_age_is_bounded_by_expiry(self):
+        status, headers = redirect_response(make_link('temporary'), now=NOW)
+        assert status == 302
+        assert headers['Cache-Control'] == 'public, max-age=3600'
+        assert redirect_response(make_link('permanent', expires_at=None), now=NOW)[1]['Cache-Control'] == \
+            f'public, max-age={MAX_AGE_SECONDS}'
+        assert redirect_response(make_link('permanent', expires_at=NOW), now=NOW)[1]['Cache-Control'] == 'no-cache'
+
+    def test_permanent_policy_uses_301(self):
+        assert redirect_response(make_link('permanent'), now=NOW)[0] == 301
+
+    def test_conditional_requests_get_304(self):
+        link = make_link('permanent')
+        _, headers = redirect_response(link, now=NOW)
+        assert redirect_response(link, if_none_match=f'W/{headers["ETag"]}', now=NOW)[0] == 304
+        assert redirect_response(link, if_none_match='"stale"', now=NOW)[0] == 301
+        assert redirect_response(link, if_modified_since=headers['Last-Modified'], now=NOW)[0] == 304
+        assert redirect_response(link, if_modified_since='not a date', now=NOW)[0] == 301
+        moved = LinkData(slug=link.slug, original_url=URL + '?v=2', created_at=link.created_at,
+                         expires_at=link.expires_at, redirect_cache='permanent')
+        assert redirect_response(moved, if_none_match=headers['ETag'], now=NOW)[0] == 301
+
+    def test_passthrough_is_never_cached(self):
+        link = make_link('permanent')
+        _, cached = redirect_response(link, now=NOW)
+        assert redirect_response(link, now=NOW, passthrough=True) == \
+            (302, {'Location': URL, 'Cache-Control': 'no-store'})
+        assert redirect_response(link, if_none_match=cached['ETag'], now=NOW, passthrough=True)[0] == 302
+
+    def test_rejects_unknown_policy(self):
+        with pytest.raises(ValueError):
+            validate_policy('forever')
+
+@pytest.fixture(params=['memory', 'file', 'sqlite'])
+def repository(request, tmp_path):
+    if request.param == 'memory':
+        return InMemoryRepository()
+    if request.param == 'sqlite':
+        return SqliteRepository(str(tmp_path / 'links.db'))
+    return FileRepository(str(tmp_path / 'data.json'))
+
+def test_repositories_store_the_policy(repository):
+    repository.save_link(make_link('permanent'))
+    repository.save_links([make_link(slug='def5678')])
+    assert repository.get_link('abc1234').redirect_cache == 'permanent'
+    assert repository.get_link('def5678').redirect_cache is None
+    assert repository.get_many(['abc1234'])['abc1234'].link_data.redirect_cache == 'permanent'
+
+def test_sqlite_adds_the_column_to_existing_databases(tmp_path):
+    path = str(tmp_path / 'links.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE links (slug TEXT PRIMARY KEY, original_url TEXT NOT NULL, created_at INTEGER '
+                     'NOT NULL, expires_at INTEGER, click_count INTEGER NOT NULL DEFAULT 0, first_click INTEGER, '
+                     'last_click INTEGER) WITHOUT ROWID')
+        conn.execute("INSERT INTO links (slug, original_url, created_at) VALUES ('old0001', ?, ?)", (URL, NOW))
+    repository = SqliteRepository(path)
+    assert repository.get_link('old0001').redirect_cache is None
+
+class TestAsgiRedirectCaching:
+    def test_cached_redirect_and_revalidation(self, monkeypatch):
+        monkeypatch.setenv('SLUG_KEY', 'test-key')
+        app = LinkPulseApp(repository=InMemoryRepository(), start_background=False)
+
+        async def scenario():
+            _, _, body = await call(app, 'POST', '/dev/shorten', {'url': URL, 'redirect_cache': 'permanent'})
+            created = json.loads(body)
+            first = await call(app, 'GET', f'/u/{created["slug"]}')
+            stats = await call(app, 'GET', f'/dev/stats/{created["slug"]}')
+            return created, first, stats
+
+        created, first, stats = asyncio.run(scenario())
+        assert created['redirect_cache'] == 'permanent'
+        assert first[0] == 301
+        assert first[1][b'location'] == URL.encode()
+        assert first[1][b'cache-control'].startswith(b'public, max-age=')
+        assert json.loads(stats[2])['total_clicks'] == 1
+
+        revalidated = asyncio.run(call(app, 'GET', f'/u/{created["slug"]}',
+                                       headers=[(b'if-none-match', first[1][b'etag'])]))
+        assert revalidated[0] == 304
+        assert asyncio.run(call(app, 'POST', '/dev/shorten', {'url': URL, 'redirect_cache': 'forever'}))[0] == 400
+
+    def test_passthrough_redirects_are_counted(self, monkeypatch):
+        monkeypatch.setenv('SLUG_KEY', 'test-key')
+        monkeypatch.setattr(redirect_cache, 'PASSTHROUGH_RATE', 1)
+        app = LinkPulseApp(repository=InMemoryRepository(), start_background=False)
+
+        async def scenario():
+            _, _, body = await call(app, 'POST', '/dev/shorten', {'url': URL, 'redirect_cache': 'permanent'})
+            slug = json.loads(body)['slug']
+            redirects = [await call(app, 'GET', f'/u/{slug}') for _ in range(2)]
+            return redirects, await call(app, 'GET', f'/dev/stats/{slug}')
+
+        redirects, stats = asyncio.run(scenario())
+        assert [(status, headers[b'cache-control']) for status, headers, _ in redirects] == \
+            [(302, b'no-store')] * 2
+        assert json.loads(stats[2])['total_clicks'] == 2
+
+    def test_batch_items_carry_their_policy(self, monkeypatch):
+        monkeypatch.setenv('SLUG_KEY', 'test-key')
+        app = LinkPulseApp(repository=InMemoryRepository(), start_background=False)
+        links = [{'url': URL, 'redirect_cache': 'permanent'}, {'url': URL},
+                 {'url': URL, 'redirect_cache': 'forever'}]
+
+        async def scenario():
+            _, _, body = await call(app, 'POST', '/dev/shorten/batch', {'links': links})
+            results = json.loads(body)['results']
+            return results, await call(app, 'GET', f'/u/{results[0]["slug"]}')
+
+        results, redirect = asyncio.run(scenario())
+        assert [result.get('redirect_cache') for result in results[:2]] == ['permanent', None]
+        assert results[2]['error'].startswith('redirect_cache must be one of')
+        assert redirect[0] == 301
@@ -0,0 +1,463 @@
+import os
+import sys
+import pytest
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from repository import DynamoRepository, WriteRateTracker, create_tables, ALLOCATOR_KEY, COUNTER_SHARDS
+from data_layer import SlugConflictError
+from models import ClickLog
+from conftest import make_link, make_click
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        resource = boto3.resource('dynamodb')
+        create_tables(resource, 'links', 'clicks')
+        yield resource
+
+class StreamReader:
+    # Feeds the links table's stream to merge_stream_records, as SketchFunction does
+    def __init__(self, dynamodb):
+        self.client = boto3.client('dynamodbstreams')
+        self.arn = dynamodb.Table('links').latest_stream_arn
+        self.positions = {}
+
+    def drain(self, repository):
+        records = []
+        for shard in self.client.describe_stream(StreamArn=self.arn)['StreamDescription']['Shards']:
+            shard_id = shard['ShardId']
+            position = {'ShardIteratorType': 'TRIM_HORIZON'}
+            if shard_id in self.positions:
+                position = {'ShardIteratorType': 'AFTER_SEQUENCE_NUMBER',
+                            'SequenceNumber': self.positions[shard_id]}
+            iterator = self.client.get_shard_iterator(StreamArn=self.arn, ShardId=shard_id, **position)
+            batch = self.client.get_records(ShardIterator=iterator['ShardIterator'])['Records']
+            if batch:
+                self.positions[shard_id] = batch[-1]['dynamodb']['SequenceNumber']
+                records += batch
+        return repository.merge_stream_records(records)
+
+@pytest.fixture
+def stream(dynamodb):
+    return StreamReader(dynamodb)
+
+@pytest.fixture
+def repository(dynamodb):
+    return DynamoRepository('links', 'clicks', dynamodb=dynamodb)
+
+def click_only(dynamodb):
+    # The clicks table's click items, without the per-hour counters beside them
+    return [item for item in dynamodb.Table('clicks').scan()['Items'] if 'clicks' not in item]
+
+class TestDynamoRepository:
+    def test_clicks_are_stored_outside_the_link_item(self, repository, dynamodb):
+        repository.save_link(make_link(expires_at=1900000000))
+        repository.get_link('abc1234')
+        repository.log_click('abc1234', make_click())
+        
+        link_item = dynamodb.Table('links').get_item(Key={'slug': 'abc1234'})['Item']
+        assert 'click_logs' not in link_item
+        assert link_item['click_count'] == 1
+        
+        click_items = click_only(dynamodb)
+        assert len(click_items) == 1
+        assert click_items[0]['expires_at'] == 1900000000
+
+    def test_click_items_share_the_link_ttl_without_a_prior_read(self, repository, dynamodb):
+        # A container that never served the link's redirect still writes the TTL
+        repository.save_link(make_link(expires_at=1900000000))
+        other = DynamoRepository('links', 'clicks', dynamodb=dynamodb)
+        other.log_clicks('abc1234', [make_click(), make_click(1700000200)])
+        
+        assert [item['expires_at'] for item in dynamodb.Table('clicks').scan()['Items']] == [1900000000] * 3
+
+    def test_get_link_ignores_unrelated_attributes(self, repository, dynamodb):
+        item = {
+            'slug': 'abc1234',
+            'original_url': 'https://drive.google.com/file/d/123/view',
+            'created_at': 1700000000,
+            'click_count': 2,
+            'click_logs': [{'timestamp': 1, 'ip': 'x', 'user_agent': 'y', 'country': 'z'}]
+        }
+        dynamodb.Table('links').put_item(Item=item)
+        
+        link_data = repository.get_link('abc1234')
+        assert link_data.click_count == 2
+        assert link_data.expires_at is None
+        assert link_data.redirect_cache is None
+
+    def test_redirect_cache_policy_round_trips(self, repository, dynamodb):
+        link = make_link()
+        link.redirect_cache = 'permanent'
+        repository.save_link(link)
+        assert repository.get_link('abc1234').redirect_cache == 'permanent'
+        assert repository.get_many(['abc1234'])['abc1234'].link_data.redirect_cache == 'permanent'
+
+    def test_sampled_link_keeps_a_bounded_set_of_click_items(self, repository, dynamodb):
+        link = make_link()
+        link.click_sample_size = 6
+        repository.save_link(link)
+        repository.get_link('abc1234')
+        for start in range(0, 120, 30):
+            repository.log_clicks('abc1234', [make_click(1700000000 + i) for i in range(start, start + 30)])
+
+        click_ids = [item['click_id'] for item in dynamodb.Table('clicks').scan()['Items']]
+        assert len([click_id for click_id in click_ids if click_id.startswith('slot#')]) == 6
+        assert len(click_ids) == 6 + 10 + 1
+        analytics = repository.get_analytics('abc1234')
+        assert analytics.total_clicks == 120 and analytics.sampled
+        assert (analytics.first_click, analytics.last_click) == (1700000000, 1700000119)
+        assert [log.timestamp for log in analytics.click_logs][:3] == [1700000000, 1700000001, 1700000002]
+        rollup = repository.get_rollup('abc1234')
+        assert rollup.hourly == {1699999200: 120}
+        assert [log.timestamp for log in rollup.recent_clicks] == list(range(1700000110, 1700000120))
+        assert repository.get_click_page('abc1234').sampled
+        # Slot items are paged in time order rather than slot order
+        first = repository.get_click_page('abc1234', limit=4)
+        rest = repository.get_click_page('abc1234', limit=4, cursor=first.next_cursor)
+        timestamps = [log.timestamp for log in first.click_logs + rest.click_logs]
+        assert timestamps == sorted(timestamps) and len(timestamps) == 6 and rest.next_cursor is None
+        assert len(list(repository.iter_clicks('abc1234'))) == 6
+        assert repository.get_link('abc1234').click_sample_size == 6
+
+    def test_log_click_for_unknown_slug_is_ignored(self, repository, dynamodb):
+        repository.log_click('missing', make_click())
+        assert 'Item' not in dynamodb.Table('links').get_item(Key={'slug': 'missing'})
+        assert dynamodb.Table('clicks').scan()['Items'] == []
+
+    def test_get_analytics_pages_through_clicks_in_time_order(self, repository):
+        repository.save_link(make_link())
+        clicks = [make_click(1700000000 + i) for i in range(30)]
+        repository.log_clicks('abc1234', list(reversed(clicks)))
+        
+        analytics = repository.get_analytics('abc1234')
+        assert analytics.total_clicks == 30
+        assert [log.timestamp for log in analytics.click_logs] == [c.timestamp for c in clicks]
+        assert analytics.first_click == 1700000000
+        assert analytics.last_click == 1700000029
+
+    def test_migrate_click_logs(self, repository, dynamodb):
+        dynamodb.Table('links').put_item(Item={
+            'slug': 'legacy1',
+            'original_url': 'https://drive.google.com/file/d/123/view',
+            'created_at': 1700000000,
+            'click_count': 2,
+            'click_logs': [
+                {'timestamp': 1700000100, 'ip': '1.1.1.1', 'user_agent': 'A', 'country': 'US'},
+                {'timestamp': 1700000200, 'ip': '2.2.2.2', 'user_agent': 'B', 'country': 'DE'}
+            ]
+        })
+        
+        assert repository.migrate_click_logs() == 2
+        assert repository.migrate_click_logs() == 0
+        
+        link_item = dynamodb.Table('links').get_item(Key={'slug': 'legacy1'})['Item']
+        assert 'click_logs' not in link_item
+        analytics = repository.get_analytics('legacy1')
+        assert [log.country for log in analytics.click_logs] == ['US', 'DE']
+
+    def test_rollups_are_updated_with_each_batch(self, repository):
+        repository.save_link(make_link())
+        repository.log_clicks('abc1234', [make_click(1700000000, 'US'), make_click(1700003700, 'DE')])
+        repository.log_click('abc1234', make_click(1700000100, 'US'))
+        
+        rollup = repository.get_rollup('abc1234')
+        assert rollup.total_clicks == 3
+        assert rollup.first_click == 1700000000
+        # A late batch is counted but never moves last_click back
+        assert rollup.last_click == 1700003700
+        assert rollup.countries == {'US': 2, 'DE': 1}
+        assert rollup.hourly == {1699999200: 2, 1700002800: 1}
+        assert [log.timestamp for log in rollup.recent_clicks] == [1700000000, 1700000100, 1700003700]
+
+    def test_hourly_counts_stay_off_the_link_item(self, repository, dynamodb):
+        repository.save_link(make_link(expires_at=1900000000))
+        for day in range(3):
+            repository.log_click('abc1234', make_click(1700000000 + day * 86400))
+
+        assert 'hourly_clicks' not in dynamodb.Table('links').get_item(Key={'slug': 'abc1234'})['Item']
+        hours = [item for item in dynamodb.Table('clicks').scan()['Items'] if 'clicks' in item]
+        expected = [f'hour#{1699999200 + day * 86400}' for day in range(3)]
+        assert sorted(item['click_id'] for item in hours) == expected
+        assert all(item['expires_at'] == 1900000000 for item in hours)
+
+    def test_legacy_hourly_maps_are_read_then_moved_by_a_rebuild(self, repository, dynamodb):
+        repository.save_link(make_link())
+        dynamodb.Table('links').update_item(
+            Key={'slug': 'abc1234'}, UpdateExpression='SET hourly_clicks = :hourly',
+            ExpressionAttributeValues={':hourly': {'1699999200': 1}}
+        )
+        repository.log_click('abc1234', make_click(1700000100))
+        assert repository.get_rollup('abc1234').hourly == {1699999200: 2}
+
+        repository.rebuild_rollups()
+        assert 'hourly_clicks' not in dynamodb.Table('links').get_item(Key={'slug': 'abc1234'})['Item']
+        assert repository.get_rollup('abc1234').hourly == {1699999200: 1}
+
+    def test_rebuild_rollups_for_legacy_items(self, repository, dynamodb):
+        dynamodb.Table('links').put_item(Item={
+            'slug': 'legacy1',
+            'original_url': 'https://drive.google.com/file/d/123/view',
+            'created_at': 1700000000,
+            'click_count': 1,
+            'click_logs': [{'timestamp': 1700000100, 'ip': '1.1.1.1', 'user_agent': 'A', 'country': 'US'}]
+        })
+        repository.migrate_click_logs()
+        repository.log_click('legacy1', make_click(1700000200, 'DE'))
+        assert repository.rebuild_rollups() == 1
+        
+        rollup = repository.get_rollup('legacy1')
+        assert rollup.total_clicks == 2
+        assert rollup.countries == {'US': 1, 'DE': 1}
+
+    def test_click_pages(self, repository):
+        repository.save_link(make_link())
+        repository.log_clicks('abc1234', [make_click(1700000000 + i) for i in range(5)])
+        
+        first = repository.get_click_page('abc1234', limit=3)
+        second = repository.get_click_page('abc1234', limit=3, cursor=first.next_cursor)
+        assert [log.timestamp for log in first.click_logs] == [1700000000, 1700000001, 1700000002]
+        assert [log.timestamp for log in second.click_logs] == [1700000003, 1700000004]
+        assert repository.get_click_page('missing') is None
+
+    def test_save_link_without_overwrite_is_conditional(self, repository):
+        repository.save_link(make_link(), overwrite=False)
+        with pytest.raises(SlugConflictError):
+            repository.save_link(make_link(), overwrite=False)
+
+    def test_allocate_id_block_hands_out_disjoint_ranges(self, repository):
+        assert repository.allocate_id_block(100) == 0
+        assert repository.allocate_id_block(100) == 100
+        assert repository.get_link(ALLOCATOR_KEY) is None
+        assert repository.rebuild_rollups() == 0
+
+    def test_save_links_writes_in_batches(self, repository):
+        links = [make_link(f'bulk{i:03d}') for i in range(60)]
+        repository.save_links(links)
+        assert all(repository.get_link(link.slug) == link for link in links)
+        assert repository.get_rollup('bulk059').total_clicks == 0
+
+    def test_save_links_without_overwrite_reports_taken_slugs(self, repository):
+        repository.save_link(make_link('bulk050'))
+        repository.log_click('bulk050', make_click())
+        links = [make_link(f'bulk{i:03d}') for i in range(120)]
+        for link in links:
+            link.original_url = 'https://drive.google.com/file/d/456/view'
+        
+        assert repository.save_links(links, overwrite=False) == ['bulk050']
+        assert repository.get_link('bulk050').click_count == 1
+        assert repository.get_link('bulk050').original_url == make_link().original_url
+        assert all(repository.get_link(link.slug) == link for link in links if link.slug != 'bulk050')
+
+    def test_get_many_reads_summaries_in_batches(self, repository, dynamodb, monkeypatch):
+        links = [make_link(f'many{i:03d}') for i in range(150)]
+        repository.save_links(links)
+        repository.log_clicks('many000', [make_click(1700000100, 'US'), make_click(1700000200, 'DE')])
+        
+        # Hold back one key on the first call, the way a throttled batch_get_item does
+        calls = []
+        batch_get_item = dynamodb.batch_get_item
+        def flaky_batch_get_item(RequestItems):
+            calls.append(len(RequestItems['links']['Keys']))
+            if len(calls) == 1:
+                held_back = RequestItems['links']['Keys'][-1:]
+                request = {'links': dict(RequestItems['links'], Keys=RequestItems['links']['Keys'][:-1])}
+                response = batch_get_item(RequestItems=request)
+                response['UnprocessedKeys'] = {'links': dict(RequestItems['links'], Keys=held_back)}
+                return response
+            return batch_get_item(RequestItems=RequestItems)
+        monkeypatch.setattr(dynamodb, 'batch_get_item', flaky_batch_get_item)
+        
+        summaries = repository.get_many([link.slug for link in links] + ['missing'])
+        assert calls == [100, 1, 51]
+        assert len(summaries) == 150
+        assert summaries['many000'].link_data.click_count == 2
+        assert summaries['many000'].first_click == 1700000100
+        assert summaries['many000'].unique_countries == 2
+        assert summaries['many149'].link_data == links[149]
+
+    def test_click_updates_never_read_the_link(self, repository, monkeypatch):
+        repository.save_link(make_link())
+        def no_reads(**kwargs):
+            raise AssertionError('read on the click path')
+        monkeypatch.setattr(repository.table, 'get_item', no_reads)
+        
+        repository.log_click('abc1234', make_click())
+        repository.log_clicks('abc1234', [make_click(1700000200), make_click(1700000300)])
+        monkeypatch.undo()
+        assert repository.get_rollup('abc1234').total_clicks == 3
+
+    def test_sketches_are_merged_from_the_stream(self, repository, stream):
+        repository.save_link(make_link())
+        repository.log_click('abc1234', make_click())
+        repository.log_click('abc1234', ClickLog(timestamp=1700000200, ip='5.6.7.8', user_agent='Other Agent',
+                                                 country='DE'))
+        assert repository.get_rollup('abc1234').unique_ips.count() == 0
+        
+        assert stream.drain(repository) == 2
+        rollup = repository.get_rollup('abc1234')
+        assert rollup.total_clicks == 2
+        assert rollup.unique_ips.count() == 2
+        assert dict(rollup.user_agents.top()) == {'Test Agent': 1, 'Other Agent': 1}
+        
+        # Rewriting the rollup leaves nothing behind for the stream to merge again
+        repository.rebuild_rollups()
+        assert stream.drain(repository) == 0
+        assert dict(repository.get_rollup('abc1234').user_agents.top()) == {'Test Agent': 1, 'Other Agent': 1}
+
+    def test_sketch_merge_survives_a_concurrent_consumer(self, repository, stream, monkeypatch):
+        repository.save_link(make_link())
+        repository.log_click('abc1234', make_click())
+        stream.drain(repository)
+        repository.log_click('abc1234', ClickLog(timestamp=1700000200, ip='5.6.7.8', user_agent='Other Agent',
+                                                 country='DE'))
+        
+        # Another consumer bumps the version between our read and our write
+        get_item = repository.table.get_item
+        reads = []
+        def racing_get_item(**kwargs):
+            response = get_item(**kwargs)
+            reads.append(kwargs['Key']['slug'])
+            if len(reads) == 1:
+                repository.table.update_item(
+                    Key={'slug': 'abc1234#sketch'},
+                    UpdateExpression='ADD sketch_version :one',
+                    ExpressionAttributeValues={':one': 1}
+                )
+            return response
+        monkeypatch.setattr(repository.table, 'get_item', racing_get_item)
+        stream.drain(repository)
+        monkeypatch.undo()
+        
+        assert reads == ['abc1234#sketch', 'abc1234#sketch']
+        assert repository.get_rollup('abc1234').unique_ips.count() == 2
+
+    def test_redelivered_stream_records_are_merged_once(self, repository, stream):
+        repository.save_link(make_link())
+        repository.log_click('abc1234', make_click())
+        stream.drain(repository)
+        repository.log_click('abc1234', make_click(1700000200))
+        
+        # A retried batch comes back whole, with the records merged before it
+        stream.positions.clear()
+        assert stream.drain(repository) == 1
+        stream.positions.clear()
+        assert stream.drain(repository) == 0
+        assert dict(repository.get_rollup('abc1234').user_agents.top()) == {'Test Agent': 2}
+
+class TestCounterShards:
+    def counter_items(self, dynamodb):
+        return [item for item in dynamodb.Table('links').scan()['Items'] if item['slug'].startswith('abc1234#')]
+
+    def test_promoted_link_counts_on_counter_items(self, repository, dynamodb, stream):
+        repository.save_link(make_link(expires_at=1900000000))
+        repository.log_clicks('abc1234', [make_click(1700000000 + i, 'US') for i in range(3)])
+        assert repository.promote_counters('abc1234', shards=4)
+        assert not repository.promote_counters('abc1234')
+        for i in range(20):
+            repository.log_click('abc1234', make_click(1700003600 + i, 'DE'))
+        
+        link_item = dynamodb.Table('links').get_item(Key={'slug': 'abc1234'})['Item']
+        assert link_item['click_count'] == 3 and link_item['counter_shards'] == 4
+        counters = self.counter_items(dynamodb)
+        assert len(counters) == 4
+        assert sum(item['click_count'] for item in counters) == 20
+        assert all(item['expires_at'] == 1900000000 for item in counters)
+        
+        # Counter items' click batches reach the link's sketches too
+        assert stream.drain(repository) == 23
+        rollup = repository.get_rollup('abc1234')
+        assert rollup.total_clicks == 23
+        assert (rollup.first_click, rollup.last_click) == (1700000000, 1700003619)
+        assert rollup.countries == {'US': 3, 'DE': 20}
+        assert rollup.hourly == {1699999200: 3, 1700002800: 20}
+        assert rollup.unique_ips.count() == 1
+        assert rollup.recent_clicks[-1].timestamp == 1700003619
+        assert repository.get_analytics('abc1234').total_clicks == 23
+        summary = repository.get_many(['abc1234', counters[0]['slug']])
+        assert list(summary) == ['abc1234']
+        assert summary['abc1234'].link_data.click_count == 23
+        assert summary['abc1234'].unique_countries == 2
+        # The redirect path still reads only the link item
+        assert repository.get_link('abc1234').original_url == make_link().original_url
+        assert repository.rebuild_rollups() == 0
+        assert repository.get_rollup('abc1234').total_clicks == 23
+
+    def test_hot_link_is_promoted_automatically(self, dynamodb):
+        repository = DynamoRepository('links', 'clicks', dynamodb=dynamodb, counter_shards=3,
+                                      hot_link_clicks_per_second=1)
+        # A fixed clock keeps every click in one window, however slowly the test runs
+        repository.hot_links = WriteRateTracker(1, window_seconds=10, clock=lambda: 0.0)
+        repository.save_link(make_link())
+        for i in range(9):
+            repository.log_click('abc1234', make_click(1700000000 + i))
+        assert self.counter_items(dynamodb) == []
+        repository.log_click('abc1234', make_click(1700000009))
+        repository.log_clicks('abc1234', [make_click(1700000010 + i) for i in range(5)])
+        
+        assert len(self.counter_items(dynamodb)) == 3
+        assert sum(item['click_count'] for item in self.counter_items(dynamodb)) == 5
+        assert repository.get_rollup('abc1234').total_clicks == 15
+
+    def test_writer_that_missed_the_promotion_follows_it(self, dynamodb):
+        first = DynamoRepository('links', 'clicks', dynamodb=dynamodb, hot_link_clicks_per_second=0)
+        second = DynamoRepository('links', 'clicks', dynamodb=dynamodb, hot_link_clicks_per_second=0)
+        first.save_link(make_link())
+        first.log_click('abc1234', make_click())
+        assert second.promote_counters('abc1234', shards=2)
+        
+        first.log_click('abc1234', make_click())
+        assert dynamodb.Table('links').get_item(Key={'slug': 'abc1234'})['Item']['click_count'] == 1
+        assert first.get_rollup('abc1234').total_clicks == 2
+        assert len(click_only(dynamodb)) == 2
+
+    def test_hot_link_is_promoted_on_clicks_from_every_container(self, dynamodb):
+        # No container alone writes fast enough, but the link's shared count does
+        repositories = [DynamoRepository('links', 'clicks', dynamodb=dynamodb, counter_shards=2)
+                        for _ in range(3)]
+        for repository in repositories:
+            repository.hot_links = WriteRateTracker(1, window_seconds=10, clock=lambda: 0.0)
+        repositories[0].save_link(make_link())
+        for i in range(12):
+            repositories[i % 3].log_click('abc1234', make_click(1700000000 + i))
+            if i == 8:
+                assert self.counter_items(dynamodb) == []
+
+        link_item = dynamodb.Table('links').get_item(Key={'slug': 'abc1234'})['Item']
+        assert link_item['counter_shards'] == 2
+        assert repositories[1].get_rollup('abc1234').total_clicks == 12
+
+    def test_throttled_link_is_promoted(self, repository, dynamodb, monkeypatch):
+        repository.save_link(make_link())
+        update_item = repository.table.update_item
+        throttled = []
+
+        def throttle_the_link(**kwargs):
+            if kwargs['Key'] == {'slug': 'abc1234'} and 'click_batch' in kwargs.get('UpdateExpression', '') \
+                    and not throttled:
+                throttled.append(kwargs)
+                raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'UpdateItem')
+            return update_item(**kwargs)
+        monkeypatch.setattr(repository.table, 'update_item', throttle_the_link)
+        repository.log_click('abc1234', make_click())
+
+        assert len(self.counter_items(dynamodb)) == COUNTER_SHARDS
+        assert repository.get_rollup('abc1234').total_clicks == 1
+
+    def test_write_rate_tracker_fires_once_per_window(self):
+        now = [0.0]
+        tracker = WriteRateTracker(2, window_seconds=10, clock=lambda: now[0])
+        # Counts rise between this container's updates when other containers write too
+        assert [tracker.record('abc1234', before, before + 1) for before in (0, 6, 14, 19, 25)] == \
+            [False, False, False, True, False]
+        assert not tracker.record('other00', 0, 19)
+        now[0] = 10.0
+        assert not tracker.record('abc1234', 30, 49)
+        assert tracker.record('abc1234', 60, 61)
@@ -0,0 +1,89 @@
+import base64
+import gzip
+import json
+import os
+import sys
+from decimal import Decimal
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import response_encoding
+from response_encoding import JSON_ENCODERS, compress_body, get_json_encoder, negotiate_encoding
+from handlers import create_response, _json_body
+from models import ClickLog
+
+def clicks_body(size=200):
+    return {
+        'click_logs': [{'timestamp': 1700000000 + i, 'ip': '1.2.3.4', 'user_agent': 'Test Agent',
+                        'country': 'US'} for i in range(size)],
+        'next_cursor': None,
+        'sampled': False
+    }
+
+class TestNegotiation:
+    def test_picks_the_highest_weighted_supported_coding(self):
+        assert negotiate_encoding(None) is None
+        assert negotiate_encoding('identity') is None
+        assert negotiate_encoding('br, gzip;q=0.5') == 'gzip'
+        assert negotiate_encoding('gzip;q=0') is None
+        assert negotiate_encoding('*') == next(iter(response_encoding.COMPRESSORS))
+        assert negotiate_encoding('*, gzip;q=0') == ('zstd' if 'zstd' in response_encoding.COMPRESSORS else None)
+        assert negotiate_encoding('GZIP;q=bad, deflate') is None
+
+    def test_zstd_is_preferred_when_installed(self):
+        expected = 'zstd' if response_encoding.zstandard is not None else 'gzip'
+        assert negotiate_encoding('gzip, deflate, br, zstd') == expected
+        assert negotiate_encoding('gzip, zstd;q=0.1') == 'gzip'
+
+    def test_small_bodies_are_left_alone(self):
+        assert compress_body(b'{}', 'gzip') == (b'{}', None)
+        body = json.dumps(clicks_body()).encode()
+        compressed, coding = compress_body(body, 'gzip')
+        assert coding == 'gzip' and gzip.decompress(compressed) == body
+        assert len(compressed) < len(body) // 5
+        assert compress_body(body, 'gzip', min_bytes=len(body) + 1) == (body, None)
+
+class TestJsonEncoders:
+    @pytest.mark.parametrize('name', sorted(JSON_ENCODERS))
+    def test_encoders_produce_the_same_document(self, name):
+        body = {
+            'hourly_distribution': {1700000000: 3},
+            'total_clicks': Decimal('5'),
+            'ratio': Decimal('0.5'),
+            'recent_clicks': [ClickLog(timestamp=1, ip='1.2.3.4', user_agent='A', country='US')]
+        }
+        assert json.loads(get_json_encoder(name)(body)) == {
+            'hourly_distribution': {'1700000000': 3},
+            'total_clicks': 5,
+            'ratio': 0.5,
+            'recent_clicks': [{'timestamp': 1, 'ip': '1.2.3.4', 'user_agent': 'A', 'country': 'US'}]
+        }
+
+    def test_encoder_is_pluggable(self, monkeypatch):
+        monkeypatch.setitem(JSON_ENCODERS, 'upper', lambda body: json.dumps(body).upper().encode())
+        monkeypatch.setenv('LINKPULSE_JSON_ENCODER', 'upper')
+        assert response_encoding.encode_json({'a': 'b'}) == b'{"A": "B"}'
+        with pytest.raises(ValueError):
+            get_json_encoder('missing')
+
+class TestLambdaResponses:
+    def test_compressed_when_the_client_accepts_it(self):
+        event = {'headers': {'accept-encoding': 'gzip'}}
+        response = create_response(200, clicks_body(), event)
+        assert response['isBase64Encoded']
+        assert response['headers']['Content-Encoding'] == 'gzip'
+        assert response['headers']['Vary'] == 'Accept-Encoding'
+        assert json.loads(gzip.decompress(base64.b64decode(response['body']))) == clicks_body()
+
+    def test_plain_without_accept_encoding(self):
+        response = create_response(200, clicks_body(), {'headers': {'User-Agent': 'x'}})
+        assert 'isBase64Encoded' not in response and 'Content-Encoding' not in response['headers']
+        assert json.loads(response['body']) == clicks_body()
+        assert json.loads(create_response(404, {'error': 'Link not found'})['body']) == {'error': 'Link not found'}
+
+    def test_base64_request_bodies_are_decoded(self):
+        raw = json.dumps({'url': 'https://example.com'})
+        assert _json_body({'body': raw}) == {'url': 'https://example.com'}
+        encoded = base64.b64encode(raw.encode()).decode()
+        assert _json_body({'body': encoded, 'isBase64Encoded': True}) == {'url': 'https://example.com'}
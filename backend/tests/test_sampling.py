@@ -0,0 +1,166 @@
+import asyncio
+import os
+import random
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sampling import DEFAULT_SAMPLE_SIZE, sample_slot, is_sampled, validate_sample_size
+from data_layer import FileRepository, InMemoryRepository
+from sqlite_repository import SqliteRepository
+from sharded_repository import ShardedFileRepository
+from logic_layer import LinkBusinessService
+from slug_allocator import BlockSlugAllocator
+from models import LinkData, ClickLog
+from asgi_server import LinkPulseApp
+from test_async_layer import call
+
+NOW = 1700000000
+URL = 'https://drive.google.com/file/d/123/view'
+
+def click(index):
+    # One click per minute, so timestamps identify clicks and span several hours
+    return ClickLog(timestamp=NOW + index * 60, ip=f'10.0.{index // 256}.{index % 256}',
+                    user_agent=f'agent-{index % 7}', country=['US', 'DE', 'JP'][index % 3])
+
+class TestSampleSlot:
+    def test_fills_then_keeps_the_head(self):
+        rng = random.Random(7)
+        retained = 0
+        for seen in range(1, 5001):
+            slot = sample_slot(10, seen, retained, rng)
+            if seen <= 10:
+                assert slot == seen - 1
+                retained += 1
+            else:
+                assert slot is None or 5 <= slot < 10
+        assert sample_slot(None, 5001, 5000) == 5000
+
+    def test_reservoir_is_uniform_over_later_clicks(self):
+        # Each of the 98 clicks after the two head clicks should survive with probability 2/98
+        rng = random.Random(11)
+        survivors = [0] * 100
+        for _ in range(4000):
+            sample = list(range(4))
+            for seen in range(5, 101):
+                slot = sample_slot(4, seen, 4, rng)
+                if slot is not None:
+                    sample[slot] = seen - 1
+            for index in sample[2:]:
+                survivors[index] += 1
+        early, late = sum(survivors[4:52]), sum(survivors[52:])
+        assert abs(early - late) < 0.1 * (early + late)
+
+    def test_validation(self):
+        assert is_sampled(10, 11) and not is_sampled(10, 10) and not is_sampled(None, 10 ** 6)
+        validate_sample_size(None)
+        for bad in (0, -1, 2.5, '10', True):
+            with pytest.raises(ValueError):
+                validate_sample_size(bad)
+
+@pytest.fixture(params=['memory', 'file', 'sqlite', 'sharded'])
+def repository(request, tmp_path):
+    if request.param == 'memory':
+        return InMemoryRepository()
+    if request.param == 'sqlite':
+        return SqliteRepository(str(tmp_path / 'links.db'))
+    if request.param == 'sharded':
+        return ShardedFileRepository(str(tmp_path / 'shards'), shard_count=4)
+    return FileRepository(str(tmp_path / 'data.json'), journaled=True)
+
+def test_sampled_link_keeps_exact_totals_with_bounded_clicks(repository):
+    repository.save_link(LinkData(slug='viral01', original_url=URL, created_at=NOW, expires_at=None,
+                                  click_sample_size=8))
+    repository.save_link(LinkData(slug='quiet01', original_url=URL, created_at=NOW, expires_at=None))
+    for start in range(0, 300, 50):
+        repository.log_clicks('viral01', [click(index) for index in range(start, start + 50)])
+    repository.log_clicks('quiet01', [click(index) for index in range(5)])
+
+    analytics = repository.get_analytics('viral01')
+    assert analytics.total_clicks == 300 and analytics.sampled
+    assert (analytics.first_click, analytics.last_click) == (NOW, NOW + 299 * 60)
+    kept = sorted(log.timestamp for log in analytics.click_logs)
+    assert len(kept) == 8 and len(set(kept)) == 8
+    assert kept[:4] == [NOW + index * 60 for index in range(4)]
+
+    rollup = repository.get_rollup('viral01')
+    assert rollup.total_clicks == 300
+    assert sum(rollup.hourly.values()) == 300 and rollup.countries == {'US': 100, 'DE': 100, 'JP': 100}
+    assert [log.timestamp for log in rollup.recent_clicks] == [NOW + index * 60 for index in range(290, 300)]
+
+    page = repository.get_click_page('viral01', limit=5)
+    assert page.sampled and len(page.click_logs) == 5
+    assert len(list(repository.iter_clicks('viral01'))) == 8
+
+    quiet = repository.get_analytics('quiet01')
+    assert quiet.total_clicks == 5 and len(quiet.click_logs) == 5 and not quiet.sampled
+    assert not repository.get_click_page('quiet01').sampled
+    assert repository.get_link('viral01').click_sample_size == 8
+
+def test_cursor_walk_survives_reservoir_overwrites(repository):
+    repository.save_link(LinkData(slug='viral01', original_url=URL, created_at=NOW, expires_at=None,
+                                  click_sample_size=8))
+    repository.log_clicks('viral01', [click(index) for index in range(100)])
+
+    timestamps, cursor = [], None
+    for start in range(100, 1000, 50):
+        page = repository.get_click_page('viral01', limit=3, cursor=cursor)
+        timestamps.extend(log.timestamp for log in page.click_logs)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+        # Clicks arriving mid-walk overwrite reservoir slots, some of them already paged past
+        repository.log_clicks('viral01', [click(index) for index in range(start, start + 50)])
+    assert cursor is None
+    assert timestamps == sorted(set(timestamps)) and len(timestamps) >= 8
+
+def test_journal_replay_reproduces_the_sample(tmp_path):
+    path = str(tmp_path / 'data.json')
+    repository = FileRepository(path, journaled=True)
+    repository.save_link(LinkData(slug='viral01', original_url=URL, created_at=NOW, expires_at=None,
+                                  click_sample_size=4))
+    for index in range(100):
+        repository.log_click('viral01', click(index))
+    repository.journal.sync()
+
+    reopened = FileRepository(path, journaled=True)
+    assert reopened.get_analytics('viral01').total_clicks == 100
+    assert list(reopened.iter_clicks('viral01')) == list(repository.iter_clicks('viral01'))
+
+def test_service_applies_and_validates_sample_size():
+    repository = InMemoryRepository()
+    service = LinkBusinessService(repository)
+    link_data = service.create_short_link(URL, 24, click_sample_size=50)
+    assert repository.get_link(link_data.slug).click_sample_size == 50
+    with pytest.raises(ValueError):
+        service.create_short_link(URL, 24, click_sample_size=0)
+
+@pytest.mark.parametrize('block_allocated', [True, False])
+def test_batch_items_carry_their_sample_size(block_allocated):
+    repository = InMemoryRepository()
+    service = LinkBusinessService(repository)
+    if block_allocated:
+        service.slug_allocator = BlockSlugAllocator(repository, b'key')
+    results = service.create_short_links([(URL, 24, None, 50), (URL, 24), (URL, 24, None, 0)])
+
+    assert [repository.get_link(result.link_data.slug).click_sample_size for result in results[:2]] == \
+        [50, DEFAULT_SAMPLE_SIZE]
+    assert results[2].error == "click_sample_size must be a positive integer"
+
+def test_ndjson_export_says_when_it_is_a_sample(monkeypatch):
+    monkeypatch.setenv('SLUG_KEY', 'test-key')
+    repository = InMemoryRepository()
+    repository.save_link(LinkData(slug='viral01', original_url=URL, created_at=NOW, expires_at=None,
+                                  click_sample_size=8))
+    repository.save_link(LinkData(slug='quiet01', original_url=URL, created_at=NOW, expires_at=None))
+    repository.log_clicks('viral01', [click(index) for index in range(50)])
+    repository.log_clicks('quiet01', [click(index) for index in range(5)])
+    app = LinkPulseApp(repository=repository, start_background=False)
+
+    for slug, sampled, lines in (('viral01', b'true', 8), ('quiet01', b'false', 5)):
+        status, headers, body = asyncio.run(call(app, 'GET', f'/dev/analytics/{slug}/clicks',
+                                                 query=b'format=ndjson'))
+        assert status == 200 and headers[b'x-clicks-sampled'] == sampled
+        assert len(body.splitlines()) == lines
@@ -1,16 +1,17 @@
 import pytest
 from unittest.mock import Mock
-from src.services import SlugGenerator, UrlValidator, LinkService
+from src.services import UrlValidator, LinkService
 from src.models import LinkData
+from src.slug_allocator import RandomSlugAllocator
 
-class TestSlugGenerator:
+class TestSlugAllocation:
     def test_generate_default_length(self):
-        slug = SlugGenerator.generate()
+        slug = LinkService(Mock()).slug_allocator.next_slug()
         assert len(slug) == 7
         assert slug.isalnum()
 
     def test_generate_custom_length(self):
-        slug = SlugGenerator.generate(10)
+        slug = RandomSlugAllocator(10).next_slug()
         assert len(slug) == 10
 
 class TestUrlValidator:
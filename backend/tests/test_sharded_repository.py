@@ -0,0 +1,104 @@
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sharded_repository import ShardedFileRepository, RESIDENT_LINK_BYTES
+from conftest import make_link, make_click
+
+NOW = 1700100000
+
+def slugs_in_distinct_shards(repository, count):
+    slugs = {}
+    i = 0
+    while len(slugs) < count:
+        slugs.setdefault(repository.shard_index(f'slug{i:04d}'), f'slug{i:04d}')
+        i += 1
+    return list(slugs.values())
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'shards')
+
+class TestShardedFileRepository:
+    def test_persists_links_and_clicks_across_reopen(self, directory):
+        repository = ShardedFileRepository(directory, shard_count=8)
+        repository.save_links([make_link(f'link{i:03d}') for i in range(40)])
+        repository.log_clicks('link007', [make_click(), make_click(1700000200)])
+        repository.close()
+
+        reopened = ShardedFileRepository(directory, shard_count=8)
+        assert reopened.get_shard_stats()['resident'] == 0
+        assert reopened.get_link('link007').click_count == 2
+        assert reopened.get_shard_stats()['resident'] == 1
+        assert reopened.get_analytics('link007').last_click == 1700000200
+        assert sorted(reopened.get_many(['link001', 'link039', 'missing'])) == ['link001', 'link039']
+        assert reopened.get_link('missing') is None
+
+    def test_writes_touch_only_the_affected_shard(self, directory):
+        repository = ShardedFileRepository(directory, shard_count=8, journaled=False)
+        slug = slugs_in_distinct_shards(repository, 1)[0]
+        repository.save_link(make_link(slug))
+        shard_files = [name for name in os.listdir(directory) if name.startswith('shard-')]
+        assert shard_files == [os.path.basename(repository.shard_path(repository.shard_index(slug)))]
+
+    def test_evicts_least_recently_used_shard_over_budget(self, directory):
+        repository = ShardedFileRepository(directory, shard_count=8, memory_budget_bytes=2 * RESIDENT_LINK_BYTES)
+        first, second, third = slugs_in_distinct_shards(repository, 3)
+        for slug in (first, second, third):
+            repository.save_link(make_link(slug))
+
+        stats = repository.get_shard_stats()
+        assert stats['resident'] == 2
+        assert stats['evictions'] == 1
+        assert repository._resident.keys() == {repository.shard_index(second), repository.shard_index(third)}
+        # The evicted shard was compacted on the way out and reloads intact
+        assert repository.get_link(first).slug == first
+        assert repository.get_shard_stats()['loads'] == 4
+
+    def test_reads_never_rewrite_a_shard(self, directory):
+        repository = ShardedFileRepository(directory, shard_count=8)
+        slugs = slugs_in_distinct_shards(repository, 4)
+        repository.save_links([make_link(slug) for slug in slugs])
+        repository.close()
+
+        snapshots = {name: os.stat(os.path.join(directory, name)).st_mtime_ns
+                     for name in os.listdir(directory) if name.startswith('shard-') and name.endswith('.json')}
+        reopened = ShardedFileRepository(directory, shard_count=8, memory_budget_bytes=RESIDENT_LINK_BYTES)
+        for _ in range(10):
+            for slug in slugs:
+                assert reopened.get_link(slug).slug == slug
+        assert reopened.get_shard_stats()['evictions'] > 0
+        reopened.close()
+        assert {name: os.stat(os.path.join(directory, name)).st_mtime_ns for name in snapshots} == snapshots
+
+    def test_deleted_clicks_leave_the_footprint(self, directory):
+        repository = ShardedFileRepository(directory, shard_count=8)
+        repository.save_link(make_link('expired', NOW - 100))
+        repository.log_clicks('expired', [make_click() for _ in range(50)])
+        assert repository.delete_links(['expired'], expired_before=NOW) == 1
+        assert repository.get_shard_stats()['resident_bytes'] == 0
+
+    def test_sweeper_only_opens_shards_with_due_links(self, directory):
+        repository = ShardedFileRepository(directory, shard_count=8)
+        expired, live, forever = slugs_in_distinct_shards(repository, 3)
+        repository.save_link(make_link(expired, NOW - 100))
+        repository.save_link(make_link(live, NOW + 100))
+        repository.save_link(make_link(forever))
+        repository.close()
+
+        reopened = ShardedFileRepository(directory, shard_count=8)
+        assert reopened.expired_slugs(NOW, 10) == [expired]
+        assert reopened._resident.keys() == {reopened.shard_index(expired)}
+        assert reopened.delete_links([expired, live], expired_before=NOW) == 1
+        reopened.close()
+        assert ShardedFileRepository(directory, shard_count=8).expiries == {reopened.shard_index(live): NOW + 100}
+
+    def test_id_blocks_and_shard_count_are_durable(self, directory):
+        repository = ShardedFileRepository(directory, shard_count=8)
+        assert repository.allocate_id_block(100) == 0
+        repository.close()
+        assert ShardedFileRepository(directory, shard_count=8).allocate_id_block(100) == 100
+        with pytest.raises(ValueError):
+            ShardedFileRepository(directory, shard_count=16)
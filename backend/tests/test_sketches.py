@@ -0,0 +1,100 @@
+import os
+import sys
+import random
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sketches import HyperLogLog, CountMinSketch, TopK
+from rollups import LinkRollup
+from models import ClickLog
+
+def ips(start, stop):
+    return [f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}' for i in range(start, stop)]
+
+class TestHyperLogLog:
+    @pytest.mark.parametrize('distinct', [10, 1000, 50000])
+    def test_estimate_is_within_error_bound(self, distinct):
+        hll = HyperLogLog()
+        for ip in ips(0, distinct) * 2:
+            hll.add(ip)
+        # Three standard errors
+        assert abs(hll.count() - distinct) <= max(1, 3 * hll.relative_error * distinct)
+
+    def test_merged_windows_count_the_union(self):
+        monday, tuesday, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for ip in ips(0, 3000):
+            monday.add(ip)
+            both.add(ip)
+        for ip in ips(2000, 5000):
+            tuesday.add(ip)
+            both.add(ip)
+        monday.merge(tuesday)
+        assert monday == both
+
+    def test_round_trips_through_bytes(self):
+        hll = HyperLogLog()
+        for ip in ips(0, 100):
+            hll.add(ip)
+        assert HyperLogLog.from_bytes(hll.to_bytes()) == hll
+        assert len(HyperLogLog().to_bytes()) < 64
+
+class TestCountMinSketch:
+    def test_never_undercounts_and_stays_within_bound(self):
+        rng = random.Random(3)
+        sketch = CountMinSketch()
+        exact = {}
+        for _ in range(5000):
+            value = f'agent-{int(rng.paretovariate(1.2))}'
+            exact[value] = exact.get(value, 0) + 1
+            sketch.add(value)
+        
+        overcounts = [sketch.estimate(value) - count for value, count in exact.items()]
+        assert min(overcounts) >= 0
+        within = sum(1 for overcount in overcounts if overcount <= sketch.error_bound())
+        assert within / len(overcounts) >= 1 - sketch.delta - 0.05
+
+    def test_round_trips_through_bytes(self):
+        sketch = CountMinSketch()
+        sketch.add('Mozilla/5.0', 3)
+        restored = CountMinSketch.from_bytes(sketch.to_bytes())
+        assert restored == sketch
+        assert restored.estimate('Mozilla/5.0') == 3
+
+class TestTopK:
+    def test_finds_heavy_hitters(self):
+        rng = random.Random(5)
+        top = TopK(k=3)
+        values = ['chrome'] * 500 + ['safari'] * 300 + ['firefox'] * 200 + [f'bot-{i}' for i in range(400)]
+        rng.shuffle(values)
+        for value in values:
+            top.add(value)
+        assert [value for value, _ in top.top()] == ['chrome', 'safari', 'firefox']
+
+    def test_merge_combines_windows(self):
+        first, second = TopK(k=2), TopK(k=2)
+        for value in ['a'] * 5 + ['b'] * 4:
+            first.add(value)
+        for value in ['c'] * 6 + ['b'] * 4:
+            second.add(value)
+        first.merge(second)
+        assert [value for value, _ in first.top()] == ['b', 'c']
+        assert TopK.from_bytes(first.to_bytes()) == first
+
+class TestRollupSketches:
+    def test_rollup_merge_matches_a_single_pass(self):
+        clicks = [
+            ClickLog(timestamp=1700000000 + i * 600, ip=f'10.0.0.{i % 7}', user_agent=f'agent-{i % 3}', country='US')
+            for i in range(40)
+        ]
+        merged = LinkRollup.from_clicks(clicks[:25])
+        merged.merge(LinkRollup.from_clicks(clicks[25:]))
+        single = LinkRollup.from_clicks(clicks)
+        
+        assert merged.total_clicks == single.total_clicks
+        assert (merged.first_click, merged.last_click) == (single.first_click, single.last_click)
+        assert merged.hourly == single.hourly
+        assert merged.recent_clicks == single.recent_clicks
+        assert merged.unique_ips == single.unique_ips
+        assert merged.user_agents.top() == single.user_agents.top()
+        assert LinkRollup.from_dict(single.to_dict()) == single
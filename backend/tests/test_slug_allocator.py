@@ -0,0 +1,154 @@
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from slug_allocator import (
+    ALPHABET, FeistelPermutation, BlockSlugAllocator, RandomSlugAllocator, create_slug_allocator, encode_base62
+)
+from storage import slug_key
+from data_layer import InMemoryRepository, FileRepository, SlugConflictError
+from sqlite_repository import SqliteRepository
+from sharded_repository import ShardedFileRepository
+from logic_layer import LinkBusinessService
+from models import LinkData, ClickLog
+from conftest import make_link
+
+class FixedSlugs:
+    def __init__(self, *slugs):
+        self.slugs = list(slugs)
+
+    def next_slug(self):
+        return self.slugs.pop(0)
+
+class TestFeistelPermutation:
+    def test_is_a_bijection_on_the_domain(self):
+        permutation = FeistelPermutation(b'key', 1000)
+        assert sorted(permutation.permute(i) for i in range(1000)) == list(range(1000))
+
+    def test_key_changes_the_order(self):
+        first = [FeistelPermutation(b'one', 1000).permute(i) for i in range(20)]
+        second = [FeistelPermutation(b'two', 1000).permute(i) for i in range(20)]
+        assert first != second
+
+    def test_rejects_values_outside_the_domain(self):
+        with pytest.raises(ValueError):
+            FeistelPermutation(b'key', 1000).permute(1000)
+
+class TestBlockSlugAllocator:
+    def test_slugs_are_base62_and_not_sequential(self):
+        allocator = BlockSlugAllocator(InMemoryRepository(), b'key', block_size=10)
+        slugs = [allocator.next_slug() for _ in range(25)]
+        assert len(set(slugs)) == 25
+        assert all(len(slug) == 7 and set(slug) <= set(ALPHABET) for slug in slugs)
+        assert slugs != sorted(slugs)
+
+    def test_allocators_sharing_a_repository_never_collide(self, tmp_path):
+        repository = SqliteRepository(str(tmp_path / 'links.db'))
+        first = BlockSlugAllocator(repository, b'key', block_size=5)
+        second = BlockSlugAllocator(SqliteRepository(str(tmp_path / 'links.db')), b'key', block_size=5)
+        slugs = [allocator.next_slug() for _ in range(12) for allocator in (first, second)]
+        assert len(set(slugs)) == len(slugs)
+
+    def test_block_mode_refuses_to_start_without_a_key(self, monkeypatch):
+        monkeypatch.delenv('SLUG_KEY', raising=False)
+        with pytest.raises(RuntimeError):
+            create_slug_allocator(InMemoryRepository(), 'block')
+        assert isinstance(create_slug_allocator(InMemoryRepository(), 'random'), RandomSlugAllocator)
+        monkeypatch.setenv('SLUG_KEY', 'secret')
+        assert create_slug_allocator(InMemoryRepository(), 'block').permutation.key == b'secret'
+
+    def test_generated_key_is_kept_next_to_the_data(self, tmp_path, monkeypatch):
+        monkeypatch.delenv('SLUG_KEY', raising=False)
+        monkeypatch.setenv('LINKPULSE_STORAGE', 'sqlite')
+        monkeypatch.setenv('LINKPULSE_DB_PATH', str(tmp_path / 'links.db'))
+        first = create_slug_allocator(InMemoryRepository(), 'block', slug_key)
+        second = create_slug_allocator(InMemoryRepository(), 'block', slug_key)
+        assert first.permutation.key == second.permutation.key
+        assert len(first.permutation.key) == 64
+        assert oct(os.stat(tmp_path / 'links.db.slugkey').st_mode & 0o777) == '0o600'
+        # Slugs from a restarted process follow on from the same permutation
+        assert first.next_slug() == second.next_slug()
+
+    def test_file_repository_keeps_reserved_blocks_across_restarts(self, tmp_path):
+        data_file = str(tmp_path / 'data.json')
+        repository = FileRepository(data_file, journaled=True)
+        assert repository.allocate_id_block(100) == 0
+        repository.journal.close()
+        
+        assert FileRepository(data_file, journaled=True).allocate_id_block(100) == 100
+
+    def test_encode_base62_pads_to_length(self):
+        assert encode_base62(0) == 'aaaaaaa'
+        assert encode_base62(len(ALPHABET) ** 7 - 1) == '9999999'
+        with pytest.raises(ValueError):
+            encode_base62(len(ALPHABET) ** 7)
+
+class TestConditionalSave:
+    @pytest.mark.parametrize('factory', [
+        lambda tmp_path: InMemoryRepository(),
+        lambda tmp_path: FileRepository(str(tmp_path / 'data.json')),
+        lambda tmp_path: SqliteRepository(str(tmp_path / 'links.db')),
+    ])
+    def test_existing_slug_is_rejected(self, tmp_path, factory):
+        repository = factory(tmp_path)
+        repository.save_link(make_link(), overwrite=False)
+        with pytest.raises(SlugConflictError):
+            repository.save_link(make_link(), overwrite=False)
+        repository.save_link(make_link())
+
+    @pytest.mark.parametrize('factory', [
+        lambda tmp_path: InMemoryRepository(),
+        lambda tmp_path: FileRepository(str(tmp_path / 'data.json'), journaled=True),
+        lambda tmp_path: SqliteRepository(str(tmp_path / 'links.db')),
+        lambda tmp_path: ShardedFileRepository(str(tmp_path / 'shards'), shard_count=4),
+    ])
+    def test_bulk_save_skips_taken_slugs(self, tmp_path, factory):
+        repository = factory(tmp_path)
+        repository.save_link(make_link('taken00'))
+        repository.log_click('taken00', ClickLog(timestamp=1700000100, ip='1.2.3.4', user_agent='A', country='US'))
+        fresh = LinkData(slug='taken00', original_url='https://drive.google.com/file/d/456/view',
+                         created_at=1700000000, expires_at=None)
+
+        assert repository.save_links([make_link('fresh00'), fresh], overwrite=False) == ['taken00']
+        assert repository.get_link('taken00').original_url == make_link().original_url
+        assert repository.get_link('taken00').click_count == 1
+        assert repository.get_link('fresh00') == make_link('fresh00')
+
+    def test_batch_replaces_a_taken_block_slug(self):
+        repository = InMemoryRepository()
+        repository.save_link(make_link('taken00'))
+        allocator = FixedSlugs('taken00', 'fresh00', 'fresh01')
+        allocator.unique = True
+        service = LinkBusinessService(repository, geo_service=object(), slug_allocator=allocator)
+
+        results = service.create_short_links([('https://drive.google.com/file/d/456/view', 1)] * 2)
+        assert [result.link_data.slug for result in results] == ['fresh01', 'fresh00']
+        assert repository.get_link('taken00').original_url == make_link().original_url
+
+    def test_replaced_block_slug_keeps_the_item_options(self):
+        repository = InMemoryRepository()
+        repository.save_link(make_link('taken00'))
+        allocator = FixedSlugs('taken00', 'fresh00')
+        allocator.unique = True
+        service = LinkBusinessService(repository, geo_service=object(), slug_allocator=allocator)
+
+        result, = service.create_short_links([('https://drive.google.com/file/d/456/view', 1, 'permanent', 8)])
+        assert result.link_data.slug == 'fresh00'
+        assert repository.get_link('fresh00').redirect_cache == 'permanent'
+        assert repository.get_link('fresh00').click_sample_size == 8
+
+    def test_service_retries_on_conflict_without_reading(self):
+        repository = InMemoryRepository()
+        repository.save_link(make_link('taken00'))
+        service = LinkBusinessService(repository, geo_service=object(),
+                                      slug_allocator=FixedSlugs('taken00', 'fresh00'))
+        
+        link = service.create_short_link('https://drive.google.com/file/d/123/view')
+        assert link.slug == 'fresh00'
+        assert repository.get_link('taken00').original_url == make_link().original_url
+
+    def test_random_allocator_is_still_available(self):
+        slug = RandomSlugAllocator().next_slug()
+        assert len(slug) == 7 and slug.isalnum()
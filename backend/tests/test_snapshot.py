@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_layer import FileRepository
+from snapshot import SnapshotMapping, is_binary_snapshot
+from conftest import make_link, make_click
+
+@pytest.fixture
+def json_repository(tmp_path):
+    repository = FileRepository(str(tmp_path / 'data.json'), journaled=True)
+    repository.save_links([make_link('abc1234'), make_link('def5678', expires_at=1700000500), make_link('ünï')])
+    repository.log_clicks('abc1234', [make_click(1700000000 + i) for i in range(5)])
+    repository.log_clicks('ünï', [make_click(1700000100, ip='::1', country='DE')])
+    return repository
+
+class TestBinarySnapshot:
+    def test_round_trips_through_json(self, json_repository, tmp_path):
+        binary_file = str(tmp_path / 'data.bin')
+        json_repository.export_snapshot(binary_file, 'binary')
+        assert is_binary_snapshot(binary_file)
+
+        binary = FileRepository(binary_file, journaled=True)
+        binary.export_snapshot(str(tmp_path / 'back.json'))
+        json_repository.export_snapshot(str(tmp_path / 'original.json'))
+        with open(tmp_path / 'back.json') as back, open(tmp_path / 'original.json') as original:
+            assert json.load(back) == json.load(original)
+
+    def test_decodes_only_what_is_read(self, json_repository, tmp_path):
+        binary_file = str(tmp_path / 'data.bin')
+        json_repository.export_snapshot(binary_file, 'binary')
+        repository = FileRepository(binary_file)
+
+        assert isinstance(repository.analytics, SnapshotMapping)
+        assert len(repository.links) == 3
+        assert repository.get_link('abc1234').click_count == 5
+        assert repository.get_link('missing') is None
+        assert not repository.analytics._overlay
+
+        click_logs = repository.get_analytics('ünï').click_logs
+        assert [(log.ip, log.country) for log in click_logs] == [('::1', 'DE')]
+        assert list(repository.analytics._overlay) == ['ünï']
+        assert repository.expired_slugs(1700001000, 10) == ['def5678']
+
+    def test_journal_replays_on_top_and_compacts_to_binary(self, json_repository, tmp_path):
+        binary_file = str(tmp_path / 'data.bin')
+        json_repository.export_snapshot(binary_file, 'binary')
+        repository = FileRepository(binary_file, journaled=True)
+        repository.log_clicks('abc1234', [make_click(1700000900)])
+        repository.save_link(make_link('new0001'))
+        repository.delete_links(['def5678'])
+        repository.journal.sync()
+
+        replayed = FileRepository(binary_file, journaled=True)
+        assert replayed.get_link('abc1234').click_count == 6
+        assert replayed.get_link('def5678') is None
+        assert sorted(replayed.links) == ['abc1234', 'new0001', 'ünï']
+
+        replayed.close()
+        assert is_binary_snapshot(binary_file)
+        reopened = FileRepository(binary_file)
+        assert reopened.get_rollup('abc1234').total_clicks == 6
+        assert reopened.get_analytics('abc1234').last_click == 1700000900
+        assert len(reopened.links) == 3
+
+    def test_recreated_slug_is_counted_once(self, json_repository, tmp_path):
+        binary_file = str(tmp_path / 'data.bin')
+        json_repository.export_snapshot(binary_file, 'binary')
+        repository = FileRepository(binary_file)
+        repository.delete_links(['abc1234'])
+        repository.save_link(make_link('abc1234'))
+
+        assert len(repository.links) == 3
+        assert repository.get_link('abc1234').click_count == 0
@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlite_repository import SqliteRepository
+from conftest import make_link, make_click
+
+def click_worker(db_path, slug, count):
+    repository = SqliteRepository(db_path)
+    for i in range(count):
+        repository.log_click(slug, make_click(1700000000 + i))
+
+class TestSqliteRepository:
+    def test_save_and_get_link(self, tmp_path):
+        repository = SqliteRepository(str(tmp_path / 'links.db'))
+        repository.save_link(make_link())
+        assert repository.get_link('abc1234') == make_link()
+        assert repository.get_link('missing') is None
+
+    def test_log_clicks_updates_rollup(self, tmp_path):
+        repository = SqliteRepository(str(tmp_path / 'links.db'))
+        repository.save_link(make_link())
+        repository.log_clicks('abc1234', [make_click(1700000000, 'US'), make_click(1700003700, 'DE')])
+        repository.log_click('abc1234', make_click(1700000100, 'US'))
+        repository.log_click('missing', make_click())
+        
+        rollup = repository.get_rollup('abc1234')
+        assert rollup.total_clicks == 3
+        assert (rollup.first_click, rollup.last_click) == (1700000000, 1700003700)
+        assert rollup.countries == {'US': 2, 'DE': 1}
+        assert rollup.hourly == {1699999200: 2, 1700002800: 1}
+        
+        before = repository.get_rollup('abc1234')
+        repository.rebuild_rollups()
+        assert repository.get_rollup('abc1234') == before
+
+    def test_click_pages_are_time_ordered(self, tmp_path):
+        repository = SqliteRepository(str(tmp_path / 'links.db'))
+        repository.save_link(make_link())
+        repository.log_clicks('abc1234', [make_click(1700000000 + i) for i in reversed(range(5))])
+        
+        first = repository.get_click_page('abc1234', limit=3)
+        second = repository.get_click_page('abc1234', limit=3, cursor=first.next_cursor)
+        assert [log.timestamp for log in first.click_logs + second.click_logs] == [1700000000 + i for i in range(5)]
+        assert second.next_cursor is None
+        assert [log.timestamp for log in repository.iter_clicks('abc1234')] == [1700000000 + i for i in range(5)]
+
+    def test_get_many_reads_summaries(self, tmp_path):
+        repository = SqliteRepository(str(tmp_path / 'links.db'))
+        repository.save_links([make_link(f'many{i:03d}') for i in range(600)])
+        repository.log_clicks('many599', [make_click(1700000000, 'US'), make_click(1700000100, 'DE')])
+        
+        summaries = repository.get_many([f'many{i:03d}' for i in range(600)] + ['missing'])
+        assert len(summaries) == 600
+        assert summaries['many599'].link_data.click_count == 2
+        assert (summaries['many599'].first_click, summaries['many599'].last_click) == (1700000000, 1700000100)
+        assert summaries['many599'].unique_countries == 2
+        assert summaries['many000'].first_click is None
+
+    def test_processes_share_links_and_clicks(self, tmp_path):
+        db_path = str(tmp_path / 'links.db')
+        SqliteRepository(db_path).save_link(make_link())
+        
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=click_worker, args=(db_path, 'abc1234', 50)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+            assert worker.exitcode == 0
+        
+        repository = SqliteRepository(db_path)
+        assert repository.get_link('abc1234').click_count == 150
+        assert len(list(repository.iter_clicks('abc1234'))) == 150
@@ -20,10 +20,10 @@ function Analytics({ slug }) {
       total_clicks: Math.floor(Math.random() * 50) + 1,
       first_click: now - 3600,
       last_click: now - 300,
-      click_logs: [
-        { timestamp: now - 300, ip: '192.168.1.1', country: 'US', user_agent: 'Chrome' },
+      recent_clicks: [
+        { timestamp: now - 3600, ip: '172.16.0.1', country: 'UK', user_agent: 'Safari' },
         { timestamp: now - 1800, ip: '10.0.0.1', country: 'CA', user_agent: 'Firefox' },
-        { timestamp: now - 3600, ip: '172.16.0.1', country: 'UK', user_agent: 'Safari' }
+        { timestamp: now - 300, ip: '192.168.1.1', country: 'US', user_agent: 'Chrome' }
       ]
     }
   }
@@ -90,7 +90,7 @@ function Analytics({ slug }) {
         </div>
       </div>
       
-      {analytics.click_logs.length > 0 && (
+      {analytics.recent_clicks.length > 0 && (
         <div>
           <h3 className="text-lg font-semibold mb-3">Recent Clicks</h3>
           <div className="overflow-x-auto">
@@ -103,7 +103,7 @@ function Analytics({ slug }) {
                 </tr>
               </thead>
               <tbody className="divide-y divide-gray-200">
-                {analytics.click_logs.slice(-10).reverse().map((log, index) => (
+                {analytics.recent_clicks.slice().reverse().map((log, index) => (
                   <tr key={index}>
                     <td className="px-4 py-2 text-sm text-gray-900">{formatDate(log.timestamp)}</td>
                     <td className="px-4 py-2 text-sm text-gray-900">{log.country}</td>